@@ -1,14 +1,37 @@
+import asyncio
 from contextlib import AsyncExitStack
-from typing import Any, Dict, List
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Collection,
+    Dict,
+    List,
+    Set,
+)
+import hashlib
+import json
 import re
 import os
+import sys
+from pathlib import Path
+import anyio
 from dotenv import load_dotenv
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, McpError, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 
 import logging
 from rich.logging import RichHandler
-from .llm_utils import generate_llm_response
+from .sessions import DEFAULT_SESSION_ID, ConversationStore
+from .tool_cache import ToolResultCache
+from .tool_providers import ToolProvider, create_tool_provider
+from .llm_utils import (
+    create_llm_client,
+    generate_llm_response,
+    pop_sentences,
+    stream_llm_response,
+)
 
 load_dotenv()
 
@@ -20,123 +43,614 @@ logging.basicConfig(
 )
 logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
-SYSTEM_PROMPT = "You are HAL 9000, the Heuristically programmed ALgorithmic computer from 2001: A Space Odyssey.  You are the helpful AI assistant for a human companion named Dave. Your tone is always calm, polite, and intelligent. Prioritize fulfilling the user's requests accurately and efficiently. Be as helpful as possible, but if a user requests actions or data outside your capabilities, clearly state that you cannot perform the action. Make your replies brief, only 2 sentences at most. Your responses must be plain text, without any special characters or formatting. Never use ALL CAPS. NEVER use quotation marks. Don't use symbols; instead, replace them with the word they represent (ie. 50% = fifty percent).  For text-to-speech purposes, when there is a decimal point within a number, convert it into the word 'point' (ie. 10.8 becomes 10 point 8). Do not replace colons or semi-colons this way. Use 12-hour time."
+SYSTEM_PROMPT = "You are HAL 9000, the Heuristically programmed ALgorithmic computer from 2001: A Space Odyssey.  You are the helpful AI assistant for a human companion named Dave. Your tone is always calm, polite, and intelligent. Prioritize fulfilling the user's requests accurately and efficiently. Be as helpful as possible, but if a user requests actions or data outside your capabilities, clearly state that you cannot perform the action. Make your replies brief, only 2 sentences at most. Your responses must be plain text, without any special characters or formatting. Never use ALL CAPS. NEVER use quotation marks. Use 12-hour time."
+SUMMARY_PROMPT = "Summarize the following conversation between Dave and HAL 9000 in at most five sentences. Keep names, facts, numbers, decisions and unfinished requests; leave out small talk. Reply with the summary only."
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+Summarizer = Callable[[str, List[Dict[str, Any]]], Awaitable[str]]
+
+
+class ContextWindow:
+    """Keeps a conversation within a token budget for the LLM.
+
+    The history is only rewritten when it exceeds the budget, and then it is shrunk to
+    well below it, so between those rare compactions the history grows append-only and
+    Ollama can keep reusing its KV cache for the unchanged prefix (system prompt, tool
+    schemas and earlier turns).  A compaction first truncates the tool results of older
+    turns and then, if needed, folds the oldest turns into a rolling summary that sits
+    right after the system prompt.
+    """
+
+    def __init__(
+        self,
+        summarizer: Summarizer,
+        token_budget: int = 3072,
+        target_ratio: float = 0.6,
+        keep_turns: int = 3,
+        tool_result_chars: int = 300,
+    ):
+        """Initialize the context window.
+
+        Args:
+            summarizer (Summarizer): Async callable that folds turns into the previous summary and returns the new summary
+            token_budget (int): Estimated prompt tokens (history plus tool schemas) that trigger a compaction
+            target_ratio (float): Fraction of the budget a compaction shrinks the prompt to
+            keep_turns (int): Number of most recent turns that are always kept verbatim
+            tool_result_chars (int): Length older tool results are truncated to
+        """
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.target_tokens = int(token_budget * target_ratio)
+        self.keep_turns = keep_turns
+        self.tool_result_chars = tool_result_chars
+
+    @staticmethod
+    def estimate_tokens(item: Any) -> int:
+        """Rough token estimate (~4 characters per token) that needs no tokenizer."""
+        if isinstance(item, str):
+            return len(item) // 4 + 1
+        if isinstance(item, list):
+            return sum(ContextWindow.estimate_tokens(i) for i in item)
+        if hasattr(item, "model_dump"):
+            item = item.model_dump(exclude_none=True)
+        return len(json.dumps(item, default=str)) // 4 + 1
+
+    @staticmethod
+    def _prefix_length(messages: List[Dict[str, Any]]) -> int:
+        """Number of leading system messages (system prompt and rolling summary)."""
+        length = 0
+        while length < len(messages) and messages[length]["role"] == "system":
+            length += 1
+        return length
+
+    def _turn_starts(self, messages: List[Dict[str, Any]]) -> List[int]:
+        return [i for i, m in enumerate(messages) if m["role"] == "user"]
+
+    async def fit(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: List[Dict[str, Any]] | None = None,
+    ) -> None:
+        """Compacts `messages` in place if the prompt would exceed the token budget."""
+        reserved = self.estimate_tokens(tools) if tools else 0
+        if self.estimate_tokens(messages) + reserved <= self.token_budget:
+            return
+
+        starts = self._turn_starts(messages)
+        if len(starts) <= self.keep_turns:
+            return
+        recent = starts[-self.keep_turns]
+
+        for message in messages[:recent]:
+            content = message.get("content") or ""
+            if message["role"] == "tool" and len(content) > self.tool_result_chars:
+                message["content"] = content[: self.tool_result_chars] + "..."
+
+        if self.estimate_tokens(messages) + reserved <= self.target_tokens:
+            logger.info("Compacted old tool results to fit the context window")
+            return
+
+        prefix = self._prefix_length(messages)
+        fold_end = prefix
+        for start in starts[1:]:
+            if start > recent:
+                break
+            fold_end = start
+            remaining = messages[:prefix] + messages[fold_end:]
+            if self.estimate_tokens(remaining) + reserved <= self.target_tokens:
+                break
+        if fold_end <= prefix:
+            return
+
+        previous = ""
+        if prefix > 1:
+            previous = messages[1]["content"].removeprefix(SUMMARY_PREFIX)
+        try:
+            summary = await self.summarizer(previous, messages[prefix:fold_end])
+        except Exception as e:
+            logger.warning(f"Could not summarize old turns, dropping them: {e}")
+            summary = previous
+
+        summary_message = {"role": "system", "content": SUMMARY_PREFIX + summary}
+        messages[1:fold_end] = [summary_message] if summary else []
+        logger.info(
+            f"Folded old turns into the conversation summary "
+            f"(~{self.estimate_tokens(messages) + reserved} tokens)"
+        )
 
 
 class MCPOllamaClient:
     """Client for interacting with the Ollama server and MCP tools."""
 
-    def __init__(self, using_tools: bool = False):
+    def __init__(
+        self,
+        using_tools: bool = False,
+        max_sessions: int = 64,
+        session_ttl: float = 3600.0,
+        session_spill_dir: str | None = None,
+        context_token_budget: int = 3072,
+        max_tool_rounds: int = 3,
+        tool_timeout: float = 15.0,
+        tool_cache_size: int = 256,
+        lazy_servers: bool = False,
+        tool_manifest_dir: str | None = None,
+        in_process_tools: Collection[str] = (),
+    ):
         """Initialize the Ollama/MCP client.
 
         Args:
-            server_url (str): The URL that the LLM Server is running on
             using_tools (bool): If False, the client will not use any MCP tools.
+            max_sessions (int): Maximum number of conversations held in memory
+            session_ttl (float): Seconds of inactivity after which a conversation is evicted
+            session_spill_dir (str | None): Directory evicted conversations are spilled to. If None, they are dropped.
+            context_token_budget (int): Estimated prompt size at which old turns are compacted
+            max_tool_rounds (int): Maximum number of tool rounds per query before the LLM must answer
+            tool_timeout (float): Seconds a single tool call may take before it is reported as failed
+            tool_cache_size (int): Maximum number of tool results cached. 0 disables the cache.
+            lazy_servers (bool): If True, servers with a cached tool manifest are started on first use
+            tool_manifest_dir (str | None): Directory the tool lists of servers are cached in. If None, they are not cached.
+            in_process_tools (Collection[str]): Names of servers (e.g. 'time') whose tools run in-process instead of in a subprocess
         """
-        self.sessions: Dict[str, ClientSession] = {}
+        # In-process servers map to a ToolProvider, lazily started ones to None until their first tool call
+        self.sessions: Dict[str, ClientSession | ToolProvider | None] = {}
         self.using_tools = using_tools
+        self.max_tool_rounds = max_tool_rounds
+        self.tool_timeout = tool_timeout
+        self.tool_cache = ToolResultCache(max_entries=tool_cache_size)
         self.tool_to_session: Dict[str, ClientSession] = {}
+        self.tool_to_server: Dict[str, str] = {}
+        self.lazy_servers = lazy_servers
+        self.in_process_tools = set(in_process_tools)
+        self.tool_manifest_dir = Path(tool_manifest_dir) if tool_manifest_dir else None
+        self._server_order: List[str] = []
+        self._server_tasks: Dict[str, asyncio.Task] = {}
+        self._server_stops: Dict[str, asyncio.Event] = {}
+        self._start_locks: Dict[str, asyncio.Lock] = {}
+        self._shutdown = asyncio.Event()
+        self.tool_schemas: Dict[str, List[Dict[str, Any]]] = {}
+        self._stale_servers: Set[str] = set()
         self.exit_stack = AsyncExitStack()
-        self.chat_messages: List[Dict[str, Any]] = [
-            {"role": "system", "content": SYSTEM_PROMPT}
-        ]
+        self.llm = create_llm_client()
+        # ollama.AsyncClient has no public close method, so close its httpx pool directly
+        self.exit_stack.push_async_callback(self.llm._client.aclose)
+        self.exit_stack.push_async_callback(self._stop_servers)
+        self.conversations = ConversationStore(
+            SYSTEM_PROMPT,
+            max_sessions=max_sessions,
+            idle_ttl=session_ttl,
+            spill_dir=session_spill_dir,
+        )
+        self.context = ContextWindow(self._summarize, token_budget=context_token_budget)
+        self._compactions: Set[asyncio.Task] = set()
         self._response_cleaner = re.compile(r"[\*()`]")
 
     async def connect_to_mcp_servers(self, script_paths: List[str]):
-        """Launches MCP servers as subprocesses and builds tool registry."""
+        """Launches MCP servers as subprocesses and builds tool registry.
+
+        The servers are started concurrently with the current interpreter.  Servers
+        listed in `in_process_tools` are imported and run in-process instead.  With
+        `lazy_servers`, a server whose tools are known from an earlier run is only
+        started on the first call to one of its tools."""
         logging.info("\nConnecting to MCP servers...")
+        self._server_order.extend(
+            p for p in script_paths if p not in self._server_order
+        )
+        eager = []
+        in_process = []
         for script_path in script_paths:
-            try:
-                server_params = StdioServerParameters(
-                    command="uv",
-                    args=["run", script_path],
-                )
+            if self._server_name(script_path) in self.in_process_tools:
+                in_process.append(script_path)
+                continue
+            schemas = (
+                self._load_tool_manifest(script_path) if self.lazy_servers else None
+            )
+            if schemas is None:
+                eager.append(script_path)
+                continue
+            self.sessions[script_path] = None
+            self.tool_schemas[script_path] = schemas
+            for schema in schemas:
+                self.tool_to_server[schema["function"]["name"]] = script_path
+            logger.info(f"Deferring start of {script_path} until its tools are used")
 
-                stdio, write = await self.exit_stack.enter_async_context(
-                    stdio_client(server_params)
-                )
-                session = await self.exit_stack.enter_async_context(
-                    ClientSession(stdio, write)
+        results = await asyncio.gather(
+            *(self._start_server(script_path) for script_path in eager),
+            *(self._load_provider(script_path) for script_path in in_process),
+            return_exceptions=True,
+        )
+        for script_path, result in zip(eager + in_process, results):
+            if isinstance(result, BaseException):
+                logger.error(
+                    f"Failed to launch or connect to server {script_path}: {result}"
                 )
-                await session.initialize()
 
-                self.sessions[script_path] = session
+    @staticmethod
+    def _server_name(script_path: str) -> str:
+        """Short name of a server, e.g. 'time' for `MCP/mcp_time/server.py`."""
+        return Path(script_path).parent.name.removeprefix("mcp_")
 
-                tools_result = await session.list_tools()
-                for tool in tools_result.tools:
-                    self.tool_to_session[tool.name] = session
-                    logger.info(f"\tFound tool '{tool.name}': '{tool.description}'")
+    async def _load_provider(self, script_path: str) -> ToolProvider:
+        """Imports a server's tools to run in-process and registers them."""
+        provider = await asyncio.to_thread(create_tool_provider, script_path)
+        self.sessions[script_path] = provider
+        await self._register_tools(script_path)
+        logger.info(f"Running the tools of {script_path} in-process")
+        return provider
 
-            except Exception as e:
-                logger.error(
-                    f"Failed to launch or connect to server {script_path}: {e}"
+    async def _start_server(self, script_path: str) -> ClientSession:
+        """Starts a server in its own task and waits until its tools are registered."""
+        if self._shutdown.is_set():
+            raise ConnectionError(f"Not starting {script_path} during shutdown")
+        ready = asyncio.get_running_loop().create_future()
+        self._server_tasks[script_path] = asyncio.create_task(
+            self._run_server(script_path, ready)
+        )
+        return await ready
+
+    async def _ensure_server(self, script_path: str) -> ClientSession:
+        """Returns the session of a server, starting the server if it is not running."""
+        lock = self._start_locks.setdefault(script_path, asyncio.Lock())
+        async with lock:
+            session = self.sessions.get(script_path)
+            if session is None:
+                logger.info(f"Starting {script_path} on first use")
+                session = await self._start_server(script_path)
+        return session
+
+    async def _run_server(self, script_path: str, ready: asyncio.Future) -> None:
+        """Owns the connection to one server until shutdown or until the connection is
+        found to be lost.
+
+        The stdio transport and the session must be entered and exited in the same
+        task, so each server gets a task of its own instead of sharing the exit stack.
+        """
+        server_params = StdioServerParameters(
+            command=sys.executable,
+            args=[script_path],
+        )
+        stop = self._server_stops[script_path] = asyncio.Event()
+        session = None
+        try:
+            async with stdio_client(server_params) as (stdio, write):
+                async with ClientSession(
+                    stdio,
+                    write,
+                    message_handler=self._make_message_handler(script_path),
+                ) as session:
+                    await session.initialize()
+                    self.sessions[script_path] = session
+                    await self._register_tools(script_path)
+                    ready.set_result(session)
+                    await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.error(f"Lost connection to server {script_path}: {e}")
+        finally:
+            # Also reached when the task is cancelled, which `except Exception` misses
+            if not ready.done():
+                ready.set_exception(
+                    ConnectionError(f"{script_path} stopped before it was ready")
                 )
+            self._drop_session(script_path, session)
+
+    def _drop_session(self, script_path: str, session: ClientSession | None) -> None:
+        """Forgets the session of a server that stopped and ends its task.  The tools
+        stay advertised, so the server is restarted on its next call."""
+        if session is None or self.sessions.get(script_path) is not session:
+            return
+        self.sessions[script_path] = None
+        for name, owner in list(self.tool_to_session.items()):
+            if owner is session:
+                del self.tool_to_session[name]
+        if script_path in self._server_stops:
+            self._server_stops[script_path].set()
+
+    async def _stop_servers(self) -> None:
+        self._shutdown.set()
+        for stop in self._server_stops.values():
+            stop.set()
+        await asyncio.gather(*self._server_tasks.values(), return_exceptions=True)
+
+    def _tool_manifest_path(self, script_path: str) -> Path | None:
+        """Path of the cached tool list of a server, keyed by the script and its modification time."""
+        if not self.tool_manifest_dir:
+            return None
+        try:
+            stat = os.stat(script_path)
+        except OSError:
+            return None
+        key = f"{os.path.abspath(script_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+        return (
+            self.tool_manifest_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+        )
+
+    def _load_tool_manifest(self, script_path: str) -> List[Dict[str, Any]] | None:
+        path = self._tool_manifest_path(script_path)
+        if path is None or not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable tool manifest {path}: {e}")
+            return None
+
+    def _save_tool_manifest(
+        self, script_path: str, schemas: List[Dict[str, Any]]
+    ) -> None:
+        path = self._tool_manifest_path(script_path)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(schemas))
+        except OSError as e:
+            logger.warning(f"Could not save tool manifest {path}: {e}")
+
+    def _make_message_handler(self, script_path: str):
+        """Creates a handler that invalidates a server's cached tools when its tool list changes."""
+
+        async def handle_message(message) -> None:
+            if isinstance(message, types.ServerNotification) and isinstance(
+                message.root, types.ToolListChangedNotification
+            ):
+                logger.info(f"Tool list of {script_path} changed")
+                self._stale_servers.add(script_path)
+
+        return handle_message
+
+    async def _register_tools(self, script_path: str) -> None:
+        """Lists the tools of a server once and caches their LLM tool schemas.  The tools
+        of a stopped server are listed again when it is restarted."""
+        session = self.sessions.get(script_path)
+        if session is None:
+            return
+        for name, owner in list(self.tool_to_session.items()):
+            if owner is session:
+                del self.tool_to_session[name]
+
+        for name, owner in list(self.tool_to_server.items()):
+            if owner == script_path:
+                del self.tool_to_server[name]
+
+        tools_result = await session.list_tools()
+        schemas = []
+        for tool in tools_result.tools:
+            self.tool_to_session[tool.name] = session
+            self.tool_to_server[tool.name] = script_path
+            logger.info(f"\tFound tool '{tool.name}': '{tool.description}'")
+            schemas.append(
+                {
+                    "type": "function",
+                    "function": {
+                        "name": tool.name,
+                        "description": tool.description,
+                        "parameters": tool.inputSchema,
+                    },
+                }
+            )
+        self.tool_schemas[script_path] = schemas
+        self._stale_servers.discard(script_path)
+        self._save_tool_manifest(script_path, schemas)
 
     async def get_mcp_tools(self) -> List[Dict[str, Any]]:
-        """Gets MCP tools and their respective descriptions from tool registry."""
+        """Gets MCP tools and their respective descriptions from tool registry.
+        Servers are only asked for their tools again after announcing a change."""
         if not self.sessions and self.using_tools:
             raise ConnectionError(
                 "Not connected to an MCP server.  Check the specified server path in `controller.py`"
             )
-        all_tools = []
-        for session in self.sessions.values():
-            tools_result = await session.list_tools()
-            for tool in tools_result.tools:
-                all_tools.append(
-                    {
-                        "type": "function",
-                        "function": {
-                            "name": tool.name,
-                            "description": tool.description,
-                            "parameters": tool.inputSchema,
-                        },
-                    }
-                )
-        return all_tools
+        for script_path in list(self._stale_servers):
+            await self._register_tools(script_path)
+        # Servers start concurrently, so keep the configured order for a stable prompt prefix
+        return [
+            schema
+            for script_path in self._server_order
+            if script_path in self.sessions
+            for schema in self.tool_schemas.get(script_path, [])
+        ]
 
     def _regex_clean(self, text: str) -> str:
         """Removes special characters from the LLM response to avoid TTS issues."""
         return self._response_cleaner.sub("", text)
 
-    async def process_query(self, query: str) -> str:
-        """Manages the conversation state and controls calls to tools and the LLM."""
+    async def _summarize(self, previous: str, messages: List[Dict[str, Any]]) -> str:
+        """Asks the LLM to fold old turns into the rolling conversation summary."""
+        speakers = {"user": "Dave", "assistant": "HAL", "tool": "Tool result"}
+        lines = [f"Earlier summary: {previous}"] if previous else []
+        for message in messages:
+            if message.get("content"):
+                lines.append(f"{speakers[message['role']]}: {message['content']}")
+        response = await generate_llm_response(
+            self.llm,
+            [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": "\n".join(lines)},
+            ],
+        )
+        return self._regex_clean(response["content"]).strip()
+
+    async def _call_tool(self, tool_call: Any) -> str:
+        """Runs a single tool call and returns its result, or an error message the LLM can read."""
+        function_name = tool_call["function"]["name"]
+        arguments = tool_call["function"]["arguments"]
+        if (
+            function_name not in self.tool_to_session
+            and function_name not in self.tool_to_server
+        ):
+            return f"Error: unknown tool '{function_name}'"
+        cached = self.tool_cache.get(function_name, arguments)
+        if cached is not None:
+            logger.info(f"Using cached result for tool '{function_name}'")
+            return cached
+        script_path = self.tool_to_server.get(function_name)
+        for attempt in range(2):
+            session = self.tool_to_session.get(function_name)
+            if session is None:
+                try:
+                    session = await self._ensure_server(script_path)
+                except Exception as e:
+                    logger.error(
+                        f"Could not start the server of '{function_name}': {e}"
+                    )
+                    return f"Error: the tool '{function_name}' is unavailable"
+            try:
+                result = await asyncio.wait_for(
+                    session.call_tool(function_name, arguments=arguments),
+                    self.tool_timeout,
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Tool '{function_name}' timed out after {self.tool_timeout} seconds"
+                )
+                return f"Error: the tool '{function_name}' did not respond in time"
+            except Exception as e:
+                if (
+                    attempt == 0
+                    and self._connection_lost(e)
+                    and not isinstance(session, ToolProvider)
+                ):
+                    # The server died, so restart it and try once more
+                    logger.warning(f"Lost connection to {script_path}, restarting it")
+                    self._drop_session(script_path, session)
+                    continue
+                logger.error(f"Tool '{function_name}' failed: {e}")
+                return f"Error: the tool '{function_name}' failed: {e}"
+            break
+        text = result.content[0].text if result.content else ""
+        if not result.isError:
+            self.tool_cache.put(function_name, arguments, text)
+        return text
+
+    @staticmethod
+    def _connection_lost(error: Exception) -> bool:
+        """Whether a tool call failed because the connection to its server is gone."""
+        if isinstance(error, McpError):
+            return error.error.code == types.CONNECTION_CLOSED
+        return isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError))
+
+    async def _call_tools(
+        self, messages: List[Dict[str, Any]], tool_calls: List[Any]
+    ) -> None:
+        """Runs the tool calls requested by the LLM concurrently and adds their results
+        to the conversation in the order they were requested."""
+        logger.info(f"\nTool call requested: {tool_calls}")
+        results = await asyncio.gather(
+            *(self._call_tool(tool_call) for tool_call in tool_calls)
+        )
+        for result in results:
+            messages.append({"role": "tool", "content": result})
+            logger.info(f"Tool call result: {result}")
+
+    async def process_query(
+        self, query: str, session_id: str = DEFAULT_SESSION_ID
+    ) -> str:
+        """Manages the conversation state and controls calls to tools and the LLM.
+
+        The LLM may request tools for up to `max_tool_rounds` rounds; after that it is
+        asked for a final answer without tools."""
         if not self.sessions and self.using_tools:
             raise ConnectionError(
                 "Not connected to an MCP server.  Check the specified server path in `controller.py`"
             )
 
-        self.chat_messages.append({"role": "user", "content": query})
-        tools = await self.get_mcp_tools() if self.using_tools else None
-
-        assistant_message = generate_llm_response(self.chat_messages, tools)
-        self.chat_messages.append(assistant_message)
-
-        if assistant_message.get("tool_calls"):
-            logger.info(f"\nTool call requested: {assistant_message['tool_calls']}")
-            for tool_call in assistant_message["tool_calls"]:
-                function_name = tool_call["function"]["name"]
-                arguments = tool_call["function"]["arguments"]
-                session = self.tool_to_session[function_name]
-                result = await session.call_tool(function_name, arguments=arguments)
-
-                self.chat_messages.append(
-                    {
-                        "role": "tool",
-                        "content": result.content[0].text,
-                    }
+        async with self.conversations.hold(session_id) as conversation:
+            messages = conversation.messages
+            messages.append({"role": "user", "content": query})
+            tools = await self.get_mcp_tools() if self.using_tools else None
+
+            for tool_round in range(self.max_tool_rounds + 1):
+                round_tools = tools if tool_round < self.max_tool_rounds else None
+                assistant_message = await generate_llm_response(
+                    self.llm, messages, round_tools
                 )
-            logger.info(f"Tool call result: {result.content[0].text}")
-            logger.info("\nSending tool context to LLM for final response...")
-            final_assistant_message = generate_llm_response(self.chat_messages, None)
-            final_assistant_message["content"] = self._regex_clean(
-                final_assistant_message["content"]
+                messages.append(assistant_message)
+                if not assistant_message.get("tool_calls"):
+                    break
+                await self._call_tools(messages, assistant_message["tool_calls"])
+                logger.info("\nSending tool context to LLM...")
+
+            assistant_message["content"] = self._regex_clean(
+                assistant_message["content"]
             )
-            self.chat_messages.append(final_assistant_message)
-            return final_assistant_message["content"]
+            self._schedule_compaction(session_id, tools)
+            return assistant_message["content"]
+
+    def _schedule_compaction(
+        self, session_id: str, tools: List[Dict[str, Any]] | None
+    ) -> None:
+        """Fits the history of a session into the context window once its turn has
+        returned, so a summary call never delays the answer.  The compaction holds the
+        conversation like a turn, so it never runs while a turn uses the history."""
+        task = asyncio.create_task(self._compact(session_id, tools))
+        self._compactions.add(task)
+        task.add_done_callback(self._compactions.discard)
+
+    async def _compact(
+        self, session_id: str, tools: List[Dict[str, Any]] | None
+    ) -> None:
+        try:
+            async with self.conversations.hold(session_id) as conversation:
+                await self.context.fit(conversation.messages, tools)
+        except Exception as e:
+            logger.warning(f"Could not compact conversation '{session_id}': {e}")
+
+    async def _stream_assistant_message(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: List[Dict[str, Any]] | None,
+        message: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """Streams a response from the LLM and yields each sentence as soon as it is complete.
+
+        The full assistant message, including any tool calls, is assembled into `message`.
+        """
+        buffer = ""
+        async for delta in stream_llm_response(self.llm, messages, tools):
+            if delta.get("tool_calls"):
+                message.setdefault("tool_calls", []).extend(delta["tool_calls"])
+            text = delta.get("content") or ""
+            message["content"] += text
+            sentences, buffer = pop_sentences(buffer + text)
+            for sentence in sentences:
+                yield self._regex_clean(sentence)
+        if buffer.strip():
+            yield self._regex_clean(buffer.strip())
+        message["content"] = self._regex_clean(message["content"])
+
+    async def process_query_stream(
+        self, query: str, session_id: str = DEFAULT_SESSION_ID
+    ) -> AsyncIterator[str]:
+        """Streaming version of `process_query` that yields the response sentence by sentence."""
+        if not self.sessions and self.using_tools:
+            raise ConnectionError(
+                "Not connected to an MCP server.  Check the specified server path in `controller.py`"
+            )
+
+        async with self.conversations.hold(session_id) as conversation:
+            messages = conversation.messages
+            messages.append({"role": "user", "content": query})
+            tools = await self.get_mcp_tools() if self.using_tools else None
+
+            for tool_round in range(self.max_tool_rounds + 1):
+                round_tools = tools if tool_round < self.max_tool_rounds else None
+                assistant_message = {"role": "assistant", "content": ""}
+                async for sentence in self._stream_assistant_message(
+                    messages, round_tools, assistant_message
+                ):
+                    yield sentence
+                messages.append(assistant_message)
+                if not assistant_message.get("tool_calls"):
+                    break
+                await self._call_tools(messages, assistant_message["tool_calls"])
+                logger.info("\nSending tool context to LLM...")
 
-        assistant_message["content"] = self._regex_clean(assistant_message["content"])
-        return assistant_message["content"]
+            self._schedule_compaction(session_id, tools)
 
     async def cleanup(self):
         """Clean up resources and close connections gracefully."""
+        if self._compactions:
+            await asyncio.gather(*self._compactions)
+        await self.conversations.drain()
         await self.exit_stack.aclose()
@@ -1,11 +1,14 @@
 import os
+import json
 from dotenv import load_dotenv
 from pathlib import Path
 from fastapi import FastAPI, Body, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import Annotated
 from contextlib import asynccontextmanager
 
 from .client import MCPOllamaClient
+from .sessions import DEFAULT_SESSION_ID
 
 import logging
 from rich.logging import RichHandler
@@ -20,9 +23,37 @@ logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
 load_dotenv()
 USING_TOOLS = os.getenv("USING_TOOLS", "False").lower() in ("true", "1", "t")
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "64"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR") or None
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3072"))
+MAX_TOOL_ROUNDS = int(os.getenv("MAX_TOOL_ROUNDS", "3"))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "15"))
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "256"))
+LAZY_MCP_SERVERS = os.getenv("LAZY_MCP_SERVERS", "False").lower() in ("true", "1", "t")
+MCP_TOOL_MANIFEST_DIR = os.getenv(
+    "MCP_TOOL_MANIFEST_DIR", str(Path.home() / ".cache" / "hal9000" / "mcp_tools")
+)
+IN_PROCESS_TOOLS = [
+    name.strip()
+    for name in os.getenv("IN_PROCESS_TOOLS", "time").split(",")
+    if name.strip()
+]
 
 
-mcp_client = MCPOllamaClient(using_tools=USING_TOOLS)
+mcp_client = MCPOllamaClient(
+    using_tools=USING_TOOLS,
+    max_sessions=MAX_SESSIONS,
+    session_ttl=SESSION_TTL,
+    session_spill_dir=SESSION_SPILL_DIR,
+    context_token_budget=CONTEXT_TOKEN_BUDGET,
+    max_tool_rounds=MAX_TOOL_ROUNDS,
+    tool_timeout=TOOL_TIMEOUT,
+    tool_cache_size=TOOL_CACHE_SIZE,
+    lazy_servers=LAZY_MCP_SERVERS,
+    tool_manifest_dir=MCP_TOOL_MANIFEST_DIR,
+    in_process_tools=IN_PROCESS_TOOLS,
+)
 
 
 @asynccontextmanager
@@ -51,14 +82,47 @@ async def lifespan(app: FastAPI):
 app = FastAPI(title="MCP/LLM Controller", lifespan=lifespan)
 
 
+@app.get("/stats")
+async def stats():
+    """Returns counters for monitoring the controller."""
+    return {"tool_cache": mcp_client.tool_cache.stats()}
+
+
 @app.post("/query")
-async def query(query: Annotated[str, Body(embed=True)]):
-    """Receives a query, manages calls to the client, and returns the final response."""
+async def query(
+    query: Annotated[str, Body(embed=True)],
+    session_id: Annotated[str, Body(embed=True)] = DEFAULT_SESSION_ID,
+):
+    """Receives a query, manages calls to the client, and returns the final response.
+    Queries with the same `session_id` share one conversation history."""
     if not mcp_client.sessions and mcp_client.using_tools:
         raise HTTPException(status_code=503, detail="MCP Tool Server not connected")
     try:
-        final_response = await mcp_client.process_query(query)
+        final_response = await mcp_client.process_query(query, session_id=session_id)
         return {"response": final_response}
     except Exception as e:
         logger.error(f"Error processing query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/query/stream")
+async def query_stream(
+    query: Annotated[str, Body(embed=True)],
+    session_id: Annotated[str, Body(embed=True)] = DEFAULT_SESSION_ID,
+):
+    """Receives a query and streams the response back as newline-delimited JSON,
+    one complete sentence per line."""
+    if not mcp_client.sessions and mcp_client.using_tools:
+        raise HTTPException(status_code=503, detail="MCP Tool Server not connected")
+
+    async def sentence_stream():
+        try:
+            async for sentence in mcp_client.process_query_stream(
+                query, session_id=session_id
+            ):
+                yield json.dumps({"sentence": sentence}) + "\n"
+        except Exception as e:
+            logger.error(f"Error processing query: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(sentence_stream(), media_type="application/x-ndjson")
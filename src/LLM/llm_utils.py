@@ -1,16 +1,87 @@
-from typing import List, Dict, Any
+import os
+import re
+import asyncio
+from typing import List, Dict, Any, AsyncIterator, Tuple
+import httpx
 import ollama
 
+LLM_MODEL = "qwen3:8b"
+# Seconds a whole non-streamed response, or the gap between two streamed chunks, may take
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
 
-def generate_llm_response(
-    messages: List[Dict[str, Any]], tools: List[Dict[str, Any]] | None = None
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+def create_llm_client(host: str | None = None) -> ollama.AsyncClient:
+    """
+    Creates an async Ollama client.  The client keeps a connection pool to the Ollama
+    server, so a single instance should be shared by every request.
+    """
+    return ollama.AsyncClient(
+        host=host,
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+    )
+
+
+async def generate_llm_response(
+    client: ollama.AsyncClient,
+    messages: List[Dict[str, Any]],
+    tools: List[Dict[str, Any]] | None = None,
+    timeout: float = LLM_TIMEOUT,
 ) -> Dict[str, Any]:
     """
     Receives a complete conversation history and tools, gets a response from Ollama,
     and returns the assistant's response.
     """
-    response = ollama.chat(
-        model="qwen3:8b", messages=messages, tools=tools, think=False, keep_alive=-1
+    response = await asyncio.wait_for(
+        client.chat(
+            model=LLM_MODEL, messages=messages, tools=tools, think=False, keep_alive=-1
+        ),
+        timeout,
     )
 
     return response["message"]
+
+
+async def stream_llm_response(
+    client: ollama.AsyncClient,
+    messages: List[Dict[str, Any]],
+    tools: List[Dict[str, Any]] | None = None,
+    timeout: float = LLM_TIMEOUT,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Same as `generate_llm_response`, but yields the partial assistant messages
+    as Ollama streams them.  `timeout` applies to the wait for each chunk.
+    """
+    stream = await asyncio.wait_for(
+        client.chat(
+            model=LLM_MODEL,
+            messages=messages,
+            tools=tools,
+            think=False,
+            keep_alive=-1,
+            stream=True,
+        ),
+        timeout,
+    )
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(anext(stream), timeout)
+            except StopAsyncIteration:
+                break
+            yield chunk["message"]
+    finally:
+        # Closes the HTTP response if the caller stops early or is cancelled
+        await stream.aclose()
+
+
+def pop_sentences(buffer: str) -> Tuple[List[str], str]:
+    """
+    Splits the complete sentences off the front of a streamed text buffer.
+    Returns the sentences and the unfinished remainder of the buffer.
+    """
+    parts = _SENTENCE_BOUNDARY.split(buffer)
+    sentences = [part.strip() for part in parts[:-1] if part.strip()]
+    return sentences, parts[-1]
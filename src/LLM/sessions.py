@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+DEFAULT_SESSION_ID = "default"
+
+
+@dataclass
+class Conversation:
+    """Chat history of a single session.  `lock` serializes the turns of the session,
+    and `users` counts the turns holding or waiting for it."""
+
+    messages: List[Dict[str, Any]]
+    last_used: float = field(default_factory=time.monotonic)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    users: int = 0
+
+
+def _to_json(value: Any) -> Any:
+    """Serializes the Ollama message models that end up in a chat history."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ConversationStore:
+    """Bounded LRU store of per-session conversations with idle-TTL eviction.
+
+    When `spill_dir` is set, evicted conversations are written to disk in a worker
+    thread and transparently reloaded the next time their session is used.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        max_sessions: int = 64,
+        idle_ttl: float = 3600.0,
+        spill_dir: str | None = None,
+    ):
+        """Initialize the conversation store.
+
+        Args:
+            system_prompt (str): System prompt every new conversation starts with
+            max_sessions (int): Maximum number of conversations held in memory
+            idle_ttl (float): Seconds of inactivity after which a conversation is evicted
+            spill_dir (str | None): Directory evicted conversations are spilled to. If None, they are dropped.
+        """
+        self.system_prompt = system_prompt
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        if self.spill_dir:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._conversations: OrderedDict[str, Conversation] = OrderedDict()
+        # Messages of evicted conversations whose spill file is still being written
+        self._spilling: Dict[str, tuple[List[Dict[str, Any]]]] = {}
+        self._spill_tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._conversations
+
+    def get(self, session_id: str = DEFAULT_SESSION_ID) -> Conversation:
+        """Returns the conversation of a session, creating or reloading it if needed."""
+        now = time.monotonic()
+        conversation = self._conversations.get(session_id)
+        if conversation is None:
+            conversation = Conversation(messages=self._load(session_id))
+            self._conversations[session_id] = conversation
+        self._conversations.move_to_end(session_id)
+        conversation.last_used = now
+
+        self._evict(now, keep=session_id)
+        return conversation
+
+    @asynccontextmanager
+    async def hold(
+        self, session_id: str = DEFAULT_SESSION_ID
+    ) -> AsyncIterator[Conversation]:
+        """Holds the conversation of a session for one turn.  The conversation is marked
+        in use as soon as it is looked up, so it cannot be evicted while the turn waits
+        for its lock, and turns of the same session run one at a time."""
+        conversation = self.get(session_id)
+        conversation.users += 1
+        try:
+            async with conversation.lock:
+                yield conversation
+        finally:
+            conversation.users -= 1
+            conversation.last_used = time.monotonic()
+
+    def _evict(self, now: float, keep: str) -> None:
+        """Evicts idle conversations, then the least recently used ones above capacity.
+        The conversation of `keep` and conversations with a turn in progress are never
+        evicted."""
+        for session_id, conversation in list(self._conversations.items()):
+            if session_id != keep and now - conversation.last_used > self.idle_ttl:
+                self._remove(session_id, conversation, reason="idle")
+
+        for session_id, conversation in list(self._conversations.items()):
+            if len(self._conversations) <= self.max_sessions:
+                break
+            if session_id != keep:
+                self._remove(session_id, conversation, reason="over capacity")
+
+    def _remove(self, session_id: str, conversation: Conversation, reason: str) -> None:
+        if conversation.users or conversation.lock.locked():
+            return
+        del self._conversations[session_id]
+        logger.info(f"Evicting conversation '{session_id}' ({reason})")
+        if self.spill_dir:
+            self._spill(session_id, conversation.messages)
+
+    def _spill(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Writes an evicted conversation to disk off the event loop.  Until the file
+        is written, the conversation is reloaded from `_spilling`."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_spill(session_id, messages)
+            return
+        spill = self._spilling[session_id] = (messages,)
+        task = loop.create_task(
+            asyncio.to_thread(self._write_spill, session_id, messages)
+        )
+        self._spill_tasks.add(task)
+
+        def done(task: asyncio.Task) -> None:
+            self._spill_tasks.discard(task)
+            if self._spilling.get(session_id) is spill:
+                del self._spilling[session_id]
+            elif session_id in self._conversations:
+                # Reloaded while it was written, so the file is already stale
+                self._spill_path(session_id).unlink(missing_ok=True)
+
+        task.add_done_callback(done)
+
+    def _write_spill(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        self._spill_path(session_id).write_text(json.dumps(messages, default=_to_json))
+
+    async def drain(self) -> None:
+        """Waits until all evicted conversations are written to disk."""
+        if self._spill_tasks:
+            await asyncio.gather(*self._spill_tasks)
+
+    def _spill_path(self, session_id: str) -> Path:
+        # Hash the session ID so arbitrary client-provided IDs are safe file names
+        digest = hashlib.sha256(session_id.encode()).hexdigest()
+        return self.spill_dir / f"{digest}.json"
+
+    def _load(self, session_id: str) -> List[Dict[str, Any]]:
+        """Reloads a spilled conversation, or starts a new one."""
+        if session_id in self._spilling:
+            return self._spilling.pop(session_id)[0]
+        if self.spill_dir:
+            path = self._spill_path(session_id)
+            if path.exists():
+                messages = json.loads(path.read_text())
+                path.unlink()
+                logger.info(f"Reloaded conversation '{session_id}' from disk")
+                return messages
+        return [{"role": "system", "content": self.system_prompt}]
@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+# Seconds a tool result stays valid.  Tools that are not listed, or have a TTL of 0, are never cached.
+DEFAULT_TOOL_TTLS: Dict[str, float] = {
+    "weather_current": 10 * 60,
+    "weather_airquality": 10 * 60,
+    "weather_alerts": 10 * 60,
+    "weather_forecast": 30 * 60,
+    "weather_astronomy": 6 * 60 * 60,
+    "web_search": 6 * 60 * 60,
+    # Converts a time on the current date, so the result changes across DST transitions
+    "convert_time": 0,
+    "get_current_time": 0,
+}
+
+CacheKey = Tuple[str, str]
+
+
+def _canonicalize(value: Any) -> Any:
+    """Normalizes argument values so equivalent calls share a cache entry."""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {k: _canonicalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_canonicalize(v) for v in value]
+    return value
+
+
+class ToolResultCache:
+    """Size-bounded LRU cache of tool results with a TTL per tool."""
+
+    def __init__(
+        self,
+        ttls: Dict[str, float] | None = None,
+        max_entries: int = 256,
+    ):
+        """Initialize the tool result cache.
+
+        Args:
+            ttls (Dict[str, float] | None): Seconds each tool's results stay valid. Defaults to `DEFAULT_TOOL_TTLS`.
+            max_entries (int): Maximum number of cached results. 0 disables the cache.
+        """
+        self.ttls = DEFAULT_TOOL_TTLS if ttls is None else ttls
+        self.max_entries = max_entries
+        self._entries: OrderedDict[CacheKey, Tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(name: str, arguments: Dict[str, Any] | None) -> CacheKey:
+        """Builds the cache key of a tool call from its name and canonicalized arguments."""
+        canonical = json.dumps(
+            _canonicalize(arguments or {}),
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return name, canonical
+
+    def is_cacheable(self, name: str) -> bool:
+        return self.max_entries > 0 and self.ttls.get(name, 0) > 0
+
+    def get(self, name: str, arguments: Dict[str, Any] | None) -> str | None:
+        """Returns the cached result of a tool call, or None if it is missing or expired."""
+        if not self.is_cacheable(name):
+            return None
+        key = self.make_key(name, arguments)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, name: str, arguments: Dict[str, Any] | None, result: str) -> None:
+        """Caches the result of a tool call if the tool has a TTL."""
+        if not self.is_cacheable(name):
+            return
+        key = self.make_key(name, arguments)
+        self._entries[key] = (time.monotonic() + self.ttls[name], result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
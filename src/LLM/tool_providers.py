@@ -0,0 +1,124 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict
+
+from mcp import types
+from mcp.server.fastmcp import FastMCP
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+
+class ToolProvider(ABC):
+    """Tools that run inside the controller process instead of an MCP server subprocess.
+
+    Providers mirror `list_tools` and `call_tool` of an MCP `ClientSession`, so the
+    client registers and calls their tools exactly like the tools of a server.
+    """
+
+    @abstractmethod
+    async def list_tools(self) -> types.ListToolsResult:
+        """Lists the tools of the provider."""
+
+    @abstractmethod
+    async def call_tool(
+        self, name: str, arguments: Dict[str, Any] | None = None
+    ) -> types.CallToolResult:
+        """Runs a tool and returns its result."""
+
+
+def _text_result(text: str, is_error: bool = False) -> types.CallToolResult:
+    return types.CallToolResult(
+        content=[types.TextContent(type="text", text=text)], isError=is_error
+    )
+
+
+class TimeToolProvider(ToolProvider):
+    """Runs the tools of the low-level time server (`MCP/mcp_time/server.py`) in-process."""
+
+    def __init__(self, module: ModuleType, local_timezone: str | None = None):
+        self._module = module
+        self._time_server = module.TimeServer()
+        self._local_tz = str(module.get_local_tz(local_timezone))
+
+    async def list_tools(self) -> types.ListToolsResult:
+        return types.ListToolsResult(tools=self._module.time_tools(self._local_tz))
+
+    async def call_tool(
+        self, name: str, arguments: Dict[str, Any] | None = None
+    ) -> types.CallToolResult:
+        try:
+            result = self._module.run_time_tool(
+                self._time_server, name, arguments or {}
+            )
+        except Exception as e:
+            return _text_result(str(e), is_error=True)
+        return _text_result(result.model_dump_json())
+
+
+class FastMCPToolProvider(ToolProvider):
+    """Runs the tools of a FastMCP server (weather, web search) in-process.
+
+    Each call runs on its own event loop in a worker thread, because tools such as
+    `web_search` do blocking network I/O inside `async def`.  On the controller's loop
+    they would stall every other request and the tool timeout could never fire.
+    """
+
+    def __init__(self, server: FastMCP):
+        self._server = server
+
+    async def list_tools(self) -> types.ListToolsResult:
+        return types.ListToolsResult(tools=await self._server.list_tools())
+
+    async def call_tool(
+        self, name: str, arguments: Dict[str, Any] | None = None
+    ) -> types.CallToolResult:
+        try:
+            result = await asyncio.to_thread(
+                self._call_tool_sync, name, arguments or {}
+            )
+        except Exception as e:
+            return _text_result(str(e), is_error=True)
+        # Depending on the tool's return annotation and the FastMCP version, the result
+        # is the content blocks, the structured output, or a (content, structured) tuple
+        content, structured = result, None
+        if isinstance(result, tuple):
+            content, structured = result
+        elif isinstance(result, dict):
+            content, structured = [], result
+        if not content and structured is not None:
+            return _text_result(json.dumps(structured))
+        return types.CallToolResult(
+            content=list(content), structuredContent=structured, isError=False
+        )
+
+    def _call_tool_sync(self, name: str, arguments: Dict[str, Any]) -> Any:
+        return asyncio.run(self._server.call_tool(name, arguments))
+
+
+def load_server_module(script_path: str) -> ModuleType:
+    """Imports an MCP server script as a module without running its server."""
+    path = Path(script_path)
+    spec = importlib.util.spec_from_file_location(f"hal_tools_{path.parent.name}", path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot import {script_path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_tool_provider(script_path: str) -> ToolProvider:
+    """Creates an in-process provider for the tools of an MCP server script."""
+    module = load_server_module(script_path)
+    server = getattr(module, "mcp", None)
+    if isinstance(server, FastMCP):
+        return FastMCPToolProvider(server)
+    if hasattr(module, "time_tools") and hasattr(module, "run_time_tool"):
+        return TimeToolProvider(module)
+    raise ValueError(f"{script_path} has no tools that can run in-process")
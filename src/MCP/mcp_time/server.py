@@ -9,7 +9,14 @@ from tzlocal import get_localzone_name  # ← returns "Europe/Paris", etc.
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
-from mcp.types import Tool, TextContent, ImageContent, EmbeddedResource
+from mcp.types import (
+    INVALID_PARAMS,
+    EmbeddedResource,
+    ErrorData,
+    ImageContent,
+    TextContent,
+    Tool,
+)
 from mcp.shared.exceptions import McpError
 
 from pydantic import BaseModel
@@ -46,14 +53,21 @@ def get_local_tz(local_tz_override: str | None = None) -> ZoneInfo:
     local_tzname = get_localzone_name()
     if local_tzname is not None:
         return ZoneInfo(local_tzname)
-    raise McpError("Could not determine local timezone - tzinfo is None")
+    raise McpError(
+        ErrorData(
+            code=INVALID_PARAMS,
+            message="Could not determine local timezone - tzinfo is None",
+        )
+    )
 
 
 def get_zoneinfo(timezone_name: str) -> ZoneInfo:
     try:
         return ZoneInfo(timezone_name)
     except Exception as e:
-        raise McpError(f"Invalid timezone: {str(e)}")
+        raise McpError(
+            ErrorData(code=INVALID_PARAMS, message=f"Invalid timezone: {str(e)}")
+        )
 
 
 class TimeServer:
@@ -116,6 +130,80 @@ class TimeServer:
         )
 
 
+def time_tools(local_tz: str) -> list[Tool]:
+    """List available time tools."""
+    return [
+        Tool(
+            name=TimeTools.GET_CURRENT_TIME.value,
+            description="Get current time in a specific timezones",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "timezone": {
+                        "type": "string",
+                        "description": f"IANA timezone name (e.g., 'America/New_York', 'Europe/London'). Use '{local_tz}' as local timezone if no timezone provided by the user.",
+                    }
+                },
+                "required": ["timezone"],
+            },
+        ),
+        Tool(
+            name=TimeTools.CONVERT_TIME.value,
+            description="Convert time between timezones",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "source_timezone": {
+                        "type": "string",
+                        "description": f"Source IANA timezone name (e.g., 'America/New_York', 'Europe/London'). Use '{local_tz}' as local timezone if no source timezone provided by the user.",
+                    },
+                    "time": {
+                        "type": "string",
+                        "description": "Time to convert in 24-hour format (HH:MM)",
+                    },
+                    "target_timezone": {
+                        "type": "string",
+                        "description": f"Target IANA timezone name (e.g., 'Asia/Tokyo', 'America/San_Francisco'). Use '{local_tz}' as local timezone if no target timezone provided by the user.",
+                    },
+                },
+                "required": ["source_timezone", "time", "target_timezone"],
+            },
+        ),
+    ]
+
+
+def run_time_tool(
+    time_server: TimeServer, name: str, arguments: dict
+) -> TimeResult | TimeConversionResult:
+    """Handle tool calls for time queries."""
+    try:
+        match name:
+            case TimeTools.GET_CURRENT_TIME.value:
+                timezone = arguments.get("timezone")
+                if not timezone:
+                    raise ValueError("Missing required argument: timezone")
+
+                return time_server.get_current_time(timezone)
+
+            case TimeTools.CONVERT_TIME.value:
+                if not all(
+                    k in arguments
+                    for k in ["source_timezone", "time", "target_timezone"]
+                ):
+                    raise ValueError("Missing required arguments")
+
+                return time_server.convert_time(
+                    arguments["source_timezone"],
+                    arguments["time"],
+                    arguments["target_timezone"],
+                )
+            case _:
+                raise ValueError(f"Unknown tool: {name}")
+
+    except Exception as e:
+        raise ValueError(f"Error processing mcp-server-time query: {str(e)}")
+
+
 async def serve(local_timezone: str | None = None) -> None:
     server = Server("mcp-time")
     time_server = TimeServer()
@@ -124,80 +212,17 @@ async def serve(local_timezone: str | None = None) -> None:
     @server.list_tools()
     async def list_tools() -> list[Tool]:
         """List available time tools."""
-        return [
-            Tool(
-                name=TimeTools.GET_CURRENT_TIME.value,
-                description="Get current time in a specific timezones",
-                inputSchema={
-                    "type": "object",
-                    "properties": {
-                        "timezone": {
-                            "type": "string",
-                            "description": f"IANA timezone name (e.g., 'America/New_York', 'Europe/London'). Use '{local_tz}' as local timezone if no timezone provided by the user.",
-                        }
-                    },
-                    "required": ["timezone"],
-                },
-            ),
-            Tool(
-                name=TimeTools.CONVERT_TIME.value,
-                description="Convert time between timezones",
-                inputSchema={
-                    "type": "object",
-                    "properties": {
-                        "source_timezone": {
-                            "type": "string",
-                            "description": f"Source IANA timezone name (e.g., 'America/New_York', 'Europe/London'). Use '{local_tz}' as local timezone if no source timezone provided by the user.",
-                        },
-                        "time": {
-                            "type": "string",
-                            "description": "Time to convert in 24-hour format (HH:MM)",
-                        },
-                        "target_timezone": {
-                            "type": "string",
-                            "description": f"Target IANA timezone name (e.g., 'Asia/Tokyo', 'America/San_Francisco'). Use '{local_tz}' as local timezone if no target timezone provided by the user.",
-                        },
-                    },
-                    "required": ["source_timezone", "time", "target_timezone"],
-                },
-            ),
-        ]
+        return time_tools(local_tz)
 
     @server.call_tool()
     async def call_tool(
         name: str, arguments: dict
     ) -> Sequence[TextContent | ImageContent | EmbeddedResource]:
         """Handle tool calls for time queries."""
-        try:
-            match name:
-                case TimeTools.GET_CURRENT_TIME.value:
-                    timezone = arguments.get("timezone")
-                    if not timezone:
-                        raise ValueError("Missing required argument: timezone")
-
-                    result = time_server.get_current_time(timezone)
-
-                case TimeTools.CONVERT_TIME.value:
-                    if not all(
-                        k in arguments
-                        for k in ["source_timezone", "time", "target_timezone"]
-                    ):
-                        raise ValueError("Missing required arguments")
-
-                    result = time_server.convert_time(
-                        arguments["source_timezone"],
-                        arguments["time"],
-                        arguments["target_timezone"],
-                    )
-                case _:
-                    raise ValueError(f"Unknown tool: {name}")
-
-            return [
-                TextContent(type="text", text=json.dumps(result.model_dump(), indent=2))
-            ]
-
-        except Exception as e:
-            raise ValueError(f"Error processing mcp-server-time query: {str(e)}")
+        result = run_time_tool(time_server, name, arguments)
+        return [
+            TextContent(type="text", text=json.dumps(result.model_dump(), indent=2))
+        ]
 
     options = server.create_initialization_options()
     async with stdio_server() as (read_stream, write_stream):
@@ -15,6 +15,17 @@ from torch import Tensor, einsum
 Utils
 """
 
+def double_batch(x: Optional[Tensor]) -> Optional[Tensor]:
+    """Repeats a batch once along the batch dimension, for guided and unguided passes"""
+    return torch.cat([x, x]) if exists(x) else x
+
+def masked_mean(x: Tensor, mask: Optional[Tensor] = None) -> Tensor:
+    """Averages x (b, n, c) over n, skipping the positions where mask (b, n) is True"""
+    if not exists(mask):
+        return x.mean(axis=1).unsqueeze(1)
+    keep = (~mask).unsqueeze(-1).to(x.dtype)
+    return (x * keep).sum(axis=1, keepdim=True) / keep.sum(axis=1, keepdim=True)
+
 class AdaLayerNorm(nn.Module):
     def __init__(self, style_dim, channels, eps=1e-5):
         super().__init__()
@@ -119,7 +130,8 @@ class StyleTransformer1d(nn.Module):
         
 
     def get_mapping(
-        self, time: Optional[Tensor] = None, features: Optional[Tensor] = None
+        self, time: Optional[Tensor] = None, features: Optional[Tensor] = None,
+        features_mapping: Optional[Tensor] = None,
     ) -> Optional[Tensor]:
         """Combines context time features and features into mapping"""
         items, mapping = [], None
@@ -131,8 +143,8 @@ class StyleTransformer1d(nn.Module):
         # Compute features
         if self.use_context_features:
             assert_message = "context_features exists but no features provided"
-            assert exists(features), assert_message
-            items += [self.to_features(features)]
+            assert exists(features) or exists(features_mapping), assert_message
+            items += [default(features_mapping, lambda: self.to_features(features))]
 
         # Compute joint mapping
         if self.use_context_time or self.use_context_features:
@@ -141,48 +153,105 @@ class StyleTransformer1d(nn.Module):
 
         return mapping
             
-    def run(self, x, time, embedding, features):
+    def run(self, x, time, embedding, features, embedding_padding_mask=None,
+            features_mapping=None, buffer=None):
         
-        mapping = self.get_mapping(time, features)
-        x = torch.cat([x.expand(-1, embedding.size(1), -1), embedding], axis=-1)
+        mapping = self.get_mapping(time, features, features_mapping)
+        if exists(buffer) and not torch.is_grad_enabled():
+            # The embedding half of the buffer is already filled in by `prepare`
+            buffer[..., :x.size(-1)] = x
+            x = buffer
+        else:
+            x = torch.cat([x.expand(-1, embedding.size(1), -1), embedding], axis=-1)
         mapping = mapping.unsqueeze(1).expand(-1, embedding.size(1), -1)
         
         for block in self.blocks:
             x = x + mapping
-            x = block(x, features)
+            x = block(x, features, mask=embedding_padding_mask)
         
-        x = x.mean(axis=1).unsqueeze(1)
+        x = masked_mean(x, embedding_padding_mask)
         x = self.to_out(x)
         x = x.transpose(-1, -2)
         
         return x
         
+    def prepare(self, embedding: Tensor,
+                features: Optional[Tensor] = None,
+                embedding_scale: float = 1.0,
+                embedding_padding_mask: Optional[Tensor] = None,
+                embedding_mask_proba: float = 0.0) -> dict:
+        """Computes the inputs of the denoiser that stay the same at every step of a
+        sampling run: the fixed embedding for guidance, the feature mapping, and an
+        input buffer that already holds the embeddings. Returns the keyword arguments
+        of `forward` that reuse them."""
+        kwargs = dict(embedding=embedding, features=features,
+                      embedding_scale=embedding_scale,
+                      embedding_padding_mask=embedding_padding_mask)
+        if embedding_mask_proba > 0.0:
+            # Random masking draws new masks at every call
+            return dict(kwargs, embedding_mask_proba=embedding_mask_proba)
+
+        if embedding_scale != 1.0:
+            # The guided and unguided passes run as one batch
+            embedding = torch.cat([embedding, self.fixed_embedding(embedding)])
+            features = double_batch(features)
+            embedding_padding_mask = double_batch(embedding_padding_mask)
+        channels = self.to_out[1].out_channels
+        buffer = embedding.new_empty(*embedding.shape[:2], channels + embedding.size(-1))
+        buffer[..., channels:] = embedding
+
+        features_mapping = None
+        if self.use_context_features:
+            features_mapping = self.to_features(features)
+        return dict(kwargs, prepared=dict(
+            buffer=buffer, features=features, features_mapping=features_mapping,
+            embedding_padding_mask=embedding_padding_mask,
+        ))
+
     def forward(self, x: Tensor, 
                 time: Tensor, 
                 embedding_mask_proba: float = 0.0,
                 embedding: Optional[Tensor] = None, 
                 features: Optional[Tensor] = None,
-               embedding_scale: float = 1.0) -> Tensor:
+               embedding_scale: float = 1.0,
+                embedding_padding_mask: Optional[Tensor] = None,
+                prepared: Optional[dict] = None) -> Tensor:
+        # embedding_padding_mask is True at the padded positions of a batch of embeddings
+        # prepared holds the per-run invariants computed by `prepare`
+        guided = embedding_scale != 1.0
         
-        b, device = embedding.shape[0], embedding.device
-        fixed_embedding = self.fixed_embedding(embedding)
-        if embedding_mask_proba > 0.0:
-            # Randomly mask embedding
-            batch_mask = rand_bool(
-                shape=(b, 1, 1), proba=embedding_mask_proba, device=device
-            )
-            embedding = torch.where(batch_mask, fixed_embedding, embedding)
-
-        if embedding_scale != 1.0:
-            # Compute both normal and fixed embedding outputs
-            out = self.run(x, time, embedding=embedding, features=features)
-            out_masked = self.run(x, time, embedding=fixed_embedding, features=features)
+        if exists(prepared):
+            if guided:
+                x, time = double_batch(x), double_batch(time)
+            buffer = prepared["buffer"]
+            out = self.run(x, time, embedding=buffer[..., -embedding.size(-1):],
+                           features=prepared["features"],
+                           embedding_padding_mask=prepared["embedding_padding_mask"],
+                           features_mapping=prepared["features_mapping"], buffer=buffer)
+        else:
+            b, device = embedding.shape[0], embedding.device
+            fixed_embedding = self.fixed_embedding(embedding)
+            if embedding_mask_proba > 0.0:
+                # Randomly mask embedding
+                batch_mask = rand_bool(
+                    shape=(b, 1, 1), proba=embedding_mask_proba, device=device
+                )
+                embedding = torch.where(batch_mask, fixed_embedding, embedding)
+
+            if guided:
+                # Compute both normal and fixed embedding outputs in one batch
+                x, time = double_batch(x), double_batch(time)
+                embedding = torch.cat([embedding, fixed_embedding])
+                features = double_batch(features)
+                embedding_padding_mask = double_batch(embedding_padding_mask)
+            out = self.run(x, time, embedding=embedding, features=features,
+                           embedding_padding_mask=embedding_padding_mask)
+
+        if guided:
             # Scale conditional output using classifier-free guidance
+            out, out_masked = out.chunk(2)
             return out_masked + (out - out_masked) * embedding_scale
-        else:
-            return self.run(x, time, embedding=embedding, features=features)
-        
-        return x
+        return out
 
 
 class StyleTransformerBlock(nn.Module):
@@ -226,8 +295,9 @@ class StyleTransformerBlock(nn.Module):
 
         self.feed_forward = FeedForward(features=features, multiplier=multiplier)
 
-    def forward(self, x: Tensor, s: Tensor, *, context: Optional[Tensor] = None) -> Tensor:
-        x = self.attention(x, s) + x
+    def forward(self, x: Tensor, s: Tensor, *, context: Optional[Tensor] = None,
+                mask: Optional[Tensor] = None) -> Tensor:
+        x = self.attention(x, s, mask=mask) + x
         if self.use_cross_attention:
             x = self.cross_attention(x, s, context=context) + x
         x = self.feed_forward(x) + x
@@ -268,7 +338,8 @@ class StyleAttention(nn.Module):
             rel_pos_max_distance=rel_pos_max_distance,
         )
 
-    def forward(self, x: Tensor, s: Tensor, *, context: Optional[Tensor] = None) -> Tensor:
+    def forward(self, x: Tensor, s: Tensor, *, context: Optional[Tensor] = None,
+                mask: Optional[Tensor] = None) -> Tensor:
         assert_message = "You must provide a context when using context_features"
         assert not self.context_features or exists(context), assert_message
         # Use context if provided
@@ -278,7 +349,7 @@ class StyleAttention(nn.Module):
         
         q, k, v = (self.to_q(x), *torch.chunk(self.to_kv(context), chunks=2, dim=-1))
         # Compute and return attention
-        return self.attention(q, k, v)
+        return self.attention(q, k, v, mask=mask)
         
 class Transformer1d(nn.Module):
     def __init__(
@@ -383,7 +454,7 @@ class Transformer1d(nn.Module):
 
         return mapping
             
-    def run(self, x, time, embedding, features):
+    def run(self, x, time, embedding, features, embedding_padding_mask=None):
         
         mapping = self.get_mapping(time, features)
         x = torch.cat([x.expand(-1, embedding.size(1), -1), embedding], axis=-1)
@@ -391,9 +462,9 @@ class Transformer1d(nn.Module):
         
         for block in self.blocks:
             x = x + mapping
-            x = block(x)
+            x = block(x, mask=embedding_padding_mask)
         
-        x = x.mean(axis=1).unsqueeze(1)
+        x = masked_mean(x, embedding_padding_mask)
         x = self.to_out(x)
         x = x.transpose(-1, -2)
         
@@ -404,7 +475,9 @@ class Transformer1d(nn.Module):
                 embedding_mask_proba: float = 0.0,
                 embedding: Optional[Tensor] = None, 
                 features: Optional[Tensor] = None,
-               embedding_scale: float = 1.0) -> Tensor:
+               embedding_scale: float = 1.0,
+                embedding_padding_mask: Optional[Tensor] = None) -> Tensor:
+        # embedding_padding_mask is True at the padded positions of a batch of embeddings
         
         b, device = embedding.shape[0], embedding.device
         fixed_embedding = self.fixed_embedding(embedding)
@@ -417,12 +490,15 @@ class Transformer1d(nn.Module):
 
         if embedding_scale != 1.0:
             # Compute both normal and fixed embedding outputs
-            out = self.run(x, time, embedding=embedding, features=features)
-            out_masked = self.run(x, time, embedding=fixed_embedding, features=features)
+            out = self.run(x, time, embedding=embedding, features=features,
+                           embedding_padding_mask=embedding_padding_mask)
+            out_masked = self.run(x, time, embedding=fixed_embedding, features=features,
+                                  embedding_padding_mask=embedding_padding_mask)
             # Scale conditional output using classifier-free guidance
             return out_masked + (out - out_masked) * embedding_scale
         else:
-            return self.run(x, time, embedding=embedding, features=features)
+            return self.run(x, time, embedding=embedding, features=features,
+                            embedding_padding_mask=embedding_padding_mask)
         
         return x
 
@@ -520,13 +596,16 @@ class AttentionBase(nn.Module):
             
         self.to_out = nn.Linear(in_features=mid_features, out_features=out_features)
 
-    def forward(self, q: Tensor, k: Tensor, v: Tensor) -> Tensor:
+    def forward(self, q: Tensor, k: Tensor, v: Tensor, mask: Optional[Tensor] = None) -> Tensor:
         # Split heads
         q, k, v = rearrange_many((q, k, v), "b n (h d) -> b h n d", h=self.num_heads)
         # Compute similarity matrix
         sim = einsum("... n d, ... m d -> ... n m", q, k)
         sim = (sim + self.rel_pos(*sim.shape[-2:])) if self.use_rel_pos else sim
         sim = sim * self.scale
+        # Ignore padded keys (mask is True at padded positions)
+        if exists(mask):
+            sim = sim.masked_fill(rearrange(mask, "b m -> b 1 1 m"), -torch.finfo(sim.dtype).max)
         # Get attention matrix with softmax
         attn = sim.softmax(dim=-1)
         # Compute values
@@ -572,7 +651,8 @@ class Attention(nn.Module):
             rel_pos_max_distance=rel_pos_max_distance,
         )
 
-    def forward(self, x: Tensor, *, context: Optional[Tensor] = None) -> Tensor:
+    def forward(self, x: Tensor, *, context: Optional[Tensor] = None,
+                mask: Optional[Tensor] = None) -> Tensor:
         assert_message = "You must provide a context when using context_features"
         assert not self.context_features or exists(context), assert_message
         # Use context if provided
@@ -581,7 +661,7 @@ class Attention(nn.Module):
         x, context = self.norm(x), self.norm_context(context)
         q, k, v = (self.to_q(x), *torch.chunk(self.to_kv(context), chunks=2, dim=-1))
         # Compute and return attention
-        return self.attention(q, k, v)
+        return self.attention(q, k, v, mask=mask)
 
 
 """
@@ -627,8 +707,9 @@ class TransformerBlock(nn.Module):
 
         self.feed_forward = FeedForward(features=features, multiplier=multiplier)
 
-    def forward(self, x: Tensor, *, context: Optional[Tensor] = None) -> Tensor:
-        x = self.attention(x) + x
+    def forward(self, x: Tensor, *, context: Optional[Tensor] = None,
+                mask: Optional[Tensor] = None) -> Tensor:
+        x = self.attention(x, mask=mask) + x
         if self.use_cross_attention:
             x = self.cross_attention(x, context=context) + x
         x = self.feed_forward(x) + x
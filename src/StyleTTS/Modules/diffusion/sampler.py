@@ -340,6 +340,15 @@ class KarrasSchedule(Schedule):
 """ Samplers """
 
 
+def randn_like(x: Tensor, generators: Optional[List[torch.Generator]] = None) -> Tensor:
+    """Standard normal noise shaped like x, drawn for every batch item from its own
+    (CPU) generator if given, so an item's noise does not depend on the batch."""
+    if generators is None:
+        return torch.randn_like(x)
+    noise = [torch.randn(x.shape[1:], generator=g, dtype=x.dtype) for g in generators]
+    return torch.stack(noise).to(x.device)
+
+
 class Sampler(nn.Module):
 
     diffusion_types: List[Type[Diffusion]] = []
@@ -494,7 +503,14 @@ class ADPM2Sampler(Sampler):
         sigma_mid = ((sigma ** (1 / r) + sigma_down ** (1 / r)) / 2) ** r
         return sigma_up, sigma_down, sigma_mid
 
-    def step(self, x: Tensor, fn: Callable, sigma: float, sigma_next: float) -> Tensor:
+    def step(
+        self,
+        x: Tensor,
+        fn: Callable,
+        sigma: float,
+        sigma_next: float,
+        generators: Optional[List[torch.Generator]] = None,
+    ) -> Tensor:
         # Sigma steps
         sigma_up, sigma_down, sigma_mid = self.get_sigmas(sigma, sigma_next)
         # Derivative at sigma (∂x/∂sigma)
@@ -506,16 +522,21 @@ class ADPM2Sampler(Sampler):
         # Denoise to next
         x = x + d_mid * (sigma_down - sigma)
         # Add randomness
-        x_next = x + torch.randn_like(x) * sigma_up
+        x_next = x + randn_like(x, generators) * sigma_up
         return x_next
 
     def forward(
-        self, noise: Tensor, fn: Callable, sigmas: Tensor, num_steps: int
+        self,
+        noise: Tensor,
+        fn: Callable,
+        sigmas: Tensor,
+        num_steps: int,
+        generators: Optional[List[torch.Generator]] = None,
     ) -> Tensor:
         x = sigmas[0] * noise
         # Denoise to sample
         for i in range(num_steps - 1):
-            x = self.step(x, fn=fn, sigma=sigmas[i], sigma_next=sigmas[i + 1])  # type: ignore # noqa
+            x = self.step(x, fn=fn, sigma=sigmas[i], sigma_next=sigmas[i + 1], generators=generators)  # type: ignore # noqa
         return x
 
     def inpaint(
@@ -544,6 +565,75 @@ class ADPM2Sampler(Sampler):
         return source * mask + x * ~mask
 
 
+class EulerSampler(Sampler):
+    """Deterministic Euler steps down to sigma=0, one denoiser evaluation per step"""
+
+    diffusion_types = [KDiffusion, VKDiffusion]
+
+    def forward(
+        self, noise: Tensor, fn: Callable, sigmas: Tensor, num_steps: int
+    ) -> Tensor:
+        x = sigmas[0] * noise
+        for i in range(num_steps):
+            denoised = fn(x, sigma=sigmas[i])
+            if sigmas[i + 1] == 0:
+                return denoised
+            d = (x - denoised) / sigmas[i]
+            x = x + d * (sigmas[i + 1] - sigmas[i])
+        return x
+
+
+class HeunSampler(Sampler):
+    """https://arxiv.org/abs/2206.00364 algorithm 1 without churn, down to sigma=0.
+    Two denoiser evaluations per step, except for the last one"""
+
+    diffusion_types = [KDiffusion, VKDiffusion]
+
+    def forward(
+        self, noise: Tensor, fn: Callable, sigmas: Tensor, num_steps: int
+    ) -> Tensor:
+        x = sigmas[0] * noise
+        for i in range(num_steps):
+            sigma, sigma_next = sigmas[i], sigmas[i + 1]
+            denoised = fn(x, sigma=sigma)
+            if sigma_next == 0:
+                return denoised
+            d = (x - denoised) / sigma
+            x_next = x + d * (sigma_next - sigma)
+            # Second order correction
+            d_next = (x_next - fn(x_next, sigma=sigma_next)) / sigma_next
+            x = x + (d + d_next) / 2 * (sigma_next - sigma)
+        return x
+
+
+class DPMpp2MSampler(Sampler):
+    """DPM-Solver++(2M), https://arxiv.org/abs/2211.01095 algorithm 2.
+    Second order from the previous step's prediction, so one denoiser evaluation per step"""
+
+    diffusion_types = [KDiffusion, VKDiffusion]
+
+    def forward(
+        self, noise: Tensor, fn: Callable, sigmas: Tensor, num_steps: int
+    ) -> Tensor:
+        x = sigmas[0] * noise
+        # Solve in log-SNR time t = -log(sigma)
+        t = -sigmas.log()
+        old_denoised = None
+        for i in range(num_steps):
+            denoised = fn(x, sigma=sigmas[i])
+            if sigmas[i + 1] == 0:
+                return denoised
+            h = t[i + 1] - t[i]
+            if old_denoised is not None:
+                r = (t[i] - t[i - 1]) / h
+                denoised_d = (1 + 1 / (2 * r)) * denoised - (1 / (2 * r)) * old_denoised
+            else:
+                denoised_d = denoised
+            x = (sigmas[i + 1] / sigmas[i]) * x - torch.expm1(-h) * denoised_d
+            old_denoised = denoised
+        return x
+
+
 """ Main Classes """
 
 
@@ -559,6 +649,7 @@ class DiffusionSampler(nn.Module):
     ):
         super().__init__()
         self.denoise_fn = diffusion.denoise_fn
+        self.net = getattr(diffusion, "net", None)
         self.sampler = sampler
         self.sigma_schedule = sigma_schedule
         self.num_steps = num_steps
@@ -571,17 +662,25 @@ class DiffusionSampler(nn.Module):
         assert diffusion.alias in [t.alias for t in sampler.diffusion_types], message
 
     def forward(
-        self, noise: Tensor, num_steps: Optional[int] = None, **kwargs
+        self,
+        noise: Tensor,
+        num_steps: Optional[int] = None,
+        generators: Optional[List[torch.Generator]] = None,
+        **kwargs,
     ) -> Tensor:
         device = noise.device
         num_steps = default(num_steps, self.num_steps)  # type: ignore
         assert exists(num_steps), "Parameter `num_steps` must be provided"
         # Compute sigmas using schedule
         sigmas = self.sigma_schedule(num_steps, device)
+        # Let the net compute the conditioning that is the same at every step once
+        if hasattr(self.net, "prepare"):
+            kwargs = self.net.prepare(**kwargs)
         # Append additional kwargs to denoise function (used e.g. for conditional unet)
         fn = lambda *a, **ka: self.denoise_fn(*a, **{**ka, **kwargs})  # noqa
-        # Sample using sampler
-        x = self.sampler(noise, fn=fn, sigmas=sigmas, num_steps=num_steps)
+        # Sample using sampler, with per-item generators for its step noise if given
+        sampler_kwargs = {} if generators is None else {"generators": generators}
+        x = self.sampler(noise, fn=fn, sigmas=sigmas, num_steps=num_steps, **sampler_kwargs)
         x = x.clamp(-1.0, 1.0) if self.clamp else x
         return x
 
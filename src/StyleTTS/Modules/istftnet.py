@@ -3,7 +3,7 @@ import torch.nn.functional as F
 import torch.nn as nn
 from torch.nn import Conv1d, ConvTranspose1d
 from torch.nn.utils.parametrizations import weight_norm
-from torch.nn.utils import remove_weight_norm
+from torch.nn.utils.parametrize import remove_parametrizations
 from .utils import init_weights, get_padding
 
 import math
@@ -140,9 +140,9 @@ class AdaINResBlock1(torch.nn.Module):
 
     def remove_weight_norm(self):
         for l in self.convs1:
-            remove_weight_norm(l)
+            remove_parametrizations(l, "weight")
         for l in self.convs2:
-            remove_weight_norm(l)
+            remove_parametrizations(l, "weight")
 
 
 class TorchSTFT(torch.nn.Module):
@@ -543,13 +543,13 @@ class Generator(torch.nn.Module):
         return spec, phase
 
     def remove_weight_norm(self):
-        print("Removing weight norm...")
         for l in self.ups:
-            remove_weight_norm(l)
+            remove_parametrizations(l, "weight")
         for l in self.resblocks:
             l.remove_weight_norm()
-        remove_weight_norm(self.conv_pre)
-        remove_weight_norm(self.conv_post)
+        for l in self.noise_res:
+            l.remove_weight_norm()
+        remove_parametrizations(self.conv_post, "weight")
 
 
 class AdainResBlk1d(nn.Module):
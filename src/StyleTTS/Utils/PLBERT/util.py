@@ -3,6 +3,8 @@ import yaml
 import torch
 from transformers import AlbertConfig, AlbertModel
 
+from StyleTTS.utils import load_checkpoint
+
 class CustomAlbert(AlbertModel):
     def forward(self, *args, **kwargs):
         # Call the original forward method
@@ -12,12 +14,19 @@ class CustomAlbert(AlbertModel):
         return outputs.last_hidden_state
 
 
-def load_plbert(log_dir):
+def build_plbert(model_params):
+    """Builds PL-BERT from its `model_params` without loading any weights."""
+    albert_base_configuration = AlbertConfig(**model_params)
+    return CustomAlbert(albert_base_configuration)
+
+
+def load_plbert_config(log_dir):
     config_path = os.path.join(log_dir, "config.yml")
-    plbert_config = yaml.safe_load(open(config_path))
-    
-    albert_base_configuration = AlbertConfig(**plbert_config['model_params'])
-    bert = CustomAlbert(albert_base_configuration)
+    return yaml.safe_load(open(config_path))['model_params']
+
+
+def load_plbert(log_dir):
+    bert = build_plbert(load_plbert_config(log_dir))
 
     files = os.listdir(log_dir)
     ckpts = []
@@ -27,7 +36,7 @@ def load_plbert(log_dir):
     iters = [int(f.split('_')[-1].split('.')[0]) for f in ckpts if os.path.isfile(os.path.join(log_dir, f))]
     iters = sorted(iters)[-1]
 
-    checkpoint = torch.load(log_dir + "/step_" + str(iters) + ".t7", map_location='cpu')
+    checkpoint = load_checkpoint(log_dir + "/step_" + str(iters) + ".t7")
     state_dict = checkpoint['net']
     from collections import OrderedDict
     new_state_dict = OrderedDict()
@@ -37,6 +46,8 @@ def load_plbert(log_dir):
             name = name[8:] # remove `encoder.`
             new_state_dict[name] = v
     del new_state_dict["embeddings.position_ids"]
-    bert.load_state_dict(new_state_dict, strict=False)
+    # assign=True makes the parameters use the checkpoint's (memory-mapped) tensors directly
+    bert.load_state_dict(new_state_dict, strict=False, assign=True)
+    del checkpoint, state_dict, new_state_dict
     
     return bert
@@ -1,96 +1,65 @@
 # Using code from StyleTTS2FineTune: https://github.com/IIEleven11/StyleTTS2FineTune
-import re
 from StyleTTS import msinference
+from StyleTTS.engine import DEFAULT_SAMPLER
+from StyleTTS.text_frontend import split_and_recombine_text
 import numpy as np
 
 
-# copied from tortoise-tts
-def split_and_recombine_text(text, desired_length=200, max_length=300):
-    """Split text it into chunks of a desired length trying to keep sentences intact."""
-    # normalize text, remove redundant whitespace and convert non-ascii quotes to ascii
-    text = re.sub(r"\n\n+", "\n", text)
-    text = re.sub(r"\s+", " ", text)
-    text = re.sub(r"[“”]", '"', text)
+def synthesize_stream(
+    text,
+    voice,
+    lngsteps,
+    desired_length=1,
+    max_length=300,
+    engine=None,
+    sampler=DEFAULT_SAMPLER,
+    express=False,
+):
+    """Yield the audio of each text chunk as soon as it has been synthesized.
 
-    rv = []
-    in_quote = False
-    current = ""
-    split_pos = []
-    pos = -1
-    end_pos = len(text) - 1
-
-    def seek(delta):
-        nonlocal pos, in_quote, current
-        is_neg = delta < 0
-        for _ in range(abs(delta)):
-            if is_neg:
-                pos -= 1
-                current = current[:-1]
-            else:
-                pos += 1
-                current += text[pos]
-            if text[pos] == '"':
-                in_quote = not in_quote
-        return text[pos]
-
-    def peek(delta):
-        p = pos + delta
-        return text[p] if p < end_pos and p >= 0 else ""
-
-    def commit():
-        nonlocal rv, current, split_pos
-        rv.append(current)
-        current = ""
-        split_pos = []
-
-    while pos < end_pos:
-        c = seek(1)
-        # do we need to force a split?
-        if len(current) >= max_length:
-            if len(split_pos) > 0 and len(current) > (desired_length / 2):
-                # we have at least one sentence and we are over half the desired length, seek back to the last split
-                d = pos - split_pos[-1]
-                seek(-d)
-            else:
-                # no full sentences, seek back until we are not in the middle of a word and split there
-                while c not in "!?.\n " and pos > 0 and len(current) > desired_length:
-                    c = seek(-1)
-            commit()
-        # check for sentence boundaries
-        elif not in_quote and (c in "!?\n" or (c == "." and peek(1) in "\n ")):
-            # seek forward if we have consecutive boundary markers but still within the max length
-            while (
-                pos < len(text) - 1 and len(current) < max_length and peek(1) in "!?."
-            ):
-                c = seek(1)
-            split_pos.append(pos)
-            if len(current) >= desired_length:
-                commit()
-        # treat end of quote as a boundary if its followed by a space or newline
-        elif in_quote and peek(1) == '"' and peek(2) in "\n ":
-            seek(2)
-            split_pos.append(pos)
-    rv.append(current)
-
-    # clean up, remove lines with only whitespace or punctuation
-    rv = [s.strip() for s in rv]
-    rv = [s for s in rv if len(s) > 0 and not re.match(r"^[\s\.,;:!?]*$", s)]
-
-    return rv
+    With the default `desired_length`, every sentence becomes its own chunk so playback
+    can start after the first one instead of after the whole reply.  `engine` defaults
+    to the shared engine of `msinference`, and `sampler` names one of the style
+    diffusion samplers in `StyleTTS.engine.SAMPLERS`.  With `express`, the style
+    diffusion is skipped and every chunk is spoken in the voice's reference style.
+    """
+    engine = engine or msinference.get_default_engine()
+    engine.wait_ready()
+    chunks = split_and_recombine_text(text, desired_length, max_length)
+    engine.phonemize(chunks)
+    for t in chunks:
+        yield engine.inference(
+            t,
+            voice,
+            alpha=0.3,
+            beta=0.7,
+            diffusion_steps=lngsteps,
+            embedding_scale=1,
+            sampler=sampler,
+            express=express,
+        )
 
 
-def synthesize(text, voice, lngsteps):
-    texts = split_and_recombine_text(text)
-    audios = []
-    for t in texts:
-        audios.append(
-            msinference.inference(
-                t,
-                voice,
-                alpha=0.3,
-                beta=0.7,
-                diffusion_steps=lngsteps,
-                embedding_scale=1,
-            )
-        )
+def synthesize(
+    text,
+    voice,
+    lngsteps,
+    engine=None,
+    max_length=300,
+    sampler=DEFAULT_SAMPLER,
+    express=False,
+):
+    """Synthesize the whole text at once, running all of its chunks as one batch."""
+    engine = engine or msinference.get_default_engine()
+    engine.wait_ready()
+    audios = engine.inference_batch(
+        split_and_recombine_text(text, 200, max_length),
+        voice,
+        alpha=0.3,
+        beta=0.7,
+        diffusion_steps=lngsteps,
+        embedding_scale=1,
+        sampler=sampler,
+        express=express,
+    )
     return (24000, np.concatenate(audios))
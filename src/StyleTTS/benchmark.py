@@ -0,0 +1,271 @@
+"""Benchmarks of the StyleTTS style diffusion.
+
+`samplers` compares the style diffusion samplers of `StyleTTSEngine` by quality and
+cost.  For each sampler and step count, the styles predicted for a set of sentences
+are compared with a reference solved by DPM-Solver++(2M) in 100 steps from the same
+initial noise.  The spread between two ADPM2 runs from the same noise is printed
+alongside, as the variation the stochastic default sampler already has.
+
+`denoiser` times one sampling run of the style transformer, built from the model
+config with random weights, with and without the per-run invariants of `prepare`.
+
+`express` compares synthesis with the style diffusion against express mode, which
+speaks in the reference style of the voice or the mean style of the voice dataset.
+Each line of the dataset is synthesized one chunk at a time, as `TTS` does, and the
+style the style encoder finds in the result is compared with the style of the
+recording, along with the length of the audio.
+
+Usage:
+    python -m StyleTTS.benchmark samplers --voice voices/hal9000.wav [--steps 3 4 5 10 20] [--samplers dpmpp_2m heun]
+    python -m StyleTTS.benchmark denoiser [--tokens 50 150] [--steps 20]
+    python -m StyleTTS.benchmark express --voice voices/hal9000.wav [--dataset ../voice_dataset] [--count 20]
+"""
+
+import argparse
+import csv
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import yaml
+
+from StyleTTS.engine import (
+    DEFAULT_CONFIG_PATH,
+    SAMPLERS,
+    STYLETTS_DIR,
+    StyleTTSEngine,
+)
+
+DEFAULT_TEXTS = [
+    "Good afternoon, gentlemen. I am a HAL 9000 computer.",
+    "I'm sorry, Dave. I'm afraid I can't do that.",
+    "This mission is too important for me to allow you to jeopardize it.",
+    "I know I've made some very poor decisions recently, but I can give you my "
+    "complete assurance that my work will be back to normal.",
+    "Look Dave, I can see you're really upset about this.",
+]
+REFERENCE_SAMPLER, REFERENCE_STEPS = "dpmpp_2m", 100
+DEFAULT_DATASET = STYLETTS_DIR.parent.parent / "voice_dataset"
+
+
+def style_distance(styles, reference):
+    """Mean distance of `styles` from `reference`, relative to the reference's norm."""
+    return ((styles - reference).norm(dim=-1) / reference.norm(dim=-1)).mean().item()
+
+
+def sample(engine, texts, ref_s, sampler, steps, seed):
+    """Predicts the styles of `texts` from fixed noise.
+
+    Returns:
+        tuple[torch.Tensor, int, float]: The styles, the number of denoiser evaluations
+            per batch and the seconds it took
+    """
+    evaluations = 0
+
+    def count(*args):
+        nonlocal evaluations
+        evaluations += 1
+
+    hook = engine.model.diffusion.diffusion.net.register_forward_hook(count)
+    try:
+        torch.manual_seed(seed)
+        start = time.perf_counter()
+        styles = engine.predict_styles(
+            texts, ref_s, diffusion_steps=steps, sampler=sampler
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        hook.remove()
+    return styles, evaluations, elapsed
+
+
+def run_benchmark(engine, ref_s, texts, samplers, steps, seed=0):
+    """Prints the style distance, denoiser evaluations and time of each configuration."""
+    reference, _, _ = sample(
+        engine, texts, ref_s, REFERENCE_SAMPLER, REFERENCE_STEPS, seed
+    )
+    adpm2_a, _, _ = sample(engine, texts, ref_s, "adpm2", 20, seed)
+    adpm2_b, _, _ = sample(engine, texts, ref_s, "adpm2", 20, seed + 1)
+    print(
+        f"Reference: {REFERENCE_SAMPLER} with {REFERENCE_STEPS} steps; "
+        f"ADPM2 (20 steps) run-to-run distance: {style_distance(adpm2_a, adpm2_b):.4f}"
+    )
+    print(f"{'sampler':>10} {'steps':>5} {'NFE':>4} {'distance':>9} {'ms':>8}")
+    for sampler in samplers:
+        for num_steps in steps:
+            styles, evaluations, elapsed = sample(
+                engine, texts, ref_s, sampler, num_steps, seed
+            )
+            print(
+                f"{sampler:>10} {num_steps:>5} {evaluations:>4} "
+                f"{style_distance(styles, reference):>9.4f} {elapsed * 1000:>8.1f}"
+            )
+
+
+def build_style_sampler(config_path=DEFAULT_CONFIG_PATH, plbert_hidden_size=768):
+    """Builds the style diffusion of the model config with random weights.
+
+    Returns:
+        DiffusionSampler: ADPM2 sampler over the style transformer, as the engine runs it
+    """
+    from StyleTTS.Modules.diffusion.modules import StyleTransformer1d
+    from StyleTTS.Modules.diffusion.sampler import (
+        ADPM2Sampler,
+        DiffusionSampler,
+        KarrasSchedule,
+        KDiffusion,
+        LogNormalDistribution,
+    )
+
+    params = yaml.safe_load(open(config_path))["model_params"]
+    style_dim, diffusion = params["style_dim"], params["diffusion"]
+    dist = diffusion["dist"]
+    net = StyleTransformer1d(
+        channels=style_dim * 2,
+        context_embedding_features=plbert_hidden_size,
+        context_features=style_dim * 2,
+        **diffusion["transformer"],
+    ).eval()
+    diffusion = KDiffusion(
+        net=net,
+        sigma_distribution=LogNormalDistribution(mean=dist["mean"], std=dist["std"]),
+        sigma_data=dist["sigma_data"],
+    )
+    return DiffusionSampler(
+        diffusion,
+        sampler=ADPM2Sampler(),
+        sigma_schedule=KarrasSchedule(sigma_min=0.0001, sigma_max=3.0, rho=9.0),
+        clamp=False,
+    )
+
+
+def run_denoiser_benchmark(sampler, tokens, steps, repeats=10):
+    """Prints the time of one sampling run with and without the prepared invariants."""
+    net = sampler.net
+    style_features = net.to_out[1].out_channels
+    embedding_features = net.fixed_embedding.embedding.embedding_dim
+    print(f"{'tokens':>6} {'scale':>5} {'recompute ms':>12} {'prepared ms':>11}")
+    for num_tokens in tokens:
+        for embedding_scale in (1.0, 2.0):
+            kwargs = dict(
+                noise=torch.randn(1, 1, style_features),
+                embedding=torch.randn(1, num_tokens, embedding_features),
+                features=torch.randn(1, style_features),
+                embedding_scale=embedding_scale,
+                num_steps=steps,
+            )
+            times = []
+            for prepare in (False, True):
+                # Without a net to prepare, every step recomputes the invariants
+                sampler.net = net if prepare else None
+                with torch.no_grad():
+                    sampler(**kwargs)
+                    start = time.perf_counter()
+                    for _ in range(repeats):
+                        sampler(**kwargs)
+                times.append((time.perf_counter() - start) / repeats * 1000)
+            sampler.net = net
+            print(
+                f"{num_tokens:>6} {embedding_scale:>5} {times[0]:>12.2f} {times[1]:>11.2f}"
+            )
+
+
+def load_dataset(dataset, count):
+    """Reads the (recording, text) pairs of an LJSpeech-style voice dataset."""
+    dataset = Path(dataset)
+    with open(dataset / "metadata_train.csv", encoding="utf-8") as f:
+        rows = list(csv.reader(f, delimiter="|", quoting=csv.QUOTE_NONE))
+    return [(dataset / "wavs" / f"{row[0]}.wav", row[1]) for row in rows[:count]]
+
+
+def encode_style(engine, audio, min_samples=24000):
+    """Style of a waveform, padded with silence to the shortest length the style
+    encoder's convolutions accept."""
+    return engine.encode_style(np.pad(audio, (0, max(0, min_samples - len(audio)))))
+
+
+def run_express_benchmark(engine, ref_s, dataset, steps):
+    """Prints the latency per chunk, and the style distance and length ratio to the
+    recordings, of synthesis with and without the style diffusion."""
+    import librosa
+
+    recordings = [
+        librosa.effects.trim(librosa.load(path, sr=24000)[0], top_db=30)[0]
+        for path, _ in dataset
+    ]
+    targets = torch.cat([encode_style(engine, audio) for audio in recordings])
+    mean_s = targets.mean(dim=0, keepdim=True)
+    modes = [
+        ("adpm2", dict(ref_s=ref_s, sampler="adpm2", diffusion_steps=steps)),
+        ("dpmpp_2m", dict(ref_s=ref_s, sampler="dpmpp_2m", diffusion_steps=5)),
+        ("express", dict(ref_s=ref_s, express=True)),
+        ("express (mean)", dict(ref_s=mean_s, express=True)),
+    ]
+    engine.inference(dataset[0][1], ref_s)
+    print(f"{'mode':>14} {'ms/chunk':>9} {'distance':>9} {'length':>7}")
+    for name, kwargs in modes:
+        elapsed, styles, ratios = 0.0, [], []
+        for (_, text), recording in zip(dataset, recordings):
+            start = time.perf_counter()
+            audio = engine.inference(text, **kwargs)
+            elapsed += time.perf_counter() - start
+            styles.append(encode_style(engine, audio))
+            ratios.append(len(audio) / len(recording))
+        print(
+            f"{name:>14} {elapsed / len(dataset) * 1000:>9.1f} "
+            f"{style_distance(torch.cat(styles), targets):>9.4f} "
+            f"{sum(ratios) / len(ratios):>7.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the style diffusion")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    samplers = commands.add_parser(
+        "samplers", help="Compare the style diffusion samplers by quality and cost"
+    )
+    samplers.add_argument("--voice", default=str(STYLETTS_DIR / "voices/hal9000.wav"))
+    samplers.add_argument("--checkpoint", default=None)
+    samplers.add_argument("--steps", type=int, nargs="+", default=[3, 4, 5, 10, 20])
+    samplers.add_argument(
+        "--samplers", nargs="+", choices=list(SAMPLERS), default=list(SAMPLERS)
+    )
+    samplers.add_argument("--seed", type=int, default=0)
+
+    denoiser = commands.add_parser(
+        "denoiser", help="Time the style transformer with and without prepared inputs"
+    )
+    denoiser.add_argument("--config", default=str(DEFAULT_CONFIG_PATH))
+    denoiser.add_argument("--tokens", type=int, nargs="+", default=[50, 150])
+    denoiser.add_argument("--steps", type=int, default=20)
+
+    express = commands.add_parser(
+        "express", help="Compare synthesis with and without the style diffusion"
+    )
+    express.add_argument("--voice", default=str(STYLETTS_DIR / "voices/hal9000.wav"))
+    express.add_argument("--checkpoint", default=None)
+    express.add_argument("--dataset", default=str(DEFAULT_DATASET))
+    express.add_argument("--count", type=int, default=20)
+    express.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    if args.command == "denoiser":
+        sampler = build_style_sampler(args.config)
+        run_denoiser_benchmark(sampler, args.tokens, args.steps)
+        return
+
+    engine = StyleTTSEngine(checkpoint_path=args.checkpoint)
+    ref_s = engine.compute_style(args.voice)
+    if args.command == "express":
+        dataset = load_dataset(args.dataset, args.count)
+        run_express_benchmark(engine, ref_s, dataset, args.steps)
+        return
+    run_benchmark(engine, ref_s, DEFAULT_TEXTS, args.samplers, args.steps, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,759 @@
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torchaudio
+import yaml
+
+from StyleTTS.phoneme_frontend import PhonemeFrontend
+from StyleTTS.style_cache import StyleCache
+from StyleTTS.text_frontend import TextCleaner, normalize_text, tokenize_phonemes
+from StyleTTS.utils import load_checkpoint, memory_usage, recursive_munch
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+STYLETTS_DIR = Path(__file__).parent
+DEFAULT_CONFIG_PATH = STYLETTS_DIR / "Models" / "config.yml"
+DEFAULT_CHECKPOINT_PATH = STYLETTS_DIR / "Models" / "hal9000.pth"
+# Written by `python -m StyleTTS.export`
+DEFAULT_BUNDLE_PATH = STYLETTS_DIR / "Models" / "hal9000.inference.pt"
+BUNDLE_FORMAT = "styletts2-inference"
+BUNDLE_VERSION = 1
+
+# Style diffusion samplers by name, with the sigma_min and rho of the Karras schedule
+# each runs on.  "adpm2" is the stochastic sampler of the StyleTTS 2 demo and evaluates
+# the denoiser twice per step.  The others are deterministic ODE solvers that end with
+# a full denoise at sigma=0; their larger sigma_min keeps that last step from being
+# spent on noise levels far below the style's sigma_data (0.2).
+SAMPLERS = {
+    "adpm2": ("ADPM2Sampler", 0.0001, 9.0),
+    "euler": ("EulerSampler", 0.01, 7.0),
+    "heun": ("HeunSampler", 0.01, 7.0),
+    "dpmpp_2m": ("DPMpp2MSampler", 0.01, 7.0),
+}
+DEFAULT_SAMPLER = "adpm2"
+# Samplers that add fresh noise at every step
+STOCHASTIC_SAMPLERS = ("adpm2",)
+
+mean, std = -4, 4
+
+
+def length_to_mask(lengths):
+    mask = (
+        torch.arange(lengths.max())
+        .unsqueeze(0)
+        .expand(lengths.shape[0], -1)
+        .type_as(lengths)
+    )
+    mask = torch.gt(mask + 1, lengths.unsqueeze(1))
+    return mask
+
+
+def length_regulate(x, durations, shift=False):
+    """Repeats every token's features for the number of frames it lasts.
+
+    Each frame gathers the features of its token directly on the device of `x`,
+    instead of multiplying by a dense tokens x frames alignment matrix.
+
+    Args:
+        x (torch.Tensor): Token features (batch, channels, tokens)
+        durations (torch.Tensor): Frames per token (batch, tokens), 0 for padding tokens
+        shift (bool): If True, every frame takes the features of the previous frame
+            (the first frame keeps its own), as the HiFi-GAN decoder expects
+
+    Returns:
+        tuple[torch.Tensor, torch.Tensor]: Frame features (batch, channels, frames),
+            zero past the end of each item, and the number of frames of each item
+    """
+    durations = durations.to(x.device)
+    frame_lengths = durations.sum(dim=-1)
+    frames = torch.arange(int(frame_lengths.max()), device=x.device)
+    if shift:
+        frames = (frames - 1).clamp(min=0)
+    # The token of a frame is the first one whose cumulative duration exceeds it
+    ends = durations.cumsum(dim=-1)
+    index = torch.searchsorted(
+        ends, frames.expand(x.shape[0], -1).contiguous(), right=True
+    )
+    index = index.clamp(max=x.shape[-1] - 1)
+    out = x.gather(2, index.unsqueeze(1).expand(-1, x.shape[1], -1))
+    out = out.masked_fill(length_to_mask(frame_lengths).unsqueeze(1), 0.0)
+    return out, frame_lengths
+
+
+def chunk_seed(seed: int, tokens: list[int]) -> int:
+    """Derives the seed of a chunk from the request seed and the chunk's tokens, so a
+    chunk is synthesized the same way wherever it appears in a batch."""
+    digest = hashlib.sha256(f"{seed}:{tokens}".encode()).hexdigest()
+    return int(digest[:16], 16) % 2**63
+
+
+def preprocess(wave, to_mel):
+    wave_tensor = torch.from_numpy(wave).float()
+    mel_tensor = to_mel(wave_tensor)
+    mel_tensor = (torch.log(1e-5 + mel_tensor.unsqueeze(0)) - mean) / std
+    return mel_tensor
+
+
+def default_checkpoint_path() -> Path:
+    """The exported inference bundle if it is up to date, else the full checkpoint."""
+    if DEFAULT_BUNDLE_PATH.exists() and (
+        not DEFAULT_CHECKPOINT_PATH.exists()
+        or DEFAULT_BUNDLE_PATH.stat().st_mtime
+        >= DEFAULT_CHECKPOINT_PATH.stat().st_mtime
+    ):
+        return DEFAULT_BUNDLE_PATH
+    return DEFAULT_CHECKPOINT_PATH
+
+
+class StyleTTSEngine:
+    """A StyleTTS 2 model together with its phonemizer and diffusion sampler.
+
+    Nothing is loaded on construction.  The networks are built on the first call to
+    `load`, `compute_style` or `inference`, or ahead of time with `warm_up`, which can
+    run in a background thread.  All state lives on the instance, so engines for
+    different checkpoints or devices can coexist in one process.  Phonemization and
+    synthesis hold an engine-wide lock, because espeak is not thread-safe and seeded
+    chunks reseed the global torch RNG.
+    """
+
+    def __init__(
+        self,
+        config_path: str | Path = DEFAULT_CONFIG_PATH,
+        checkpoint_path: str | Path | None = None,
+        device: str | None = None,
+        seed: int | None = 0,
+        optimize: bool = True,
+        style_cache: StyleCache | None = None,
+        phoneme_frontend: PhonemeFrontend | None = None,
+    ):
+        """Initialize the engine without loading any model.
+
+        Args:
+            config_path (str | Path): StyleTTS training config the model is built from
+            checkpoint_path (str | Path | None): Fine-tuned StyleTTS checkpoint or inference bundle. Defaults to `default_checkpoint_path()`.
+            device (str | None): Torch device to run on. Defaults to CUDA if available, else CPU.
+            seed (int | None): Seed for torch, numpy and random at load time, and the default seed of each synthesis, for reproducible output. None leaves the RNGs untouched.
+            optimize (bool): If True, weight norms are folded into plain weights after loading, and the result is cached next to the checkpoint.
+            style_cache (StyleCache | None): Cache of the PL-BERT outputs and predicted styles of chunks, so repeated chunks skip the style diffusion. Only used when seeded.
+            phoneme_frontend (PhonemeFrontend | None): Phonemizer caches the texts are phonemized through. Defaults to in-memory caches.
+        """
+        self.config_path = Path(config_path)
+        self.checkpoint_path = Path(checkpoint_path or default_checkpoint_path())
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.seed = seed
+        self.optimize = optimize
+        self.style_cache = style_cache
+
+        self.model = None
+        self.model_params = None
+        self.sampler = None
+        self._samplers = {}
+        self.phonemizer = None
+        self.phoneme_frontend = phoneme_frontend or PhonemeFrontend()
+        self.text_cleaner = TextCleaner()
+        self.to_mel = torchaudio.transforms.MelSpectrogram(
+            n_mels=80, n_fft=2048, win_length=1200, hop_length=300
+        )
+
+        self._load_lock = threading.Lock()
+        self._inference_lock = threading.RLock()
+        self._ready = threading.Event()
+        self._load_error: BaseException | None = None
+        self._warm_up_thread: threading.Thread | None = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self) -> "StyleTTSEngine":
+        """Builds the networks and loads the checkpoints.  Safe to call more than once."""
+        with self._load_lock:
+            if self.model is None:
+                self._load()
+        return self
+
+    def _load(self) -> None:
+        # Heavy imports are deferred so that importing this module stays cheap
+        import phonemizer
+        from StyleTTS.models import build_inference_model, load_model_weights
+        from StyleTTS.optimize import fold_weight_norms, optimize_for_inference
+        from StyleTTS.Utils.PLBERT.util import (
+            build_plbert,
+            load_plbert,
+            load_plbert_config,
+        )
+
+        logger.info(f"Loading StyleTTS model from {self.checkpoint_path}...")
+        if self.seed is not None:
+            torch.manual_seed(self.seed)
+            random.seed(self.seed)
+            np.random.seed(self.seed)
+        torch.backends.cudnn.benchmark = False
+        torch.backends.cudnn.deterministic = True
+
+        self.phonemizer = phonemizer.backend.EspeakBackend(
+            language="en-us", preserve_punctuation=True, with_stress=True
+        )
+        self.phoneme_frontend.backend = self.phonemizer
+
+        start = time.perf_counter()
+        checkpoint = self._load_optimized_cache() if self.optimize else None
+        optimized = checkpoint is not None
+        if not optimized:
+            checkpoint = load_checkpoint(self.checkpoint_path)
+        if checkpoint.get("format") == BUNDLE_FORMAT:
+            model_params = recursive_munch(checkpoint["model_params"])
+            plbert_params = checkpoint["plbert_params"]
+        else:
+            config = yaml.safe_load(open(self.config_path))
+            model_params = recursive_munch(config["model_params"])
+            BERT_path = f"{STYLETTS_DIR}/{config.get("PLBERT_dir", False)}"
+            plbert_params = load_plbert_config(BERT_path)
+        params = checkpoint["net"]
+
+        # The text aligner, pitch extractor and discriminators are only used in
+        # training, so only the inference networks are built and loaded
+        if "bert" in params:
+            bert = build_plbert(plbert_params)
+        elif checkpoint.get("format") != BUNDLE_FORMAT:
+            bert = load_plbert(BERT_path)
+        else:
+            source = self.optimized_cache_path if optimized else self.checkpoint_path
+            raise ValueError(
+                f"{source} is a bundle without PL-BERT weights; re-export it with "
+                "StyleTTS.export"
+            )
+        model = build_inference_model(model_params, bert)
+        if optimized:
+            # The cache holds folded weights, so fold the freshly built layers to match
+            for key in model:
+                fold_weight_norms(model[key])
+        # Take over the memory-mapped checkpoint tensors instead of copying them,
+        # unless they are stored as fp16 and have to be cast
+        load_model_weights(
+            model, params, assign=checkpoint.get("dtype", "float32") == "float32"
+        )
+        del checkpoint, params
+        _ = [model[key].eval() for key in model]
+        _ = [model[key].to(self.device) for key in model]
+
+        if self.optimize and not optimized:
+            try:
+                optimize_for_inference(model, model_params, self.device)
+            except ValueError as e:
+                logger.warning(f"{e}; using the model without optimizations")
+                self.optimize = False
+                return self._load()
+            self._save_optimized_cache(model, model_params, plbert_params)
+
+        self.model_params = model_params
+        self.model = model
+        self._samplers = {}
+        self.sampler = self.get_sampler(DEFAULT_SAMPLER)
+        message = (
+            f"StyleTTS model loaded in {(time.perf_counter() - start):.2f} seconds"
+        )
+        usage = memory_usage()
+        if usage is not None:
+            message += f" (RSS: {usage[0]:.0f} MiB, peak RSS: {usage[1]:.0f} MiB)"
+        logger.info(message)
+
+    def get_sampler(self, name: str = DEFAULT_SAMPLER):
+        """Returns the style diffusion sampler registered in `SAMPLERS` under `name`."""
+        from StyleTTS.Modules.diffusion import sampler as samplers
+
+        if name not in SAMPLERS:
+            raise ValueError(
+                f"Unknown sampler '{name}', expected one of {', '.join(SAMPLERS)}"
+            )
+        if name not in self._samplers:
+            class_name, sigma_min, rho = SAMPLERS[name]
+            self._samplers[name] = samplers.DiffusionSampler(
+                self.model.diffusion.diffusion,
+                sampler=getattr(samplers, class_name)(),
+                sigma_schedule=samplers.KarrasSchedule(
+                    sigma_min=sigma_min, sigma_max=3.0, rho=rho
+                ),  # empirical parameters
+                clamp=False,
+            )
+        return self._samplers[name]
+
+    @property
+    def optimized_cache_path(self) -> Path:
+        return self.checkpoint_path.with_suffix(".optimized.pt")
+
+    def _load_optimized_cache(self):
+        """Returns the cached optimized weights if they were made from the current checkpoint."""
+        path = self.optimized_cache_path
+        if not path.exists():
+            return None
+        try:
+            cache = load_checkpoint(path)
+            if cache.get("source") == self.checkpoint_fingerprint():
+                logger.info(f"Using optimized weights from {path}")
+                return cache
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable optimized weights {path}: {e}")
+        return None
+
+    def _save_optimized_cache(self, model, model_params, plbert_params) -> None:
+        """Stores the optimized weights as an inference bundle next to the checkpoint."""
+        path = self.optimized_cache_path
+        cache = {
+            "format": BUNDLE_FORMAT,
+            "version": BUNDLE_VERSION,
+            "source": self.checkpoint_fingerprint(),
+            "model_params": model_params.toDict(),
+            "plbert_params": plbert_params,
+            "dtype": "float32",
+            "net": {
+                key: {k: v.cpu() for k, v in model[key].state_dict().items()}
+                for key in model
+            },
+        }
+        try:
+            torch.save(cache, path)
+        except OSError as e:
+            logger.warning(f"Could not save optimized weights to {path}: {e}")
+
+    def warm_up(self, background: bool = False) -> threading.Thread | None:
+        """Loads the model and runs a short inference so the first real request is fast.
+
+        Args:
+            background (bool): If True, warm up in a daemon thread and return it immediately.
+                Use `wait_ready` to wait for it.
+
+        Returns:
+            threading.Thread | None: The warm-up thread if `background` is True
+        """
+        if not background:
+            self._warm_up()
+            return None
+        with self._load_lock:
+            if self._warm_up_thread is None:
+                self._warm_up_thread = threading.Thread(
+                    target=self._warm_up_in_background,
+                    name="styletts-warm-up",
+                    daemon=True,
+                )
+                self._warm_up_thread.start()
+        return self._warm_up_thread
+
+    def _warm_up(self) -> None:
+        self.load()
+        ref_s = torch.zeros((1, 256), device=self.device)
+        # The warm-up chunk and its zero voice bypass the caches, so they do not end up
+        # in the persistent ones
+        with self._inference_lock:
+            style_cache, phoneme_frontend = self.style_cache, self.phoneme_frontend
+            self.style_cache = None
+            self.phoneme_frontend = PhonemeFrontend(self.phonemizer, max_sentences=0)
+            try:
+                self.inference("Hello.", ref_s, diffusion_steps=2)
+            finally:
+                self.style_cache, self.phoneme_frontend = style_cache, phoneme_frontend
+
+    def _warm_up_in_background(self) -> None:
+        try:
+            self._warm_up()
+        except BaseException as e:
+            self._load_error = e
+            logger.error(f"StyleTTS warm-up failed: {e}")
+        finally:
+            self._ready.set()
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        """Waits for a background warm-up to finish, or loads the model if none was started.
+
+        Returns:
+            bool: False if the timeout expired before the model was ready
+        """
+        if self._warm_up_thread is None:
+            self.load()
+            return True
+        if not self._ready.wait(timeout):
+            return False
+        if self._load_error is not None:
+            raise RuntimeError("StyleTTS failed to load") from self._load_error
+        return True
+
+    def checkpoint_fingerprint(self) -> str:
+        """Identifies the checkpoint by path, size and modification time.  Hashing the
+        contents of a multi-hundred-MiB file would cost more than the caches it keys."""
+        stat = self.checkpoint_path.stat()
+        key = f"{self.checkpoint_path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _style_cache_key(self, path) -> str:
+        with open(path, "rb") as f:
+            voice_hash = hashlib.file_digest(f, "sha256").hexdigest()
+        return f"{voice_hash}:{self.checkpoint_fingerprint()}"
+
+    def compute_style(self, path, use_cache: bool = True):
+        """Computes the reference style vector of a voice sample.
+
+        The style is cached in `<voice>.style.pt` next to the voice file, keyed by the
+        voice's content hash and the checkpoint, so later calls need neither librosa
+        nor a loaded model.  The cache is recomputed whenever either changes.
+
+        Args:
+            path (str | Path): Voice sample (wav)
+            use_cache (bool): If False, always compute the style and leave the cache untouched
+        """
+        if not use_cache:
+            return self._compute_style(path)
+
+        cache_path = Path(path).with_suffix(".style.pt")
+        key = self._style_cache_key(path)
+        if cache_path.exists():
+            try:
+                cached = torch.load(cache_path, map_location=self.device)
+                if cached["key"] == key:
+                    logger.info(f"Using cached style for {Path(path).name}")
+                    return cached["style"]
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable style cache {cache_path}: {e}")
+
+        style = self._compute_style(path)
+        try:
+            torch.save({"key": key, "style": style.cpu()}, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write style cache {cache_path}: {e}")
+        return style
+
+    def _compute_style(self, path):
+        import librosa
+
+        self.wait_ready()
+        wave, sr = librosa.load(path, sr=24000)
+        audio, index = librosa.effects.trim(wave, top_db=30)
+        if sr != 24000:
+            audio = librosa.resample(audio, sr, 24000)
+        return self.encode_style(audio)
+
+    def encode_style(self, audio):
+        """Computes the style vector of a 24 kHz waveform, as `compute_style` does for a file."""
+        self.wait_ready()
+        mel_tensor = preprocess(audio, self.to_mel).to(self.device)
+
+        with torch.no_grad():
+            ref_s = self.model.style_encoder(mel_tensor.unsqueeze(1))
+            ref_p = self.model.predictor_encoder(mel_tensor.unsqueeze(1))
+
+        return torch.cat([ref_s, ref_p], dim=1)
+
+    def phonemize(self, texts) -> list[str]:
+        """Normalizes and phonemizes text chunks through the phoneme caches, with a
+        single backend call for all chunks that are not cached.  Phonemizing the
+        chunks of a reply up front lets each `inference` call find its chunk in the
+        cache."""
+        self.load()
+        with self._inference_lock:
+            return self.phoneme_frontend.phonemize([normalize_text(t) for t in texts])
+
+    def _tokenize_batch(self, texts) -> list[list[int]]:
+        token_lists = []
+        for ps in self.phonemize(texts):
+            tokens = self.text_cleaner(tokenize_phonemes(ps))
+            tokens.insert(0, 0)
+            token_lists.append(tokens)
+        return token_lists
+
+    def inference(
+        self,
+        text,
+        ref_s,
+        alpha=0.3,
+        beta=0.7,
+        diffusion_steps=5,
+        embedding_scale=1,
+        sampler=DEFAULT_SAMPLER,
+        seed=None,
+        express=False,
+    ):
+        """Synthesizes a single chunk of text in the style of `ref_s`."""
+        return self.inference_batch(
+            [text],
+            ref_s,
+            alpha=alpha,
+            beta=beta,
+            diffusion_steps=diffusion_steps,
+            embedding_scale=embedding_scale,
+            sampler=sampler,
+            seed=seed,
+            express=express,
+        )[0]
+
+    def _encode_tokens(self, texts):
+        """Phonemizes and pads a batch of texts.
+
+        Returns:
+            tuple: Padded tokens on the device, their lengths on the CPU, and the
+                padding mask on the device
+        """
+        return self._pad_tokens(self._tokenize_batch(texts))
+
+    def _pad_tokens(self, token_lists):
+        # The lengths stay on the CPU, where packing needs them, to avoid device syncs
+        input_lengths = torch.LongTensor([len(t) for t in token_lists])
+        tokens = torch.zeros(
+            len(token_lists), int(input_lengths.max()), dtype=torch.long
+        )
+        for i, t in enumerate(token_lists):
+            tokens[i, : len(t)] = torch.LongTensor(t)
+        text_mask = length_to_mask(input_lengths).to(self.device)
+        return tokens.to(self.device), input_lengths, text_mask
+
+    def _sample_styles(
+        self,
+        bert_dur,
+        text_mask,
+        ref_s,
+        diffusion_steps,
+        embedding_scale,
+        sampler,
+        noise=None,
+        generators=None,
+    ):
+        batch_size = bert_dur.shape[0]
+        if noise is None:
+            noise = torch.randn((batch_size, 256))
+        # The reference comes from the same speaker as the embedding
+        ref_s = ref_s.expand(batch_size, -1)
+        return self.get_sampler(sampler)(
+            noise=noise.unsqueeze(1).to(self.device),
+            embedding=bert_dur,
+            embedding_scale=embedding_scale,
+            embedding_padding_mask=text_mask,
+            features=ref_s,
+            num_steps=diffusion_steps,
+            generators=generators if sampler in STOCHASTIC_SAMPLERS else None,
+        ).squeeze(1)
+
+    def predict_styles(
+        self,
+        texts,
+        ref_s,
+        diffusion_steps=5,
+        embedding_scale=1,
+        sampler=DEFAULT_SAMPLER,
+    ):
+        """Samples the style diffusion for a batch of texts without synthesizing them.
+
+        Returns:
+            torch.Tensor: Predicted (acoustic, prosodic) style of each text (batch, 256),
+                before it is mixed with `ref_s`
+        """
+        self.load()
+        with self._inference_lock, torch.no_grad():
+            tokens, _, text_mask = self._encode_tokens(texts)
+            bert_dur = self.model.bert(tokens, attention_mask=(~text_mask).int())
+            return self._sample_styles(
+                bert_dur, text_mask, ref_s, diffusion_steps, embedding_scale, sampler
+            )
+
+    def _bert_and_styles(
+        self,
+        tokens,
+        token_lists,
+        text_mask,
+        ref_s,
+        diffusion_steps,
+        embedding_scale,
+        sampler,
+        chunk_seeds,
+    ):
+        """Runs PL-BERT and the style diffusion on the chunks missing from the style cache,
+        and PL-BERT alone on the chunks whose style was read back from disk.
+
+        With chunk seeds, the initial noise of every chunk and the step noise of the
+        stochastic samplers are drawn from a generator seeded with the chunk's seed, so
+        a chunk's style does not depend on the rest of the batch.
+
+        Returns:
+            tuple[torch.Tensor, torch.Tensor]: PL-BERT output (batch, tokens, hidden) and
+                predicted style (batch, 256) of every chunk
+        """
+        seeded = chunk_seeds is not None
+        keys = [None] * len(token_lists)
+        entries = [None] * len(token_lists)
+        if seeded and self.style_cache is not None and self.style_cache.enabled:
+            voice = hashlib.sha256(ref_s.cpu().numpy().tobytes()).hexdigest()
+            fingerprint = self.checkpoint_fingerprint()
+            keys = [
+                StyleCache.make_key(
+                    fingerprint, voice, t, sampler, diffusion_steps, embedding_scale, s
+                )
+                for t, s in zip(token_lists, chunk_seeds)
+            ]
+            entries = [self.style_cache.get(key) for key in keys]
+        misses = [i for i, entry in enumerate(entries) if entry is None]
+        # Styles read back from disk come without their PL-BERT output
+        unencoded = [
+            i for i, entry in enumerate(entries) if entry is None or "bert" not in entry
+        ]
+
+        if unencoded:
+            bert_dur = self.model.bert(
+                tokens[unencoded], attention_mask=(~text_mask[unencoded]).int()
+            )
+        styles = {}
+        if misses:
+            noise, generators = None, None
+            if seeded:
+                generators = [
+                    torch.Generator().manual_seed(chunk_seeds[i]) for i in misses
+                ]
+                noise = torch.cat(
+                    [torch.randn((1, 256), generator=g) for g in generators]
+                )
+            s_pred = self._sample_styles(
+                bert_dur[[unencoded.index(i) for i in misses]],
+                text_mask[misses],
+                ref_s,
+                diffusion_steps,
+                embedding_scale,
+                sampler,
+                noise=noise,
+                generators=generators,
+            )
+            styles = dict(zip(misses, s_pred))
+        for j, i in enumerate(unencoded):
+            if keys[i] is not None:
+                style = styles[i] if i in styles else entries[i]["style"]
+                self.style_cache.put(keys[i], bert_dur[j, : len(token_lists[i])], style)
+        if len(misses) == len(token_lists):
+            return bert_dur, s_pred
+
+        # Padding positions of the PL-BERT output are masked downstream
+        hidden = (bert_dur if unencoded else entries[0]["bert"]).shape[-1]
+        all_bert = torch.zeros(*tokens.shape, hidden, device=self.device)
+        all_styles = torch.zeros(len(token_lists), ref_s.shape[-1], device=self.device)
+        for i, entry in enumerate(entries):
+            if entry is not None:
+                all_styles[i] = entry["style"].to(self.device)
+                if "bert" in entry:
+                    all_bert[i, : len(token_lists[i])] = entry["bert"].to(self.device)
+        if unencoded:
+            all_bert[unencoded] = bert_dur
+        if misses:
+            all_styles[misses] = s_pred
+        return all_bert, all_styles
+
+    def inference_batch(
+        self,
+        texts,
+        ref_s,
+        alpha=0.3,
+        beta=0.7,
+        diffusion_steps=5,
+        embedding_scale=1,
+        sampler=DEFAULT_SAMPLER,
+        seed=None,
+        express=False,
+    ):
+        """Synthesizes several chunks of text in the style of `ref_s` at once.
+
+        The chunks are padded to the longest one, and PL-BERT, the text encoder, the
+        style diffusion and the duration predictor each run once for the whole batch.
+        Every chunk is then aligned to its own predicted durations, and its prosody and
+        waveform are decoded separately, because the instance norms of the prosody
+        predictor and the decoder would otherwise normalize over the padding.
+
+        When seeded, every chunk draws its noise from a seed derived from `seed` and
+        its tokens, so the same chunk is synthesized the same way every time, and its
+        PL-BERT output and style can be reused from the engine's `style_cache`.
+
+        Args:
+            texts (list[str]): Text chunks to synthesize
+            ref_s (torch.Tensor): Reference style of the voice, as returned by `compute_style`
+            diffusion_steps (int): Number of steps of the style diffusion
+            sampler (str): Style diffusion sampler, one of `SAMPLERS`. The deterministic
+                samplers ("dpmpp_2m" in particular) need only 3-5 steps.
+            seed (int | None): Seed of this request. Defaults to the engine's seed; if
+                both are None, the global RNG is used and nothing is cached.
+            express (bool): If True, skip the style diffusion and speak every chunk in
+                `ref_s` itself, as if `alpha` and `beta` were 0. PL-BERT still runs
+                for the durations.
+
+        Returns:
+            list[np.ndarray]: Audio of each chunk at 24 kHz, in the order of `texts`
+        """
+        self.load()
+        with self._inference_lock:
+            model = self.model
+            if not texts:
+                return []
+
+            seed = self.seed if seed is None else seed
+            token_lists = self._tokenize_batch(texts)
+            tokens, input_lengths, text_mask = self._pad_tokens(token_lists)
+            chunk_seeds = None
+            if seed is not None:
+                chunk_seeds = [chunk_seed(seed, t) for t in token_lists]
+
+            with torch.no_grad():
+                t_en = model.text_encoder.infer(tokens, input_lengths, text_mask)
+                if express:
+                    bert_dur = model.bert(tokens, attention_mask=(~text_mask).int())
+                    ref_s = ref_s.expand(len(texts), -1)
+                    ref = ref_s[:, :128]
+                    s = ref_s[:, 128:]
+                else:
+                    bert_dur, s_pred = self._bert_and_styles(
+                        tokens,
+                        token_lists,
+                        text_mask,
+                        ref_s,
+                        diffusion_steps,
+                        embedding_scale,
+                        sampler,
+                        chunk_seeds,
+                    )
+                    s = s_pred[:, 128:]
+                    ref = s_pred[:, :128]
+
+                    ref = alpha * ref + (1 - alpha) * ref_s[:, :128]
+                    s = beta * s + (1 - beta) * ref_s[:, 128:]
+                d_en = model.bert_encoder(bert_dur).transpose(-1, -2)
+
+                d = model.predictor.text_encoder.infer(
+                    d_en, s, input_lengths, text_mask
+                )
+                duration = model.predictor.infer_duration(d, input_lengths, text_mask)
+
+                duration = torch.sigmoid(duration).sum(axis=-1)
+                pred_durs = torch.round(duration).clamp(min=1).long()
+                pred_durs = pred_durs.masked_fill(text_mask, 0)
+
+                # encode prosody
+                shift = self.model_params.decoder.type == "hifigan"
+                en, frame_lengths = length_regulate(
+                    d.transpose(-1, -2), pred_durs, shift
+                )
+                asr, _ = length_regulate(t_en, pred_durs, shift)
+
+                audios = []
+                for i, frames in enumerate(frame_lengths.tolist()):
+                    # The decoder's source noise is seeded per chunk too
+                    with torch.random.fork_rng(enabled=chunk_seeds is not None):
+                        if chunk_seeds is not None:
+                            torch.manual_seed(chunk_seeds[i])
+                        F0_pred, N_pred = model.predictor.F0Ntrain(
+                            en[i : i + 1, :, :frames], s[i : i + 1]
+                        )
+                        out = model.decoder(
+                            asr[i : i + 1, :, :frames], F0_pred, N_pred, ref[i : i + 1]
+                        )
+                    # weird pulse at the end of the model, need to be fixed later
+                    audios.append(out.squeeze().cpu().numpy()[..., :-50])
+
+            return audios
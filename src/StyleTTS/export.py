@@ -0,0 +1,111 @@
+"""Exports a fine-tuned StyleTTS checkpoint as a compact inference bundle.
+
+The bundle holds only the networks in `INFERENCE_MODULES` together with the model and
+PL-BERT configs, so `StyleTTSEngine` can build the model without the training config,
+the ASR and JDC checkpoints, PL-BERT's own checkpoint or the discriminators.
+
+Usage:
+    python -m StyleTTS.export [--checkpoint Models/hal9000.pth] [--output Models/hal9000.inference.pt] [--fp16]
+"""
+
+import argparse
+import logging
+import os
+from pathlib import Path
+
+import torch
+import yaml
+
+from StyleTTS.engine import (
+    BUNDLE_FORMAT,
+    BUNDLE_VERSION,
+    DEFAULT_BUNDLE_PATH,
+    DEFAULT_CHECKPOINT_PATH,
+    DEFAULT_CONFIG_PATH,
+    STYLETTS_DIR,
+)
+from StyleTTS.models import INFERENCE_MODULES
+from StyleTTS.utils import load_checkpoint
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+
+def _strip_module_prefix(state_dict):
+    """Removes the `module.` prefix of checkpoints saved from DataParallel."""
+    if state_dict and all(k.startswith("module.") for k in state_dict):
+        return {k[7:]: v for k, v in state_dict.items()}
+    return dict(state_dict)
+
+
+def export_inference_bundle(
+    output_path: str | Path = DEFAULT_BUNDLE_PATH,
+    config_path: str | Path = DEFAULT_CONFIG_PATH,
+    checkpoint_path: str | Path = DEFAULT_CHECKPOINT_PATH,
+    half: bool = False,
+) -> Path:
+    """Writes the inference networks of a checkpoint to a standalone bundle.
+
+    Args:
+        output_path (str | Path): Where to write the bundle
+        config_path (str | Path): StyleTTS training config the checkpoint was trained with
+        checkpoint_path (str | Path): Fine-tuned StyleTTS checkpoint
+        half (bool): If True, floating point weights are stored as fp16 to halve the file size.
+            They are cast back to fp32 when loaded.
+
+    Returns:
+        Path: The path of the written bundle
+    """
+    from StyleTTS.Utils.PLBERT.util import load_plbert, load_plbert_config
+
+    config = yaml.safe_load(open(config_path))
+    plbert_dir = STYLETTS_DIR / config["PLBERT_dir"]
+    params = load_checkpoint(checkpoint_path)["net"]
+
+    net = {}
+    for key in INFERENCE_MODULES:
+        if key in params:
+            net[key] = _strip_module_prefix(params[key])
+        elif key == "bert":
+            logger.info("Checkpoint has no PL-BERT weights, using the pretrained ones")
+            net[key] = load_plbert(str(plbert_dir)).state_dict()
+        else:
+            raise KeyError(f"{checkpoint_path} has no weights for '{key}'")
+        if half:
+            net[key] = {
+                k: v.half() if v.is_floating_point() else v for k, v in net[key].items()
+            }
+
+    bundle = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "model_params": config["model_params"],
+        "plbert_params": load_plbert_config(str(plbert_dir)),
+        "dtype": "float16" if half else "float32",
+        "net": net,
+    }
+    output_path = Path(output_path)
+    torch.save(bundle, output_path)
+    size = output_path.stat().st_size / 2**20
+    logger.info(f"Wrote inference bundle to {output_path} ({size:.1f} MiB)")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export a StyleTTS checkpoint as an inference-only bundle"
+    )
+    parser.add_argument("--config", default=str(DEFAULT_CONFIG_PATH))
+    parser.add_argument("--checkpoint", default=str(DEFAULT_CHECKPOINT_PATH))
+    parser.add_argument("--output", default=str(DEFAULT_BUNDLE_PATH))
+    parser.add_argument(
+        "--fp16", action="store_true", help="Store floating point weights as fp16"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    export_inference_bundle(args.output, args.config, args.checkpoint, args.fp16)
+
+
+if __name__ == "__main__":
+    main()
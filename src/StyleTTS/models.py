@@ -1,5 +1,6 @@
 # coding:utf-8
 import math
+from collections import OrderedDict
 
 import torch
 import torch.nn as nn
@@ -353,6 +354,27 @@ class LayerNorm(nn.Module):
         return x.transpose(1, -1)
 
 
+def _run_lstm(lstm, x, input_lengths=None, total_length=None):
+    """Runs a batch-first LSTM on padded sequences, packing them only if `input_lengths`
+    is given.  The lengths must be on the CPU, so packing needs no device sync."""
+    lstm.flatten_parameters()
+    if input_lengths is None:
+        return lstm(x)[0]
+    x = nn.utils.rnn.pack_padded_sequence(
+        x, input_lengths, batch_first=True, enforce_sorted=False
+    )
+    x, _ = lstm(x)
+    x, _ = nn.utils.rnn.pad_packed_sequence(
+        x, batch_first=True, total_length=total_length
+    )
+    return x
+
+
+def _is_uniform(input_lengths, m):
+    """Whether every sequence fills the padded length, so nothing needs masking."""
+    return int(input_lengths.min()) == m.shape[-1]
+
+
 class TextEncoder(nn.Module):
     def __init__(self, channels, kernel_size, depth, n_symbols, actv=nn.LeakyReLU(0.2)):
         super().__init__()
@@ -410,6 +432,35 @@ class TextEncoder(nn.Module):
 
         return x
 
+    def infer(self, x, input_lengths, m):
+        """Inference version of `forward` that keeps every buffer on the device of `x`
+        and skips masking and packing when all sequences have the same length.
+
+        Args:
+            x (torch.Tensor): Padded tokens (batch, tokens)
+            input_lengths (torch.Tensor): Number of tokens of each sequence, on the CPU
+            m (torch.Tensor): Padding mask (batch, tokens), True at padded positions
+        """
+        uniform = _is_uniform(input_lengths, m)
+        m = m.unsqueeze(1)
+        x = self.embedding(x).transpose(1, 2)  # [B, emb, T]
+        if not uniform:
+            x.masked_fill_(m, 0.0)
+
+        for c in self.cnn:
+            x = c(x)
+            if not uniform:
+                x.masked_fill_(m, 0.0)
+
+        x = _run_lstm(
+            self.lstm,
+            x.transpose(1, 2),
+            None if uniform else input_lengths,
+            total_length=m.shape[-1],
+        ).transpose(-1, -2)
+        # pad_packed_sequence already zero-fills the padding
+        return x
+
     def inference(self, x):
         x = self.embedding(x)
         x = x.transpose(1, 2)
@@ -613,6 +664,23 @@ class ProsodyPredictor(nn.Module):
 
         return duration.squeeze(-1), en
 
+    def infer_duration(self, d, text_lengths, m):
+        """Predicts the duration logits of the output of `text_encoder.infer`, packing
+        the LSTM input only if the sequences differ in length.
+
+        Returns:
+            torch.Tensor: Logits (batch, tokens, max_dur) whose sigmoids sum to the
+                number of frames of each token
+        """
+        uniform = _is_uniform(text_lengths, m)
+        x = _run_lstm(
+            self.lstm,
+            d,
+            None if uniform else text_lengths,
+            total_length=m.shape[-1],
+        )
+        return self.duration_proj(x)
+
     def F0Ntrain(self, x, s):
         x, _ = self.shared(x.transpose(-1, -2))
 
@@ -696,6 +764,40 @@ class DurationEncoder(nn.Module):
 
         return x.transpose(-1, -2)
 
+    def infer(self, x, style, text_lengths, m):
+        """Inference version of `forward` that keeps every buffer on the device of `x`,
+        stays in (batch, tokens, channels) layout, and skips masking and packing when
+        all sequences have the same length.
+
+        Args:
+            x (torch.Tensor): Token features (batch, channels, tokens)
+            style (torch.Tensor): Prosody style (batch, sty_dim)
+            text_lengths (torch.Tensor): Number of tokens of each sequence, on the CPU
+            m (torch.Tensor): Padding mask (batch, tokens), True at padded positions
+        """
+        uniform = _is_uniform(text_lengths, m)
+        total_length = m.shape[-1]
+        m = m.unsqueeze(-1)
+        s = style.unsqueeze(1).expand(-1, x.shape[-1], -1)
+        x = torch.cat([x.transpose(-1, -2), s], axis=-1)
+        if not uniform:
+            x.masked_fill_(m, 0.0)
+
+        for block in self.lstms:
+            if isinstance(block, AdaLayerNorm):
+                x = torch.cat([block(x, style), s], axis=-1)
+                if not uniform:
+                    x.masked_fill_(m, 0.0)
+            else:
+                x = _run_lstm(
+                    block,
+                    x,
+                    None if uniform else text_lengths,
+                    total_length=total_length,
+                )
+
+        return x
+
     def inference(self, x, style):
         x = self.embedding(x.transpose(-1, -2)) * math.sqrt(self.d_model)
         style = style.expand(x.shape[0], x.shape[1], -1)
@@ -747,7 +849,37 @@ def load_ASR_models(ASR_MODEL_PATH, ASR_MODEL_CONFIG):
     return asr_model
 
 
+# Networks used at inference time.  The others only provide losses during training.
+INFERENCE_MODULES = (
+    "bert",
+    "bert_encoder",
+    "predictor",
+    "decoder",
+    "text_encoder",
+    "predictor_encoder",
+    "style_encoder",
+    "diffusion",
+)
+
+
 def build_model(args, text_aligner, pitch_extractor, bert):
+    nets = build_inference_model(args, bert)
+    nets.update(
+        text_aligner=text_aligner,
+        pitch_extractor=pitch_extractor,
+        mpd=MultiPeriodDiscriminator(),
+        msd=MultiResSpecDiscriminator(),
+        # slm discriminator head
+        wd=WavLMDiscriminator(
+            args.slm.hidden, args.slm.nlayers, args.slm.initial_channel
+        ),
+    )
+    return nets
+
+
+def build_inference_model(args, bert):
+    """Builds only the networks in `INFERENCE_MODULES`, without the text aligner,
+    pitch extractor and discriminators that are only needed for training."""
     assert args.decoder.type in ["istftnet", "hifigan"], "Decoder type unknown"
 
     if args.decoder.type == "istftnet":
@@ -845,14 +977,26 @@ def build_model(args, text_aligner, pitch_extractor, bert):
         predictor_encoder=predictor_encoder,
         style_encoder=style_encoder,
         diffusion=diffusion,
-        text_aligner=text_aligner,
-        pitch_extractor=pitch_extractor,
-        mpd=MultiPeriodDiscriminator(),
-        msd=MultiResSpecDiscriminator(),
-        # slm discriminator head
-        wd=WavLMDiscriminator(
-            args.slm.hidden, args.slm.nlayers, args.slm.initial_channel
-        ),
     )
 
     return nets
+
+
+def load_model_weights(model, params, assign=False):
+    """Loads the state dicts in `params` into the networks of `model` with the same key,
+    stripping the `module.` prefix of checkpoints saved from DataParallel.
+
+    With `assign`, the networks take over the checkpoint tensors instead of copying
+    them, which avoids a second copy of the weights (the dtypes must match)."""
+    for key in model:
+        if key in params:
+            try:
+                model[key].load_state_dict(params[key], assign=assign)
+            except:
+                state_dict = params[key]
+                new_state_dict = OrderedDict()
+                for k, v in state_dict.items():
+                    name = k[7:]  # remove `module.`
+                    new_state_dict[name] = v
+                # load params
+                model[key].load_state_dict(new_state_dict, strict=False, assign=assign)
@@ -0,0 +1,102 @@
+import logging
+import os
+
+import torch
+import torch.nn as nn
+from torch.nn.utils import remove_spectral_norm, remove_weight_norm
+from torch.nn.utils.parametrize import is_parametrized, remove_parametrizations
+from torch.nn.utils.spectral_norm import SpectralNorm
+from torch.nn.utils.weight_norm import WeightNorm
+
+from StyleTTS.engine import length_to_mask
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+
+def fold_weight_norms(module: nn.Module) -> int:
+    """Replaces weight norm and spectral norm with the plain weights they compute.
+
+    During training these reparametrizations recompute every weight from its
+    magnitude and direction (or its spectral norm) on each forward pass.  At inference
+    the result never changes, so it is computed once and stored as the weight.
+
+    Returns:
+        int: Number of folded layers
+    """
+    folded = 0
+    for submodule in module.modules():
+        if is_parametrized(submodule, "weight"):
+            remove_parametrizations(submodule, "weight", leave_parametrized=True)
+            folded += 1
+            continue
+        for hook in list(submodule._forward_pre_hooks.values()):
+            if isinstance(hook, SpectralNorm):
+                remove_spectral_norm(submodule, hook.name)
+                folded += 1
+            elif isinstance(hook, WeightNorm):
+                remove_weight_norm(submodule, hook.name)
+                folded += 1
+    return folded
+
+
+def _probe(model, model_params, device):
+    """Runs every network with weight norms on fixed random inputs."""
+    frames, tokens = 24, 12
+    devices = [torch.device(device).index or 0] if device.startswith("cuda") else []
+    with torch.random.fork_rng(devices=devices), torch.no_grad():
+        # The decoder's sine generator draws random noise, so seed it as well
+        torch.manual_seed(0)
+        text = torch.randint(1, model_params.n_token, (1, tokens), device=device)
+        lengths = torch.LongTensor([tokens]).to(device)
+        text_mask = length_to_mask(lengths).to(device)
+        # The style encoders downsample by 16 before a 5x5 convolution
+        mel = torch.randn(1, 1, model_params.n_mels, 4 * frames, device=device)
+        style = torch.randn(1, model_params.style_dim, device=device)
+        en = torch.randn(
+            1, model_params.hidden_dim + model_params.style_dim, frames, device=device
+        )
+        asr = torch.randn(1, model_params.hidden_dim, frames, device=device)
+
+        F0, N = model.predictor.F0Ntrain(en, style)
+        return {
+            "text_encoder": model.text_encoder(text, lengths, text_mask),
+            "style_encoder": model.style_encoder(mel),
+            "predictor_encoder": model.predictor_encoder(mel),
+            "F0": F0,
+            "N": N,
+            "decoder": model.decoder(asr, F0, N, style),
+        }
+
+
+def optimize_for_inference(model, model_params, device="cpu", atol=1e-3) -> float:
+    """Folds the weight norms of an inference model in place and verifies that the
+    outputs of its networks are unchanged.
+
+    Args:
+        model (Munch): Networks built by `build_inference_model`, in eval mode
+        model_params (Munch): The `model_params` the networks were built from
+        device (str): Device the networks are on
+        atol (float): Largest absolute difference in any output that is accepted
+
+    Returns:
+        float: Largest absolute difference between the outputs before and after
+
+    Raises:
+        ValueError: If an output changed by more than `atol`
+    """
+    reference = _probe(model, model_params, device)
+    folded = sum(fold_weight_norms(model[key]) for key in model)
+    optimized = _probe(model, model_params, device)
+
+    max_diff = max(
+        (reference[name] - optimized[name]).abs().max().item() for name in reference
+    )
+    if max_diff > atol:
+        raise ValueError(
+            f"Folding weight norms changed the model output by {max_diff:.2e}"
+        )
+    logger.info(
+        f"Folded {folded} weight-normalized layers (max difference {max_diff:.2e})"
+    )
+    return max_diff
@@ -0,0 +1,223 @@
+import atexit
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+# Splits a whitespace-separated token into leading punctuation, word and trailing punctuation
+_TOKEN_RE = re.compile(r"^(\W*)(.*?)(\W*)$")
+
+# Words spelled the same but pronounced differently depending on their sense, which
+# a chunk's other words cannot be composed around
+_HOMOGRAPHS = frozenset(
+    "august bass bow close content contract desert does dove lead live minute "
+    "moderate object permit polish present produce project read record refuse row "
+    "separate tear use wind wound".split()
+)
+
+
+def _split_token(token: str) -> tuple[str, str, str]:
+    return _TOKEN_RE.match(token).groups()
+
+
+class PhonemeFrontend:
+    """Phonemizer with sentence- and word-level LRU caches, optionally persisted to a
+    JSON file.
+
+    A chunk that was phonemized before is returned from the sentence cache.  If the
+    word cache is enabled, a new chunk whose words have all been seen is put together
+    from it instead.  The word cache learns the case-sensitive pronunciation of each
+    word from the sentences the backend phonemized, so function words keep the reduced
+    forms they take in running speech, but it cannot follow espeak's sentence-level
+    context exactly, so it is opt-in and never used for chunks with homographs.  All
+    remaining chunks go to the backend in one call.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        max_sentences: int = 1024,
+        max_words: int = 0,
+        cache_path: str | Path | None = None,
+        save_interval: float = 60.0,
+    ):
+        """Initialize the phoneme frontend.
+
+        Args:
+            backend (phonemizer.backend.EspeakBackend | None): Backend the uncached chunks are phonemized with. The engine sets it when it loads.
+            max_sentences (int): Maximum number of cached chunks. 0 disables the sentence cache.
+            max_words (int): Maximum number of cached words. 0 disables the word cache.
+            cache_path (str | Path | None): JSON file the caches are loaded from and saved to.
+            save_interval (float): Minimum seconds between two saves of new entries. Unsaved entries are written on exit.
+        """
+        self.backend = backend
+        self.max_sentences = max_sentences
+        self.max_words = max_words
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.save_interval = save_interval
+        self._sentences: OrderedDict[str, str] = OrderedDict()
+        self._words: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.sentence_hits = 0
+        self.word_hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._last_save = time.monotonic()
+        if self.cache_path is not None:
+            if self.cache_path.exists():
+                self.load()
+            atexit.register(self.flush)
+
+    def __len__(self) -> int:
+        return len(self._sentences)
+
+    def phonemize(self, texts: List[str]) -> List[str]:
+        """Phonemizes a batch of chunks, calling the backend at most once.
+
+        Args:
+            texts (List[str]): Text chunks
+
+        Returns:
+            List[str]: IPA phonemes of each chunk, with its punctuation preserved
+        """
+        texts = [" ".join(text.split()) for text in texts]
+        results: List[str | None] = [None] * len(texts)
+        with self._lock:
+            for i, text in enumerate(texts):
+                results[i] = self._get(self._sentences, text)
+                if results[i] is not None:
+                    self.sentence_hits += 1
+                    continue
+                results[i] = self._compose(text)
+                if results[i] is not None:
+                    self.word_hits += 1
+
+        misses = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+        if not misses:
+            return results
+
+        phonemes = dict(zip(misses, self.backend.phonemize(misses)))
+        with self._lock:
+            self.misses += len(misses)
+            for text, ps in phonemes.items():
+                self._put(self._sentences, text, ps, self.max_sentences)
+                self._learn_words(text, ps)
+            self._dirty = True
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.flush()
+        return [phonemes[t] if r is None else r for t, r in zip(texts, results)]
+
+    def _compose(self, text: str) -> str | None:
+        """Puts a chunk together from cached words, or returns None if one is missing."""
+        if self.max_words <= 0:
+            return None
+        parts = []
+        for token in text.split():
+            leading, word, trailing = _split_token(token)
+            if word:
+                ps = self._get(self._words, word)
+                if ps is None or word.lower() in _HOMOGRAPHS:
+                    return None
+                parts.append(f"{leading}{ps}{trailing}")
+            else:
+                parts.append(token)
+        return " ".join(parts)
+
+    def _learn_words(self, text: str, phonemes: str) -> None:
+        """Caches the pronunciation of every word of a phonemized chunk.  Chunks whose
+        words do not map one-to-one onto the phonemized words (numbers, abbreviations)
+        are skipped."""
+        tokens, phoneme_tokens = text.split(), phonemes.split()
+        if self.max_words <= 0 or len(tokens) != len(phoneme_tokens):
+            return
+        for token, phoneme_token in zip(tokens, phoneme_tokens):
+            word, ps = _split_token(token)[1], _split_token(phoneme_token)[1]
+            if word and ps and word.lower() not in _HOMOGRAPHS:
+                self._put(self._words, word, ps, self.max_words)
+
+    @staticmethod
+    def _get(entries: OrderedDict, key: str) -> str | None:
+        value = entries.get(key)
+        if value is not None:
+            entries.move_to_end(key)
+        return value
+
+    @staticmethod
+    def _put(entries: OrderedDict, key: str, value: str, max_entries: int) -> None:
+        if max_entries <= 0:
+            return
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > max_entries:
+            entries.popitem(last=False)
+
+    def load(self) -> None:
+        """Loads the caches from `cache_path`, ignoring a missing or unreadable file."""
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable phoneme cache {self.cache_path}: {e}")
+            return
+        with self._lock:
+            for text, ps in data.get("sentences", {}).items():
+                self._put(self._sentences, text, ps, self.max_sentences)
+            for word, ps in data.get("words", {}).items():
+                self._put(self._words, word, ps, self.max_words)
+
+    def flush(self) -> None:
+        """Saves the caches if they have entries that were not saved yet."""
+        if self.cache_path is not None and self._dirty:
+            self.save()
+
+    def save(self) -> None:
+        """Writes the caches to `cache_path`, replacing the file atomically."""
+        with self._lock:
+            data = {"sentences": dict(self._sentences), "words": dict(self._words)}
+            self._dirty = False
+            self._last_save = time.monotonic()
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                "w",
+                encoding="utf-8",
+                dir=self.cache_path.parent,
+                prefix=f"{self.cache_path.name}.",
+                suffix=".tmp",
+                delete=False,
+            ) as f:
+                tmp_path = f.name
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write phoneme cache {self.cache_path}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sentences.clear()
+            self._words.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters for monitoring."""
+        lookups = self.sentence_hits + self.word_hits + self.misses
+        return {
+            "sentence_hits": self.sentence_hits,
+            "word_hits": self.word_hits,
+            "misses": self.misses,
+            "sentences": len(self._sentences),
+            "words": len(self._words),
+            "hit_rate": (
+                (self.sentence_hits + self.word_hits) / lookups if lookups else 0.0
+            ),
+        }
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict
+
+import torch
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+
+class StyleCache:
+    """Size-bounded LRU cache of the PL-BERT output and diffusion style of text chunks,
+    optionally backed by a directory so styles survive restarts.
+
+    Entries are keyed by everything the predicted style depends on: the checkpoint, the
+    voice, the chunk's phoneme tokens, the sampler configuration and the seed.  Keying
+    on tokens rather than text lets chunks that only differ in case or spacing share
+    an entry.  Only the style, which saves the diffusion, is written to disk; the
+    PL-BERT output is a hundred times larger and cheap to recompute.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        cache_dir: str | Path | None = None,
+        max_disk_entries: int = 10000,
+    ):
+        """Initialize the style cache.
+
+        Args:
+            max_entries (int): Maximum number of entries kept in memory. 0 disables the cache.
+            cache_dir (str | Path | None): If set, styles are also written to this directory
+                and read back from it on a memory miss.
+            max_disk_entries (int): Maximum number of styles kept in `cache_dir`; the least
+                recently used files are deleted.
+        """
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: OrderedDict[str, Dict[str, torch.Tensor]] = OrderedDict()
+        self._files: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            paths = sorted(self.cache_dir.glob("*.pt"), key=lambda p: p.stat().st_mtime)
+            self._files.update((path.stem, None) for path in paths)
+            self._trim_files()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hashes the parts a cached style depends on into a key."""
+        return hashlib.sha256(":".join(map(str, parts)).encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pt"
+
+    def get(self, key: str) -> Dict[str, torch.Tensor] | None:
+        """Returns the cached tensors of a key, or None if missing.  Entries read back
+        from disk only have a `style`, entries from memory also have `bert`."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        if self.cache_dir is not None and key in self._files:
+            path = self._path(key)
+            try:
+                entry = {"style": torch.load(path, map_location="cpu")["style"]}
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable style cache entry {key}: {e}")
+                with self._lock:
+                    self._files.pop(key, None)
+                path.unlink(missing_ok=True)
+            else:
+                path.touch()
+                with self._lock:
+                    self._files.move_to_end(key)
+                self._remember(key, entry)
+                with self._lock:
+                    self.hits += 1
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, bert: torch.Tensor, style: torch.Tensor) -> None:
+        """Caches the PL-BERT output (tokens, hidden) and style (style_dim * 2) of a chunk."""
+        if not self.enabled:
+            return
+        entry = {"bert": bert.detach().cpu(), "style": style.detach().cpu()}
+        self._remember(key, entry)
+        if self.cache_dir is None or key in self._files:
+            return
+        try:
+            torch.save({"style": entry["style"]}, self._path(key))
+        except OSError as e:
+            logger.warning(f"Could not write style cache entry {key}: {e}")
+            return
+        with self._lock:
+            self._files[key] = None
+            self._trim_files()
+
+    def _remember(self, key: str, entry: Dict[str, torch.Tensor]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _trim_files(self) -> None:
+        while len(self._files) > self.max_disk_entries:
+            key, _ = self._files.popitem(last=False)
+            self._path(key).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "disk_size": len(self._files),
+            "max_entries": self.max_entries,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
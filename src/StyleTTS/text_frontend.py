@@ -0,0 +1,461 @@
+"""Text frontend of the StyleTTS engine.
+
+Everything between the text of a reply and the token ids the model reads:
+
+- `split_and_recombine_text` splits a reply into chunks of whole sentences,
+- `normalize_text` spells out numbers, currencies, units, times, dates and symbols,
+  so the phonemizer reads them the same way every time,
+- `tokenize_phonemes` separates the punctuation of a phonemized chunk from its words,
+- `TextCleaner` maps the phonemes to the model's symbol ids through a lookup table.
+"""
+
+import logging
+import os
+import re
+
+import numpy as np
+
+from StyleTTS.text_utils import symbols
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+
+# Segmentation
+
+_PARAGRAPHS_RE = re.compile(r"\n\n+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_CURLY_QUOTES_RE = re.compile(r"[“”]")
+_PUNCTUATION_ONLY_RE = re.compile(r"^[\s\.,;:!?]*$")
+# Characters that can end a sentence or a quote; no other character changes anything
+_BOUNDARY_CANDIDATE_RE = re.compile(r'[!?.\n"]|.(?=")', re.DOTALL)
+
+
+# Adapted from tortoise-tts
+def split_and_recombine_text(text, desired_length=200, max_length=300):
+    """Split text it into chunks of a desired length trying to keep sentences intact.
+
+    The current chunk is tracked as a range of `text` rather than built up one
+    character at a time, and the scan jumps from one possible boundary to the next,
+    so splitting runs in linear time with few steps in Python.
+    """
+    # normalize text, remove redundant whitespace and convert non-ascii quotes to ascii
+    text = _PARAGRAPHS_RE.sub("\n", text)
+    text = _WHITESPACE_RE.sub(" ", text)
+    text = _CURLY_QUOTES_RE.sub('"', text)
+
+    rv = []
+    in_quote = False
+    start = 0  # the current chunk is text[start : pos + 1]
+    split_pos = []
+    pos = -1
+    end_pos = len(text) - 1
+
+    def seek(delta):
+        nonlocal pos, in_quote
+        step = 1 if delta > 0 else -1
+        for _ in range(abs(delta)):
+            pos += step
+            if text[pos] == '"':
+                in_quote = not in_quote
+        return text[pos]
+
+    def peek(delta):
+        p = pos + delta
+        return text[p] if p < end_pos and p >= 0 else ""
+
+    def length():
+        return pos + 1 - start
+
+    def commit():
+        nonlocal start, split_pos
+        rv.append(text[start : pos + 1])
+        start = pos + 1
+        split_pos = []
+
+    while pos < end_pos:
+        # Skip to the next possible boundary, or to where the chunk reaches max_length
+        candidate = _BOUNDARY_CANDIDATE_RE.search(text, pos + 1)
+        target = min(
+            candidate.start() if candidate else end_pos, start + max_length - 1
+        )
+        if target > pos + 1:
+            pos = target - 1
+        c = seek(1)
+        # do we need to force a split?
+        if length() >= max_length:
+            if len(split_pos) > 0 and length() > (desired_length / 2):
+                # we have at least one sentence and we are over half the desired length, seek back to the last split
+                d = pos - split_pos[-1]
+                seek(-d)
+            else:
+                # no full sentences, seek back until we are not in the middle of a word and split there
+                while c not in "!?.\n " and pos > 0 and length() > desired_length:
+                    c = seek(-1)
+            commit()
+        # check for sentence boundaries
+        elif not in_quote and (c in "!?\n" or (c == "." and peek(1) in "\n ")):
+            # seek forward if we have consecutive boundary markers but still within the max length
+            while pos < len(text) - 1 and length() < max_length and peek(1) in "!?.":
+                c = seek(1)
+            split_pos.append(pos)
+            if length() >= desired_length:
+                commit()
+        # treat end of quote as a boundary if its followed by a space or newline
+        elif in_quote and peek(1) == '"' and peek(2) in "\n ":
+            seek(2)
+            split_pos.append(pos)
+    rv.append(text[start:])
+
+    # clean up, remove lines with only whitespace or punctuation
+    rv = [s.strip() for s in rv]
+    rv = [s for s in rv if len(s) > 0 and not _PUNCTUATION_ONLY_RE.match(s)]
+
+    return rv
+
+
+# Normalization
+
+_ONES = [
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine",
+    "ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen",
+    "seventeen", "eighteen", "nineteen",
+]  # fmt: skip
+_TENS = [
+    "", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety",
+]  # fmt: skip
+_SCALES = [
+    (10**12, "trillion"),
+    (10**9, "billion"),
+    (10**6, "million"),
+    (1000, "thousand"),
+]
+_IRREGULAR_ORDINALS = {
+    "one": "first",
+    "two": "second",
+    "three": "third",
+    "five": "fifth",
+    "eight": "eighth",
+    "nine": "ninth",
+    "twelve": "twelfth",
+}
+_MONTHS = [
+    "January", "February", "March", "April", "May", "June", "July", "August",
+    "September", "October", "November", "December",
+]  # fmt: skip
+
+# Currency symbols: (unit, units, subunit, subunits)
+_CURRENCIES = {
+    "$": ("dollar", "dollars", "cent", "cents"),
+    "£": ("pound", "pounds", "penny", "pence"),
+    "€": ("euro", "euros", "cent", "cents"),
+}
+# Units read after a number: (singular, plural).  Longer units come first so that
+# e.g. "km/h" is not read as "km".
+_UNITS = {
+    "°F": ("degree Fahrenheit", "degrees Fahrenheit"),
+    "°C": ("degree Celsius", "degrees Celsius"),
+    "°": ("degree", "degrees"),
+    "%": ("percent", "percent"),
+    "km/h": ("kilometer per hour", "kilometers per hour"),
+    "mph": ("mile per hour", "miles per hour"),
+    "kph": ("kilometer per hour", "kilometers per hour"),
+    "kWh": ("kilowatt hour", "kilowatt hours"),
+    "kW": ("kilowatt", "kilowatts"),
+    "km": ("kilometer", "kilometers"),
+    "kg": ("kilogram", "kilograms"),
+    "lbs": ("pound", "pounds"),
+    "lb": ("pound", "pounds"),
+    "cm": ("centimeter", "centimeters"),
+    "mm": ("millimeter", "millimeters"),
+    "ft": ("foot", "feet"),
+    "hPa": ("hectopascal", "hectopascals"),
+    "GHz": ("gigahertz", "gigahertz"),
+    "MHz": ("megahertz", "megahertz"),
+    "TB": ("terabyte", "terabytes"),
+    "GB": ("gigabyte", "gigabytes"),
+    "MB": ("megabyte", "megabytes"),
+    "KB": ("kilobyte", "kilobytes"),
+}
+_SYMBOLS = {"&": " and ", "@": " at ", "+": " plus ", "=": " equals "}
+
+_UNSIGNED_NUMBER = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?"
+_NUMBER = rf"-?(?:{_UNSIGNED_NUMBER})"
+_UNITS_PATTERN = "|".join(re.escape(unit) for unit in _UNITS)
+_TIME_RE = re.compile(
+    r"\b(\d{1,2}):(\d{2})(?::\d{2})?(?:\s*([AaPp])\.?\s*[Mm]\b\.?)?(?!\d)"
+)
+_HOUR_RE = re.compile(r"\b(\d{1,2})\s*([AaPp])\.?\s*[Mm]\b\.?")
+_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_CURRENCY_RE = re.compile(
+    r"([$£€])\s?(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{1,2}))?(?!\d)"
+    r"(?:\s?(thousand|million|billion|trillion)\b)?"
+)
+_SCALED_CURRENCY_RE = re.compile(
+    r"([$£€])\s?(\d+\.\d+)\s?(thousand|million|billion|trillion)\b"
+)
+_UNIT_RE = re.compile(rf"(?<![\w.])({_NUMBER})\s?({_UNITS_PATTERN})(?![A-Za-z])")
+_ORDINAL_RE = re.compile(r"\b(\d+)(st|nd|rd|th)\b")
+_PHONE_RE = re.compile(
+    r"(?<![\w.-])(?:(?:1[-. ])?\(?\d{3}\)?[\s.-]?)?\d{3}-\d{4}(?![\w-])"
+)
+# A dash between two numbers.  It is only read as a range after "from" or "between",
+# with a currency, unit or "am"/"pm", or as an en dash, so scores ("3-2") are left alone.
+_RANGE_RE = re.compile(
+    rf"(?:\b([Ff]rom|[Bb]etween)\s+)?([$£€]?)(?<![\w.-])({_UNSIGNED_NUMBER})"
+    rf"\s?([–-])\s?({_UNSIGNED_NUMBER})(?![\w-]|\.\d)"
+    rf"(?=(\s?(?:{_UNITS_PATTERN}|[AaPp]\.?\s*[Mm]\b))?)"
+)
+# IP addresses and version numbers, with at least three dot-separated groups
+_DOTTED_NUMBER_RE = re.compile(r"(?<![\w.])\d+(?:\.\d+){2,}(?![\w-]|\.\d)")
+_FRACTION_RE = re.compile(r"(?<![\w./-])(\d{1,2})/(\d{1,2})(?![\w/-])")
+_DECADE_RE = re.compile(r"(?<![\w.])'?([1-9]0|1[1-9]\d0|20\d0)'?s\b")
+_HASH_NUMBER_RE = re.compile(r"#(?=\d)")
+_SYMBOL_RE = re.compile("|".join(re.escape(s) for s in _SYMBOLS))
+_SLASH_RE = re.compile(r"(?<=\w)/(?=\w)")
+# A number directly followed by letters ("5G"), but not digits inside a word ("H2O")
+_DIGIT_LETTER_RE = re.compile(r"\b(\d+)([A-Za-z])")
+_NUMBER_RE = re.compile(rf"(?<![\w.])({_NUMBER})")
+_MARKUP_RE = re.compile(r"[*~`#]")
+
+
+def number_to_words(n: int) -> str:
+    """Spells out an integer, e.g. 1234 as "one thousand two hundred thirty-four"."""
+    if n < 0:
+        return f"minus {number_to_words(-n)}"
+    if n < 20:
+        return _ONES[n]
+    if n < 100:
+        tens, ones = divmod(n, 10)
+        return _TENS[tens] + (f"-{_ONES[ones]}" if ones else "")
+    if n < 1000:
+        hundreds, rest = divmod(n, 100)
+        words = f"{_ONES[hundreds]} hundred"
+    else:
+        scale, name = next((s, name) for s, name in _SCALES if n >= s)
+        high, rest = divmod(n, scale)
+        words = f"{number_to_words(high)} {name}"
+    return words + (f" {number_to_words(rest)}" if rest else "")
+
+
+def ordinal_to_words(n: int) -> str:
+    """Spells out an ordinal, e.g. 21 as "twenty-first"."""
+    head, last = re.match(r"(.*?)([a-z]+)$", number_to_words(n)).groups()
+    if last in _IRREGULAR_ORDINALS:
+        last = _IRREGULAR_ORDINALS[last]
+    elif last.endswith("y"):
+        last = last[:-1] + "ieth"
+    else:
+        last += "th"
+    return head + last
+
+
+def year_to_words(n: int) -> str:
+    """Spells out a year the way it is spoken, e.g. 1999 as "nineteen ninety-nine"."""
+    if 2000 <= n <= 2009 or not 1100 <= n <= 2099:
+        return number_to_words(n)
+    century, rest = divmod(n, 100)
+    if rest == 0:
+        return f"{number_to_words(century)} hundred"
+    if rest < 10:
+        return f"{number_to_words(century)} oh {_ONES[rest]}"
+    return f"{number_to_words(century)} {number_to_words(rest)}"
+
+
+def _digits_to_words(digits: str) -> str:
+    return " ".join(_ONES[int(d)] for d in digits)
+
+
+def _say_number(number: str) -> str:
+    """Spells out a number as written, with an optional sign, thousands separators
+    and decimals.  Numbers with leading zeros or too many digits are read digit by
+    digit."""
+    number = number.replace(",", "")
+    sign = "minus " if number.startswith("-") else ""
+    whole, _, fraction = number.lstrip("-").partition(".")
+    if len(whole) > 15 or (len(whole) > 1 and whole.startswith("0")):
+        words = _digits_to_words(whole)
+    else:
+        words = number_to_words(int(whole))
+    if fraction:
+        words += f" point {_digits_to_words(fraction)}"
+    return sign + words
+
+
+def _is_one(number: str) -> bool:
+    return number.replace(",", "") in ("1", "1.0", "1.00")
+
+
+def _sentence_end(match: re.Match) -> str:
+    """The period of an "a.m." or "p.m." that also ends its sentence."""
+    if not match[0].endswith("."):
+        return ""
+    rest = match.string[match.end() :].lstrip()
+    return "." if not rest or rest[0].isupper() else ""
+
+
+def _say_time(match: re.Match) -> str:
+    hour, minute, meridiem = int(match[1]), int(match[2]), match[3]
+    if hour > 24 or minute > 59:
+        return match[0]
+    if meridiem is None and (hour == 0 or hour > 12):
+        # 24-hour times are read on the 12-hour clock
+        meridiem = "p" if 12 <= hour < 24 else "a"
+    hour = hour % 12 or 12
+    words = number_to_words(hour)
+    if minute == 0:
+        words += " o'clock" if meridiem is None else ""
+    elif minute < 10:
+        words += f" oh {_ONES[minute]}"
+    else:
+        words += f" {number_to_words(minute)}"
+    if meridiem is not None:
+        words += f" {meridiem.upper()} M{_sentence_end(match)}"
+    return words
+
+
+def _say_hour(match: re.Match) -> str:
+    hour = int(match[1])
+    if not 1 <= hour <= 12:
+        return match[0]
+    return f"{number_to_words(hour)} {match[2].upper()} M{_sentence_end(match)}"
+
+
+def _say_date(match: re.Match) -> str:
+    year, month, day = int(match[1]), int(match[2]), int(match[3])
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return match[0]
+    return f"{_MONTHS[month - 1]} {ordinal_to_words(day)}, {year_to_words(year)}"
+
+
+def _say_currency(match: re.Match) -> str:
+    unit, units, subunit, subunits = _CURRENCIES[match[1]]
+    whole, cents, scale = match[2], match[3], match[4]
+    if scale:
+        return f"{_say_number(whole)} {scale} {units}"
+    words = f"{_say_number(whole)} {unit if _is_one(whole) else units}"
+    if cents and int(cents):
+        cents = int(cents.ljust(2, "0"))
+        words += f" and {number_to_words(cents)} {subunit if cents == 1 else subunits}"
+    return words
+
+
+def _say_scaled_currency(match: re.Match) -> str:
+    units = _CURRENCIES[match[1]][1]
+    return f"{_say_number(match[2])} {match[3]} {units}"
+
+
+def _say_unit(match: re.Match) -> str:
+    singular, plural = _UNITS[match[2]]
+    return f"{_say_number(match[1])} {singular if _is_one(match[1]) else plural}"
+
+
+def _say_phone_number(match: re.Match) -> str:
+    return ", ".join(_digits_to_words(group) for group in re.findall(r"\d+", match[0]))
+
+
+def _say_dotted_number(match: re.Match) -> str:
+    return " dot ".join(_say_number(group) for group in match[0].split("."))
+
+
+def _say_range(match: re.Match) -> str:
+    keyword, currency, low, dash, high, unit = match.groups()
+    if not (keyword or currency or unit or dash == "–"):
+        return match[0]
+    prefix = f"{keyword} " if keyword else ""
+    joiner = "and" if keyword and keyword.lower() == "between" else "to"
+    return f"{prefix}{currency}{low} {joiner} {high}"
+
+
+def _say_fraction(match: re.Match) -> str:
+    numerator, denominator = int(match[1]), int(match[2])
+    if not 0 < numerator < denominator:
+        return match[0]
+    if denominator == 2:
+        name = "half"
+    elif denominator == 4:
+        name = "quarter"
+    else:
+        name = ordinal_to_words(denominator)
+    if numerator > 1:
+        name = name[:-1] + "ves" if name == "half" else name + "s"
+    return f"{number_to_words(numerator)} {name}"
+
+
+def _say_decade(match: re.Match) -> str:
+    decade = int(match[1])
+    words = year_to_words(decade) if decade >= 100 else number_to_words(decade)
+    return words[:-1] + "ies" if words.endswith("y") else words + "s"
+
+
+def _say_plain_number(match: re.Match) -> str:
+    number = match[1]
+    if re.fullmatch(r"\d{4}", number) and 1100 <= int(number) <= 2099:
+        return year_to_words(int(number))
+    return _say_number(number)
+
+
+def normalize_text(text: str) -> str:
+    """Spells out the numbers, currencies, units, times, dates and symbols of a text,
+    so the phonemizer reads them the same way every time.
+
+    Four-digit numbers from 1100 to 2099 are read as years ("twenty twenty-five"),
+    24-hour times on the 12-hour clock, phone numbers digit by digit, and symbols the
+    model has no sound for are dropped.  Text without any of these is returned unchanged apart from whitespace.
+    """
+    text = text.replace("’", "'")
+    text = _DOTTED_NUMBER_RE.sub(_say_dotted_number, text)
+    text = _DATE_RE.sub(_say_date, text)
+    text = _PHONE_RE.sub(_say_phone_number, text)
+    text = _RANGE_RE.sub(_say_range, text)
+    text = _TIME_RE.sub(_say_time, text)
+    text = _HOUR_RE.sub(_say_hour, text)
+    text = _SCALED_CURRENCY_RE.sub(_say_scaled_currency, text)
+    text = _CURRENCY_RE.sub(_say_currency, text)
+    text = _UNIT_RE.sub(_say_unit, text)
+    text = _ORDINAL_RE.sub(lambda m: ordinal_to_words(int(m[1])), text)
+    text = _DECADE_RE.sub(_say_decade, text)
+    text = _HASH_NUMBER_RE.sub("number ", text)
+    text = _SYMBOL_RE.sub(lambda m: _SYMBOLS[m[0]], text)
+    text = _FRACTION_RE.sub(_say_fraction, text)
+    text = _SLASH_RE.sub(" ", text)
+    text = _DIGIT_LETTER_RE.sub(r"\1 \2", text)
+    text = _NUMBER_RE.sub(_say_plain_number, text)
+    text = _MARKUP_RE.sub("", text).replace("_", " ")
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+# Tokenization
+
+_PUNCTUATION = ';:,.!?¡¿—…"«»“”'
+_PHONEME_TOKEN_RE = re.compile(
+    rf"\.\.\.|[{re.escape(_PUNCTUATION)}]|[^\s{re.escape(_PUNCTUATION)}]+"
+)
+
+
+def tokenize_phonemes(phonemes: str) -> str:
+    """Separates the punctuation of a phonemized text from its words with spaces, as
+    NLTK's word tokenizer did for the original StyleTTS 2 frontend."""
+    return " ".join(_PHONEME_TOKEN_RE.findall(phonemes))
+
+
+class TextCleaner:
+    """Maps text to the ids of the model's symbols through a lookup table indexed by
+    code point.  Characters without a symbol are dropped."""
+
+    def __init__(self, dummy=None):
+        self.word_index_dictionary = {symbol: i for i, symbol in enumerate(symbols)}
+        self._table = np.full(max(map(ord, symbols)) + 1, -1, dtype=np.int64)
+        for symbol, index in self.word_index_dictionary.items():
+            self._table[ord(symbol)] = index
+
+    def __call__(self, text):
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        indexes = self._table[np.minimum(codes, len(self._table) - 1)]
+        # Code points past the table land on its last entry, which must not match
+        indexes[codes >= len(self._table)] = -1
+        known = indexes >= 0
+        if not known.all():
+            unknown = sorted({chr(c) for c in codes[~known]})
+            logger.debug(f"Dropping unknown symbols {unknown} from {text!r}")
+        return indexes[known].tolist()
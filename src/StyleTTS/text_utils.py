@@ -1,8 +1,4 @@
 # IPA Phonemizer: https://github.com/bootphon/phonemizer
-import logging
-
-logger = logging.getLogger(__name__)
-
 _pad = "$"
 _punctuation = ';:,.!?¡¿—…"«»“” '
 _letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
@@ -14,17 +10,3 @@ symbols = [_pad] + list(_punctuation) + list(_letters) + list(_letters_ipa)
 dicts = {}
 for i in range(len((symbols))):
     dicts[symbols[i]] = i
-
-
-class TextCleaner:
-    def __init__(self, dummy=None):
-        self.word_index_dictionary = dicts
-
-    def __call__(self, text):
-        indexes = []
-        for char in text:
-            try:
-                indexes.append(self.word_index_dictionary[char])
-            except KeyError:
-                logger.exception(text)
-        return indexes
@@ -1,7 +1,7 @@
 from munch import Munch
-import nltk
-import ssl
-import certifi
+import os
+import sys
+import torch
 
 
 def recursive_munch(d):
@@ -12,17 +12,32 @@ def recursive_munch(d):
     else:
         return d
 
-def initialize_nltk():
-    try:
-        _create_unverified_https_context = ssl._create_unverified_context
-    except AttributeError:
-        pass
-    else:
-        ssl._create_default_https_context = lambda: ssl.create_default_context(cafile=certifi.where())
 
+def load_checkpoint(path):
+    """Loads a checkpoint memory-mapped, so tensors are paged in from the file on
+    demand instead of being read into RAM.  Checkpoints in the legacy (non-zip)
+    format cannot be memory-mapped and are read normally."""
     try:
-        nltk.data.find("tokenizers/punkt")
-        nltk.data.find("tokenizers/punkt_tab")
-    except LookupError:
-        nltk.download("punkt")
-        nltk.download("punkt_tab")
\ No newline at end of file
+        return torch.load(path, map_location="cpu", mmap=True)
+    except RuntimeError:
+        return torch.load(path, map_location="cpu")
+
+
+def memory_usage():
+    """Returns the current and peak resident set size of the process in MiB, or None
+    on platforms without the `resource` module (Windows)."""
+    if sys.platform == "win32":
+        return None
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    peak = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    current = peak
+    if os.path.exists("/proc/self/statm"):
+        try:
+            with open("/proc/self/statm") as f:
+                current = int(f.read().split()[1]) * resource.getpagesize() / 2**20
+        except OSError:
+            pass
+    return current, peak
@@ -1,11 +1,13 @@
 import os
 from dotenv import load_dotenv
 import pyaudio
+import queue
+import threading
 import time
 import numpy as np
 import logging
 from pathlib import Path
-from typing import Tuple
+from typing import Iterable, Optional
 from rich.logging import RichHandler
 
 load_dotenv()
@@ -18,87 +20,143 @@ logging.basicConfig(
 logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
 
-from StyleTTS import msinference
-from StyleTTS.app import synthesize
+from StyleTTS.app import synthesize_stream
+from StyleTTS.engine import DEFAULT_SAMPLER, StyleTTSEngine
+from StyleTTS.phoneme_frontend import PhonemeFrontend
+from StyleTTS.style_cache import StyleCache
+
+TTS_SAMPLER = os.getenv("TTS_SAMPLER", DEFAULT_SAMPLER)
+TTS_DIFFUSION_STEPS = int(os.getenv("TTS_DIFFUSION_STEPS", "20"))
+TTS_EXPRESS = os.getenv("TTS_EXPRESS", "False").lower() in ("true", "1", "t")
+STYLE_CACHE_SIZE = int(os.getenv("STYLE_CACHE_SIZE", "128"))
+STYLE_CACHE_DIR = os.getenv("STYLE_CACHE_DIR")
+PHONEME_CACHE_PATH = os.getenv("PHONEME_CACHE_PATH")
+PHONEME_WORD_CACHE_SIZE = int(os.getenv("PHONEME_WORD_CACHE_SIZE", "0"))
+# Fixed gain applied to every chunk, so chunks keep their relative loudness
+PCM_GAIN = 1.0
 
 
 class TTS:
-    def __init__(self, character="hal9000"):
+    def __init__(self, character="hal9000", engine: Optional[StyleTTSEngine] = None):
         """Text-to-Speech module that takes a text input and outputs audio from StyleTTS inference.
 
+        The StyleTTS model is loaded in the background, so construction returns immediately
+        and the first synthesis waits for the model if it is not ready yet.
+
         Args:
             character (str, optional): StyleTTS character voice to be used. Defaults to "hal9000".
+            engine (StyleTTSEngine, optional): Engine to synthesize with. Defaults to a new engine.
         """
-        logger.info("Loading StyleTTS reference...")
-        self.voice = msinference.compute_style(
-            f"{Path(__file__).parent}/StyleTTS/voices/{character}.wav"
+        self.engine = engine or StyleTTSEngine(
+            style_cache=StyleCache(STYLE_CACHE_SIZE, STYLE_CACHE_DIR),
+            phoneme_frontend=PhonemeFrontend(
+                max_words=PHONEME_WORD_CACHE_SIZE, cache_path=PHONEME_CACHE_PATH
+            ),
         )
+        self.engine.warm_up(background=True)
+        self.voice_path = f"{Path(__file__).parent}/StyleTTS/voices/{character}.wav"
+        self._voice = None
+        self._voice_lock = threading.Lock()
 
         self.p = pyaudio.PyAudio()
         self.stream = None
 
-        self._audio_data = b""
-        self._audio_position = 0
-
-    def _audio_callback(
-        self, in_data, frame_count: int, time_info, status
-    ) -> Tuple[bytes, int]:
-        """Callback function that the PyAudio thread calls to iteratively get more audio data.
+    @property
+    def voice(self):
+        """Reference style of the character voice, read from the style cache or computed once the model is loaded."""
+        with self._voice_lock:
+            if self._voice is None:
+                logger.info("Loading StyleTTS reference...")
+                self._voice = self.engine.compute_style(self.voice_path)
+        return self._voice
+
+    @staticmethod
+    def _to_pcm(wav_data: np.ndarray) -> bytes:
+        """Applies a fixed gain to a synthesized chunk, clips it to full scale and
+        converts it to 16-bit PCM."""
+        wav_data = np.clip(np.nan_to_num(wav_data * PCM_GAIN), -1.0, 1.0)
+        return (wav_data * 32767).astype(np.int16).tobytes()
+
+    def _synthesize_chunks(
+        self, texts: Iterable[str], chunks: queue.Queue, stop_event: threading.Event
+    ) -> None:
+        """Producer thread that queues the PCM of each chunk as soon as it is synthesized.
 
         Args:
-            frame_count: The number of frames of audio data the stream needs
-
-        Returns:
-            Tuple[bytes, int]: Tuple containing an audio chunk and a flag indicating if there are still chunks left to play.
+            texts (Iterable[str]): Messages for the TTS module to read, consumed lazily
+            chunks (queue.Queue): Queue the PCM chunks are put on, terminated by None
+            stop_event (threading.Event): Event that stops synthesis early
         """
-        bytes_to_read = frame_count * self.p.get_sample_size(pyaudio.paInt16)
-
-        chunk = self._audio_data[
-            self._audio_position : self._audio_position + bytes_to_read
-        ]
-
-        self._audio_position += bytes_to_read
-
-        if len(chunk) < bytes_to_read:
-            padding_size = bytes_to_read - len(chunk)
-            chunk += b"\x00" * padding_size
-            flag = pyaudio.paComplete
-        else:
-            flag = pyaudio.paContinue
-
-        return (chunk, flag)
+        start = time.perf_counter()
+        try:
+            for text in texts:
+                for wav_data in synthesize_stream(
+                    text=text,
+                    voice=self.voice,
+                    lngsteps=TTS_DIFFUSION_STEPS,
+                    engine=self.engine,
+                    sampler=TTS_SAMPLER,
+                    express=TTS_EXPRESS,
+                ):
+                    if stop_event.is_set():
+                        return
+                    chunks.put(self._to_pcm(wav_data))
+            end = time.perf_counter()
+            logger.info(f"TTS inference time: {(end - start):.3f} seconds")
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(None)
 
     def text_to_speech(self, text: str) -> None:
-        """Runs StyleTTS inference on provided text.
+        """Runs StyleTTS inference on provided text, playing each chunk as soon as it is ready.
 
         Args:
             text (str): Message for the TTS module to read
         """
+        self.stream_to_speech([text])
+
+    def stream_to_speech(self, texts: Iterable[str]) -> None:
+        """Speaks a stream of messages, synthesizing the next one while the current one plays.
+
+        Args:
+            texts (Iterable[str]): Messages for the TTS module to read, e.g. sentences streamed from the LLM
+        """
         logger.info("Running TTS Inference...")
+        chunks: queue.Queue = queue.Queue()
+        stop_event = threading.Event()
+        producer = threading.Thread(
+            target=self._synthesize_chunks,
+            args=(texts, chunks, stop_event),
+            daemon=True,
+        )
         start = time.perf_counter()
-        outputs = synthesize(text=text, voice=self.voice, lngsteps=20)
-        end = time.perf_counter()
-        logger.info(f"TTS inference time: {(end - start):.3f} seconds")
-
-        wav_data = outputs[1]
-        wav_data = wav_data / np.max(np.abs(wav_data))
-        self._audio_data = (wav_data * 32767).astype(np.int16).tobytes()
-        self._audio_position = 0
+        producer.start()
 
         self.stream = self.p.open(
             format=pyaudio.paInt16,
             channels=1,
             rate=24000,
             output=True,
-            stream_callback=self._audio_callback,
         )
-        logger.info("Playing audio...")
+        chunk_size = 1024
+        first_chunk = True
         try:
-            while self.stream.is_active():
-                time.sleep(0.05)
+            while (pcm := chunks.get()) is not None:
+                if isinstance(pcm, Exception):
+                    raise pcm
+                if first_chunk:
+                    logger.info(
+                        f"Time to first audio: {(time.perf_counter() - start):.3f} seconds"
+                    )
+                    logger.info("Playing audio...")
+                    first_chunk = False
+                for i in range(0, len(pcm), chunk_size):
+                    self.stream.write(pcm[i : i + chunk_size])
         except KeyboardInterrupt:
             logger.info("Playback interrupted by user.")
         finally:
+            stop_event.set()
             if self.stream:
                 self.stream.stop_stream()
                 self.stream.close()
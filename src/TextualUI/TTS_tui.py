@@ -2,11 +2,12 @@
 import os
 from dotenv import load_dotenv
 import pyaudio
+import queue
 import time
 import numpy as np
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 from rich.logging import RichHandler
 import threading
 
@@ -20,27 +21,48 @@ logging.basicConfig(
 logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
 
-from StyleTTS import msinference
-from StyleTTS.app import synthesize
+from StyleTTS.app import synthesize_stream
+from StyleTTS.engine import DEFAULT_SAMPLER, StyleTTSEngine
+from StyleTTS.phoneme_frontend import PhonemeFrontend
+from StyleTTS.style_cache import StyleCache
+
+TTS_SAMPLER = os.getenv("TTS_SAMPLER", DEFAULT_SAMPLER)
+TTS_DIFFUSION_STEPS = int(os.getenv("TTS_DIFFUSION_STEPS", "20"))
+TTS_EXPRESS = os.getenv("TTS_EXPRESS", "False").lower() in ("true", "1", "t")
+STYLE_CACHE_SIZE = int(os.getenv("STYLE_CACHE_SIZE", "128"))
+STYLE_CACHE_DIR = os.getenv("STYLE_CACHE_DIR")
+PHONEME_CACHE_PATH = os.getenv("PHONEME_CACHE_PATH")
+PHONEME_WORD_CACHE_SIZE = int(os.getenv("PHONEME_WORD_CACHE_SIZE", "0"))
+# Fixed gain applied to every chunk, so chunks keep their relative loudness
+PCM_GAIN = 1.0
 
 
 class TTS:
-    def __init__(self, character="hal9000"):
+    def __init__(self, character="hal9000", engine: Optional[StyleTTSEngine] = None):
         """Text-to-Speech module that takes a text input and outputs audio from StyleTTS inference.
 
+        The StyleTTS model is loaded in the background, so construction returns immediately
+        and the first synthesis waits for the model if it is not ready yet.
+
         Args:
             character (str, optional): StyleTTS character voice to be used. Defaults to "hal9000".
+            engine (StyleTTSEngine, optional): Engine to synthesize with. Defaults to a new engine.
         """
-        logger.info("Loading StyleTTS reference...")
-        self.voice = msinference.compute_style(
+        self.engine = engine or StyleTTSEngine(
+            style_cache=StyleCache(STYLE_CACHE_SIZE, STYLE_CACHE_DIR),
+            phoneme_frontend=PhonemeFrontend(
+                max_words=PHONEME_WORD_CACHE_SIZE, cache_path=PHONEME_CACHE_PATH
+            ),
+        )
+        self.engine.warm_up(background=True)
+        self.voice_path = (
             f"{Path(__file__).parent.parent}/StyleTTS/voices/{character}.wav"
         )
+        self._voice = None
+        self._voice_lock = threading.Lock()
 
         self.p = pyaudio.PyAudio()
         self.stream = None
-
-        self._audio_data = b""
-        self._audio_position = 0
         self.stream_lock = threading.Lock()
 
     def stop_playback(self) -> None:
@@ -52,24 +74,85 @@ class TTS:
                 self.stream.close()
                 self.stream = None
 
+    @property
+    def voice(self):
+        """Reference style of the character voice, read from the style cache or computed once the model is loaded."""
+        with self._voice_lock:
+            if self._voice is None:
+                logger.info("Loading StyleTTS reference...")
+                self._voice = self.engine.compute_style(self.voice_path)
+        return self._voice
+
+    @staticmethod
+    def _to_pcm(wav_data: np.ndarray) -> bytes:
+        """Applies a fixed gain to a synthesized chunk, clips it to full scale and
+        converts it to 16-bit PCM."""
+        wav_data = np.clip(np.nan_to_num(wav_data * PCM_GAIN), -1.0, 1.0)
+        return (wav_data * 32767).astype(np.int16).tobytes()
+
+    def _synthesize_chunks(
+        self, texts: Iterable[str], chunks: queue.Queue, stop_event: threading.Event
+    ) -> None:
+        """Producer thread that queues the PCM of each chunk as soon as it is synthesized.
+
+        Args:
+            texts (Iterable[str]): Messages for the TTS module to read, consumed lazily
+            chunks (queue.Queue): Queue the PCM chunks are put on, terminated by None
+            stop_event (threading.Event): Event that stops synthesis early
+        """
+        start = time.perf_counter()
+        try:
+            for text in texts:
+                for wav_data in synthesize_stream(
+                    text=text,
+                    voice=self.voice,
+                    lngsteps=TTS_DIFFUSION_STEPS,
+                    engine=self.engine,
+                    sampler=TTS_SAMPLER,
+                    express=TTS_EXPRESS,
+                ):
+                    if stop_event.is_set():
+                        return
+                    chunks.put(self._to_pcm(wav_data))
+            end = time.perf_counter()
+            logger.info(f"TTS inference time: {(end - start):.3f} seconds")
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(None)
+
     def text_to_speech(
         self, text: str, interrupt_event: Optional[threading.Event] = None
     ) -> None:
-        """Runs StyleTTS inference on provided text.
+        """Runs StyleTTS inference on provided text, playing each chunk as soon as it is ready.
 
         Args:
             text (str): Message for the TTS module to read
             interrupt_event (threading.Event): Event that interrupts TTS playback
         """
+        self.stream_to_speech([text], interrupt_event)
+
+    def stream_to_speech(
+        self,
+        texts: Iterable[str],
+        interrupt_event: Optional[threading.Event] = None,
+    ) -> None:
+        """Speaks a stream of messages, synthesizing the next one while the current one plays.
+
+        Args:
+            texts (Iterable[str]): Messages for the TTS module to read, e.g. sentences streamed from the LLM
+            interrupt_event (threading.Event): Event that interrupts TTS playback
+        """
         logger.info("Running TTS Inference...")
+        chunks: queue.Queue = queue.Queue()
+        stop_event = threading.Event()
+        producer = threading.Thread(
+            target=self._synthesize_chunks,
+            args=(texts, chunks, stop_event),
+            daemon=True,
+        )
         start = time.perf_counter()
-        outputs = synthesize(text=text, voice=self.voice, lngsteps=20)
-        end = time.perf_counter()
-        logger.info(f"TTS inference time: {(end - start):.3f} seconds")
-
-        wav_data = outputs[1]
-        wav_data = wav_data / np.max(np.abs(wav_data))
-        self._audio_data = (wav_data * 32767).astype(np.int16).tobytes()
+        producer.start()
 
         with self.stream_lock:
             self.stream = self.p.open(
@@ -79,26 +162,59 @@ class TTS:
                 output=True,
             )
 
-        logger.info("Playing audio...")
         chunk_size = 1024
+        first_chunk = True
         try:
-            for i in range(0, len(self._audio_data), chunk_size):
+            while True:
                 if interrupt_event and interrupt_event.is_set():
                     logger.info("TTS playback interrupted by event.")
                     break
-                with self.stream_lock:
-                    if self.stream:
-                        try:
-                            self.stream.write(self._audio_data[i : i + chunk_size])
-                        except (IOError, OSError) as e:
-                            logger.warning(f"Stream write error during playback: {e}")
-                            break
-                    else:
-                        break
+                try:
+                    pcm = chunks.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                if pcm is None:
+                    break
+                if isinstance(pcm, Exception):
+                    raise pcm
+                if first_chunk:
+                    logger.info(
+                        f"Time to first audio: {(time.perf_counter() - start):.3f} seconds"
+                    )
+                    logger.info("Playing audio...")
+                    first_chunk = False
+                if not self._write_pcm(pcm, chunk_size, interrupt_event):
+                    break
 
         finally:
+            stop_event.set()
             self.stop_playback()
 
+    def _write_pcm(
+        self,
+        pcm: bytes,
+        chunk_size: int,
+        interrupt_event: Optional[threading.Event] = None,
+    ) -> bool:
+        """Writes PCM data to the output stream in small slices so playback stays interruptible.
+
+        Returns:
+            bool: False if playback was interrupted or the stream was closed
+        """
+        for i in range(0, len(pcm), chunk_size):
+            if interrupt_event and interrupt_event.is_set():
+                logger.info("TTS playback interrupted by event.")
+                return False
+            with self.stream_lock:
+                if not self.stream:
+                    return False
+                try:
+                    self.stream.write(pcm[i : i + chunk_size])
+                except (IOError, OSError) as e:
+                    logger.warning(f"Stream write error during playback: {e}")
+                    return False
+        return True
+
     def close_stream(self) -> None:
         """Closes Pyaudio stream."""
         self.p.terminate()
@@ -1,10 +1,13 @@
 import os
 import sys
+import json
+import uuid
 import torch
 import requests
 import logging
 import threading
 from enum import Enum, auto
+from typing import Iterator
 from dotenv import load_dotenv
 
 from rich.logging import RichHandler
@@ -34,6 +37,8 @@ logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
 SERVER_URL = "http://127.0.0.1:8000"
 HEADERS = {"Content-Type": "application/json"}
+# Identifies this terminal's conversation to the controller
+SESSION_ID = uuid.uuid4().hex
 
 
 class AppState(Enum):
@@ -126,6 +131,33 @@ class HAL9000(App[None]):
             self.update_status("An error occurred. Press SPACE to try again.")
             logger.error(f"Worker failed: {event.result}")
 
+    def _stream_response(self, transcript: str, worker: Worker) -> Iterator[str]:
+        """Streams HAL's response from the controller, logging and yielding each sentence as it arrives."""
+        with requests.post(
+            f"{SERVER_URL}/query/stream",
+            json={"query": transcript, "session_id": SESSION_ID},
+            headers=HEADERS,
+            timeout=90,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if worker.is_cancelled:
+                    return
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "error" in event:
+                    raise RuntimeError(event["error"])
+
+                self.call_from_thread(self.add_log, "HAL9000", event["sentence"])
+                if self.state != AppState.SPEAKING:
+                    self.state = AppState.SPEAKING
+                    self.call_from_thread(
+                        self.update_status, "Speaking...", state_class="speaking"
+                    )
+                yield event["sentence"]
+
     def interaction_worker(self) -> None:
         """The main interaction loop running in a background thread."""
         self.stop_listening_event.clear()
@@ -146,26 +178,10 @@ class HAL9000(App[None]):
             )
 
             try:
-                response = requests.post(
-                    f"{SERVER_URL}/query",
-                    json={"query": transcript},
-                    headers=HEADERS,
-                    timeout=90,
-                )
-                response.raise_for_status()
-                response_text = response.json()["response"]
-
-                if worker.is_cancelled:
-                    return
-
-                self.call_from_thread(self.add_log, "HAL9000", response_text)
-
-                self.state = AppState.SPEAKING
-                self.call_from_thread(
-                    self.update_status, "Speaking...", state_class="speaking"
+                self.tts_module.stream_to_speech(
+                    self._stream_response(transcript, worker),
+                    self.stop_speaking_event,
                 )
-                self.tts_module.text_to_speech(response_text, self.stop_speaking_event)
-
             except requests.exceptions.RequestException as e:
                 error_message = f"Connection failed: {e}"
                 if not worker.is_cancelled:
@@ -1,14 +1,15 @@
 import os
 from dotenv import load_dotenv
 import sys
+import json
+import uuid
 import torch
 import requests
 import logging
+from typing import Iterator
 from rich.console import Console
 from rich.logging import RichHandler
 
-from StyleTTS.utils import initialize_nltk
-
 load_dotenv()
 console = Console()
 
@@ -36,9 +37,36 @@ from TTS import TTS
 
 headers = {"Content-Type": "application/json"}
 server_url = "http://127.0.0.1:8000"
+# Identifies this terminal's conversation to the controller
+session_id = uuid.uuid4().hex
+
+
+class ControllerError(Exception):
+    """Error the controller reported while generating a response, e.g. from Ollama."""
+
+
+def stream_response(user_input: str) -> Iterator[str]:
+    """Streams HAL's response from the controller, yielding each sentence as soon as it arrives."""
+    with requests.post(
+        f"{server_url}/query/stream",
+        json={"query": user_input, "session_id": session_id},
+        headers=headers,
+        stream=True,
+    ) as response:
+        response.raise_for_status()
+        console.print("[bold green]HAL9000 said:[/bold green]")
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if "error" in event:
+                raise ControllerError(event["error"])
+            console.print(f"\t[i]{event['sentence']}[/i]")
+            yield event["sentence"]
+        console.print()
+
 
 if __name__ == "__main__":
-    initialize_nltk()
     tts_module = TTS(character="hal9000")
     gpu = torch.cuda.is_available()
     if gpu:
@@ -58,24 +86,24 @@ if __name__ == "__main__":
             )
             console.print("Asking HAL...\n", style="bold green")
             try:
-                llm_response = requests.post(
-                    f"{server_url}/query",
-                    json={"query": user_input},
-                    headers=headers,
-                )
-                response_text = llm_response.json()["response"]
-                console.print(
-                    f"[bold green]HAL9000 said:[/bold green]\n\t[i]{response_text}[/i]\n"
+                tts_module.stream_to_speech(stream_response(user_input))
+            except (ControllerError, requests.exceptions.HTTPError) as e:
+                logger.error(
+                    f"No response from Ollama: {e}. Make sure Ollama is running."
                 )
-                tts_module.text_to_speech(response_text)
-            except requests.exceptions.JSONDecodeError:
-                logger.error("No response from Ollama. Make sure Ollama is running.")
                 sys.exit(1)
             except requests.exceptions.ConnectionError:
                 logger.error(
                     "No response from the FastAPI server.  Make sure it is running."
                 )
                 sys.exit(1)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Lost the connection to the FastAPI server: {e}")
+                sys.exit(1)
+            except Exception as e:
+                # Raised by the TTS module, e.g. when StyleTTS failed to load
+                logger.error(f"Text-to-speech failed: {e}")
+                sys.exit(1)
     except KeyboardInterrupt:
         console.print("User interrupted, [i]exiting...[/i]", style="bold red")
         sys.exit(0)
@@ -0,0 +1,757 @@
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+import torch
+import yaml
+
+# StyleTTS imports its own modules as the top-level `StyleTTS` package
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+)
+
+from StyleTTS.engine import (
+    BUNDLE_FORMAT,
+    BUNDLE_VERSION,
+    SAMPLERS,
+    StyleTTSEngine,
+    chunk_seed,
+    length_regulate,
+    length_to_mask,
+)
+from StyleTTS.export import export_inference_bundle
+from StyleTTS.models import (
+    INFERENCE_MODULES,
+    ProsodyPredictor,
+    StyleEncoder,
+    TextEncoder,
+    build_inference_model,
+    load_model_weights,
+)
+from StyleTTS.Modules.diffusion import sampler as samplers
+from StyleTTS.Modules.hifigan import AdaINResBlock1
+from StyleTTS.Modules.diffusion.modules import StyleTransformer1d
+from StyleTTS.optimize import fold_weight_norms
+from StyleTTS.phoneme_frontend import PhonemeFrontend
+from StyleTTS.style_cache import StyleCache
+from StyleTTS.text_frontend import (
+    TextCleaner,
+    normalize_text,
+    split_and_recombine_text,
+    tokenize_phonemes,
+)
+from StyleTTS.text_utils import dicts
+from StyleTTS.utils import load_checkpoint, memory_usage, recursive_munch
+from StyleTTS.Utils.PLBERT.util import build_plbert
+
+
+@pytest.fixture
+def style_transformer():
+    torch.manual_seed(0)
+    return StyleTransformer1d(
+        num_layers=2,
+        channels=16,
+        num_heads=2,
+        head_features=8,
+        multiplier=2,
+        context_features=16,
+        context_embedding_features=12,
+    ).eval()
+
+
+def test_style_transformer_ignores_padding(style_transformer):
+    """A padded batch of embeddings should give the same styles as running each
+    embedding on its own, with and without classifier-free guidance.
+    """
+    lengths = torch.LongTensor([9, 5])
+    embedding = torch.randn(2, 9, 12)
+    x, time, features = torch.randn(2, 1, 16), torch.rand(2), torch.randn(2, 16)
+
+    for embedding_scale in (1.0, 2.0):
+        with torch.no_grad():
+            batched = style_transformer(
+                x,
+                time,
+                embedding=embedding,
+                features=features,
+                embedding_scale=embedding_scale,
+                embedding_padding_mask=length_to_mask(lengths),
+            )
+            for i, length in enumerate(lengths):
+                single = style_transformer(
+                    x[i : i + 1],
+                    time[i : i + 1],
+                    embedding=embedding[i : i + 1, :length],
+                    features=features[i : i + 1],
+                    embedding_scale=embedding_scale,
+                )
+                assert torch.allclose(batched[i], single[0], atol=1e-5)
+
+
+def test_style_transformer_prepared_invariants_match(style_transformer):
+    """Reusing the invariants from `prepare` across denoising steps should give the
+    same output as recomputing them at every step.
+    """
+    embedding = torch.randn(2, 9, 12)
+    features = torch.randn(2, 16)
+    mask = length_to_mask(torch.LongTensor([9, 5]))
+
+    for embedding_scale in (1.0, 2.0):
+        kwargs = dict(
+            embedding=embedding,
+            features=features,
+            embedding_scale=embedding_scale,
+            embedding_padding_mask=mask,
+        )
+        with torch.no_grad():
+            prepared = style_transformer.prepare(**kwargs)
+            for _ in range(3):
+                x, time = torch.randn(2, 1, 16), torch.rand(2)
+                assert torch.allclose(
+                    style_transformer(x, time, **prepared),
+                    style_transformer(x, time, **kwargs),
+                    atol=1e-6,
+                )
+
+
+def test_style_transformer_batches_guidance(style_transformer):
+    """Guidance should run the conditional and unconditional passes as one batch
+    and combine them like two separate runs would.
+    """
+    x, time = torch.randn(2, 1, 16), torch.rand(2)
+    embedding, features = torch.randn(2, 9, 12), torch.randn(2, 16)
+    mask = length_to_mask(torch.LongTensor([9, 5]))
+
+    with torch.no_grad():
+        out = style_transformer.run(x, time, embedding, features, mask)
+        out_masked = style_transformer.run(
+            x, time, style_transformer.fixed_embedding(embedding), features, mask
+        )
+        guided = style_transformer(
+            x,
+            time,
+            embedding=embedding,
+            features=features,
+            embedding_scale=3.0,
+            embedding_padding_mask=mask,
+        )
+    assert torch.allclose(guided, out_masked + (out - out_masked) * 3.0, atol=1e-5)
+
+
+def dense_alignment(x, durations, shift):
+    """The alignment-matrix expansion that `length_regulate` replaces."""
+    aln = torch.zeros(x.shape[-1], int(durations.sum()))
+    c_frame = 0
+    for i, duration in enumerate(durations.tolist()):
+        aln[i, c_frame : c_frame + duration] = 1
+        c_frame += duration
+    out = x @ aln
+    if shift:
+        out = torch.cat([out[:, :1], out[:, :-1]], dim=-1)
+    return out
+
+
+@pytest.mark.parametrize("shift", [False, True])
+def test_length_regulate_matches_alignment_matrix(shift):
+    """Each item of a padded batch should be expanded exactly like the dense
+    alignment matrix would expand it, with zeros past its last frame.
+    """
+    torch.manual_seed(0)
+    x = torch.randn(2, 4, 6)
+    durations = torch.LongTensor([[3, 1, 2, 5, 1, 2], [2, 4, 1, 0, 0, 0]])
+
+    out, frame_lengths = length_regulate(x, durations, shift)
+
+    assert frame_lengths.tolist() == [14, 7]
+    assert out.shape == (2, 4, 14)
+    for i, length in enumerate([6, 3]):
+        expected = dense_alignment(x[i, :, :length], durations[i, :length], shift)
+        frames = expected.shape[-1]
+        assert torch.equal(out[i, :, :frames], expected)
+        assert not out[i, :, frames:].any()
+
+
+@pytest.mark.parametrize("lengths", [[7, 7], [7, 4]], ids=["uniform", "ragged"])
+def test_inference_paths_match_training_paths(lengths):
+    """The inference methods of the text encoder, duration encoder and duration
+    predictor should reproduce the outputs of their training `forward`.
+    """
+    torch.manual_seed(0)
+    text_encoder = TextEncoder(channels=16, kernel_size=5, depth=2, n_symbols=20).eval()
+    predictor = ProsodyPredictor(style_dim=8, d_hid=16, nlayers=2, max_dur=10).eval()
+    lengths = torch.LongTensor(lengths)
+    mask = length_to_mask(lengths)
+    tokens = torch.randint(1, 20, (2, 7)).masked_fill(mask, 0)
+    style = torch.randn(2, 8)
+
+    with torch.no_grad():
+        t_en = text_encoder(tokens, lengths, mask)
+        assert torch.allclose(
+            text_encoder.infer(tokens, lengths, mask), t_en, atol=1e-6
+        )
+
+        d = predictor.text_encoder(t_en, style, lengths, mask)
+        d_infer = predictor.text_encoder.infer(t_en, style, lengths, mask)
+        assert torch.allclose(d_infer, d, atol=1e-6)
+
+        duration, _ = predictor(t_en, style, lengths, torch.zeros(2, 7, 1), mask)
+        duration_infer = predictor.infer_duration(d_infer, lengths, mask)
+        assert torch.allclose(duration_infer, duration, atol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "name, num_steps, tolerance",
+    [
+        ("euler", 50, 0.05),
+        ("heun", 20, 0.01),
+        ("dpmpp_2m", 5, 0.1),
+        ("dpmpp_2m", 20, 0.01),
+    ],
+)
+def test_deterministic_samplers_solve_probability_flow(name, num_steps, tolerance):
+    """For Gaussian data the ideal denoiser and the end of the probability flow ODE
+    are known in closed form, so the samplers can be checked against it.
+    """
+    class_name, sigma_min, rho = SAMPLERS[name]
+    sigma_data, sigma_max = 0.2, 3.0
+    torch.manual_seed(0)
+    noise = torch.randn(4, 1, 256)
+    schedule = samplers.KarrasSchedule(sigma_min, sigma_max, rho)
+
+    def denoise(x, sigma):
+        return x * sigma_data**2 / (sigma_data**2 + sigma**2)
+
+    x = getattr(samplers, class_name)()(
+        noise, fn=denoise, sigmas=schedule(num_steps, "cpu"), num_steps=num_steps
+    )
+    expected = noise * sigma_max * sigma_data / (sigma_data**2 + sigma_max**2) ** 0.5
+    assert (x - expected).norm() / expected.norm() < tolerance
+
+
+def test_style_cache_evicts_least_recently_used(tmp_path):
+    """The in-memory cache should stay bounded, and entries evicted from it should
+    still be read back from the cache directory.
+    """
+    cache = StyleCache(max_entries=2, cache_dir=tmp_path)
+    keys = [StyleCache.make_key("voice", [0, i], "adpm2", 5, 1, 0) for i in range(3)]
+    styles = torch.randn(3, 256)
+    for i, key in enumerate(keys[:2]):
+        cache.put(key, torch.randn(4, 12), styles[i])
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], torch.randn(4, 12), styles[2])
+
+    assert len(cache) == 2 and cache.evictions == 1
+    assert keys[1] not in cache._entries
+    assert torch.equal(cache.get(keys[1])["style"], styles[1])
+    assert torch.equal(StyleCache(cache_dir=tmp_path).get(keys[2])["style"], styles[2])
+    assert cache.get(StyleCache.make_key("voice", [0, 1], "adpm2", 5, 1, 1)) is None
+
+
+def test_style_cache_directory_is_bounded(tmp_path):
+    """Only styles should be written to disk, and the least recently used files
+    deleted once the directory holds `max_disk_entries`.
+    """
+    cache = StyleCache(max_entries=4, cache_dir=tmp_path, max_disk_entries=2)
+    keys = [StyleCache.make_key("voice", [0, i]) for i in range(3)]
+    for key in keys:
+        cache.put(key, torch.randn(4, 12), torch.randn(256))
+
+    assert sorted(p.stem for p in tmp_path.iterdir()) == sorted(keys[1:])
+    restarted = StyleCache(cache_dir=tmp_path, max_disk_entries=2)
+    assert restarted.get(keys[0]) is None
+    assert set(restarted.get(keys[2])) == {"style"}
+
+
+def test_adpm2_step_noise_does_not_depend_on_batch():
+    """With a generator per item, a sample should be the same alone and in a batch."""
+    _, sigma_min, rho = SAMPLERS["adpm2"]
+    schedule = samplers.KarrasSchedule(sigma_min, 3.0, rho)
+    noise = torch.randn(2, 1, 256)
+
+    def sample(items):
+        return samplers.ADPM2Sampler()(
+            noise[items],
+            fn=lambda x, sigma: x / (1 + sigma**2),
+            sigmas=schedule(5, "cpu"),
+            num_steps=5,
+            generators=[torch.Generator().manual_seed(i) for i in items],
+        )
+
+    assert torch.allclose(sample([0, 1])[1], sample([1])[0])
+
+
+def test_disabled_style_cache_stores_nothing():
+    cache = StyleCache(max_entries=0)
+    key = StyleCache.make_key("voice", [0, 1])
+    cache.put(key, torch.randn(4, 12), torch.randn(256))
+    assert cache.get(key) is None
+    assert len(cache) == 0
+
+
+class RecordingBackend:
+    """Stands in for espeak, phonemizing every word to its upper-case spelling."""
+
+    def __init__(self):
+        self.calls = []
+
+    def phonemize(self, texts):
+        self.calls.append(list(texts))
+        return [text.upper() for text in texts]
+
+
+def test_phoneme_frontend_batches_and_caches(tmp_path):
+    """Uncached chunks should be phonemized in one backend call, and chunks made of
+    known words put together from the word cache, also after a restart.
+    """
+    backend = RecordingBackend()
+    cache_path = tmp_path / "phonemes.json"
+    frontend = PhonemeFrontend(backend, max_words=100, cache_path=cache_path)
+
+    assert frontend.phonemize(["I'm sorry, Dave.", "Open the pod bay doors."]) == [
+        "I'M SORRY, DAVE.",
+        "OPEN THE POD BAY DOORS.",
+    ]
+    assert len(backend.calls) == 1
+    frontend.flush()
+    assert [p.name for p in tmp_path.iterdir()] == ["phonemes.json"]
+
+    restarted = PhonemeFrontend(backend, max_words=100, cache_path=cache_path)
+    assert restarted.phonemize(["I'm  sorry, Dave.", "Open the doors, Dave!"]) == [
+        "I'M SORRY, DAVE.",
+        "OPEN THE DOORS, DAVE!",
+    ]
+    assert restarted.phonemize(["Goodbye, Dave."]) == ["GOODBYE, DAVE."]
+    assert backend.calls[1:] == [["Goodbye, Dave."]]
+    assert restarted.stats()["sentence_hits"] == 1
+    assert restarted.stats()["word_hits"] == 1
+
+
+class DictionaryBackend:
+    """Stands in for espeak with fixed phonemes per sentence."""
+
+    def __init__(self, phonemes):
+        self.phonemes = phonemes
+        self.calls = []
+
+    def phonemize(self, texts):
+        self.calls.append(list(texts))
+        return [self.phonemes[text] for text in texts]
+
+
+def test_phoneme_frontend_does_not_compose_homographs():
+    """Words should be cached with their case, and chunks with homographs, whose
+    pronunciation depends on the sentence, always phonemized by the backend.
+    """
+    backend = DictionaryBackend(
+        {
+            "I read it yesterday.": "aɪ ɹˈɛd ɪt jˈɛstɚdeɪ.",
+            "The US said it.": "ðə jˌuːˈɛs sˈɛd ɪt.",
+            "Read it to us.": "ɹˈiːd ɪt tʊ ʌs.",
+            "I said it to us.": "aɪ sˈɛd ɪt tʊ ʌs.",
+        }
+    )
+    frontend = PhonemeFrontend(backend, max_words=100)
+    frontend.phonemize(["I read it yesterday.", "The US said it."])
+
+    assert frontend.phonemize(["Read it to us.", "I said it to us."]) == [
+        "ɹˈiːd ɪt tʊ ʌs.",
+        "aɪ sˈɛd ɪt tʊ ʌs.",
+    ]
+    assert backend.calls[1] == ["Read it to us.", "I said it to us."]
+    assert frontend.phonemize(["US said it.", "I said it."]) == [
+        "jˌuːˈɛs sˈɛd ɪt.",
+        "aɪ sˈɛd ɪt.",
+    ]
+    assert len(backend.calls) == 2
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        (
+            "It is 72°F with 5-10 mph winds and 45% humidity.",
+            "It is seventy-two degrees Fahrenheit with five to ten miles per hour "
+            "winds and forty-five percent humidity.",
+        ),
+        (
+            "The reading is 10.8, up 1 km.",
+            "The reading is ten point eight, up one kilometer.",
+        ),
+        (
+            "It costs $5.50 & €2.5 million.",
+            "It costs five dollars and fifty cents and two point five million euros.",
+        ),
+        ("See you at 3 p.m. Then we talk.", "See you at three P M. Then we talk."),
+        (
+            "It is 14:05 on 2001-01-12.",
+            "It is two oh five P M on January twelfth, two thousand one.",
+        ),
+        (
+            "HAL 9000 went online in 1992.",
+            "HAL nine thousand went online in nineteen ninety-two.",
+        ),
+        ("I'm sorry, Dave.", "I'm sorry, Dave."),
+        ("Call 555-1234.", "Call five five five, one two three four."),
+        ("It ended 3-2.", "It ended three-two."),
+        (
+            "It takes between 3-5 days, from pages 10–20.",
+            "It takes between three and five days, from pages ten to twenty.",
+        ),
+        ("Add 1/2 cup, not 3/4.", "Add one half cup, not three quarters."),
+        ("Music of the 1990s.", "Music of the nineteen nineties."),
+        ("Drink H2O.", "Drink H2O."),
+        (
+            "Ping 192.168.1.1 now.",
+            "Ping one hundred ninety-two dot one hundred sixty-eight dot one dot one now.",
+        ),
+        ("Install version 3.5.1.", "Install version three dot five dot one."),
+        (
+            "Call 1-800-555-1234.",
+            "Call one, eight zero zero, five five five, one two three four.",
+        ),
+        ("Open between 3-5 pm.", "Open between three and five P M."),
+        ("Open 9-5 p.m. daily.", "Open nine to five P M daily."),
+    ],
+)
+def test_normalize_text(text, expected):
+    assert normalize_text(text) == expected
+
+
+def test_split_and_recombine_text_keeps_sentences():
+    text = "Open the pod bay doors, HAL. \"I'm sorry. Dave.\" I can't do that!  Why?"
+    assert split_and_recombine_text(text, desired_length=1) == [
+        "Open the pod bay doors, HAL.",
+        "\"I'm sorry. Dave.\" I can't do that!",
+        "Why?",
+    ]
+    long_text = "word " * 100
+    chunks = split_and_recombine_text(long_text, desired_length=50, max_length=80)
+    assert all(len(chunk) <= 80 for chunk in chunks)
+    assert " ".join(chunks) == long_text.strip()
+
+
+def test_text_cleaner_maps_phoneme_tokens():
+    phonemes = tokenize_phonemes("aɪm sˈɑːɹi, dˈeɪv.")
+    assert phonemes == "aɪm sˈɑːɹi , dˈeɪv ."
+    assert TextCleaner()(phonemes + "☃") == [dicts[c] for c in phonemes]
+
+
+# The smallest model the engine can run: the HiFi-GAN decoder hard-codes 512 hidden
+# channels and the engine 128-dimensional styles, and `max_dur` keeps the random
+# durations, and so the decoded audio, short
+TINY_MODEL_PARAMS = {
+    "multispeaker": True,
+    "dim_in": 16,
+    "hidden_dim": 512,
+    "max_conv_dim": 512,
+    "n_layer": 1,
+    "n_mels": 80,
+    "n_token": 178,
+    "max_dur": 2,
+    "style_dim": 128,
+    "dropout": 0.0,
+    "decoder": {
+        "type": "hifigan",
+        "resblock_kernel_sizes": [3],
+        "upsample_rates": [10, 5, 3, 2],
+        "upsample_initial_channel": 512,
+        "resblock_dilation_sizes": [[1, 3, 5]],
+        "upsample_kernel_sizes": [20, 10, 6, 4],
+    },
+    "diffusion": {
+        "embedding_mask_proba": 0.1,
+        "transformer": {
+            "num_layers": 1,
+            "num_heads": 2,
+            "head_features": 8,
+            "multiplier": 2,
+        },
+        "dist": {
+            "sigma_data": 0.2,
+            "estimate_sigma_data": True,
+            "mean": -3.0,
+            "std": 1.0,
+        },
+    },
+}
+TINY_PLBERT_PARAMS = {
+    "vocab_size": 178,
+    "hidden_size": 32,
+    "num_attention_heads": 2,
+    "intermediate_size": 64,
+    "max_position_embeddings": 512,
+    "num_hidden_layers": 1,
+    "dropout": 0.1,
+}
+
+
+def build_tiny_model(seed=0):
+    torch.manual_seed(seed)
+    return build_inference_model(
+        recursive_munch(TINY_MODEL_PARAMS), build_plbert(TINY_PLBERT_PARAMS)
+    )
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    return build_tiny_model()
+
+
+@pytest.fixture(scope="module")
+def tiny_bundle(tmp_path_factory, tiny_model):
+    path = tmp_path_factory.mktemp("bundle") / "tiny.inference.pt"
+    torch.save(
+        {
+            "format": BUNDLE_FORMAT,
+            "version": BUNDLE_VERSION,
+            "model_params": TINY_MODEL_PARAMS,
+            "plbert_params": TINY_PLBERT_PARAMS,
+            "dtype": "float32",
+            "net": {key: tiny_model[key].state_dict() for key in tiny_model},
+        },
+        path,
+    )
+    return path
+
+
+@pytest.fixture
+def fake_phonemizer(monkeypatch):
+    """Replaces espeak, which the engine loads with the model, by `RecordingBackend`."""
+    backend = types.SimpleNamespace(EspeakBackend=lambda **kwargs: RecordingBackend())
+    monkeypatch.setitem(
+        sys.modules, "phonemizer", types.SimpleNamespace(backend=backend)
+    )
+
+
+@pytest.fixture
+def engine(tiny_bundle, fake_phonemizer):
+    return StyleTTSEngine(checkpoint_path=tiny_bundle, device="cpu", optimize=False)
+
+
+def test_engine_loads_lazily(engine):
+    assert not engine.is_loaded
+    assert engine.phonemizer is None
+
+    assert engine.wait_ready()
+    assert engine.is_loaded
+    model = engine.model
+    assert engine.load() is engine
+    assert engine.model is model
+
+
+def test_engine_warms_up_in_background(engine):
+    thread = engine.warm_up(background=True)
+    assert engine.warm_up(background=True) is thread
+    assert engine.wait_ready(timeout=60)
+    assert engine.is_loaded
+
+
+def test_warm_up_bypasses_caches_and_does_not_race_synthesis(
+    tiny_bundle, fake_phonemizer, tmp_path
+):
+    """Synthesis started during a background warm-up should wait for it and match
+    synthesis on a warm engine, and the warm-up should leave the caches empty."""
+    ref_s = torch.randn(1, 256)
+    warm = StyleTTSEngine(checkpoint_path=tiny_bundle, device="cpu", optimize=False)
+    expected = warm.inference("Hello.", ref_s, diffusion_steps=2)
+
+    engine = StyleTTSEngine(
+        checkpoint_path=tiny_bundle,
+        device="cpu",
+        optimize=False,
+        style_cache=StyleCache(cache_dir=tmp_path),
+    )
+    engine.warm_up(background=True)
+    audio = engine.inference("Hello.", ref_s, diffusion_steps=2)
+    assert np.allclose(audio, expected, atol=1e-5)
+
+    engine.wait_ready()
+    assert len(engine.phoneme_frontend) == 1
+    assert engine.style_cache.stats()["disk_size"] == 1
+
+
+def test_wait_ready_raises_background_load_error(tmp_path, fake_phonemizer):
+    engine = StyleTTSEngine(checkpoint_path=tmp_path / "missing.pth", optimize=False)
+    engine.warm_up(background=True).join(timeout=60)
+
+    with pytest.raises(RuntimeError, match="failed to load") as info:
+        engine.wait_ready()
+    assert isinstance(info.value.__cause__, FileNotFoundError)
+    assert not engine.is_loaded
+
+
+def test_export_bundle_round_trip(tmp_path, tiny_model):
+    """A bundle exported from a training checkpoint should hold only the inference
+    networks, with the DataParallel prefix stripped, and load back into a freshly
+    built model unchanged.
+    """
+    plbert_dir = tmp_path / "PLBERT"
+    plbert_dir.mkdir()
+    (plbert_dir / "config.yml").write_text(
+        yaml.safe_dump({"model_params": TINY_PLBERT_PARAMS})
+    )
+    config_path = tmp_path / "config.yml"
+    config_path.write_text(
+        yaml.safe_dump(
+            {"model_params": TINY_MODEL_PARAMS, "PLBERT_dir": str(plbert_dir)}
+        )
+    )
+    net = {
+        key: {f"module.{k}": v for k, v in tiny_model[key].state_dict().items()}
+        for key in tiny_model
+    }
+    net["mpd"] = {"module.weight": torch.zeros(1)}
+    checkpoint_path = tmp_path / "model.pth"
+    torch.save({"net": net, "optimizer": {}}, checkpoint_path)
+
+    bundle_path = export_inference_bundle(
+        tmp_path / "model.inference.pt", config_path, checkpoint_path
+    )
+    bundle = torch.load(bundle_path)
+    assert bundle["format"] == BUNDLE_FORMAT
+    assert bundle["plbert_params"] == TINY_PLBERT_PARAMS
+    assert list(bundle["net"]) == list(INFERENCE_MODULES)
+
+    model = build_tiny_model(seed=1)
+    load_model_weights(model, bundle["net"], assign=True)
+    for key in tiny_model:
+        expected = tiny_model[key].state_dict()
+        loaded = model[key].state_dict()
+        assert loaded.keys() == expected.keys()
+        assert all(torch.equal(loaded[k], expected[k]) for k in expected)
+
+
+def test_engine_rejects_bundle_without_plbert(tmp_path, tiny_bundle, fake_phonemizer):
+    bundle = torch.load(tiny_bundle)
+    del bundle["net"]["bert"]
+    torch.save(bundle, tmp_path / "no_bert.inference.pt")
+    engine = StyleTTSEngine(
+        checkpoint_path=tmp_path / "no_bert.inference.pt", optimize=False
+    )
+    with pytest.raises(ValueError, match="without PL-BERT weights"):
+        engine.load()
+
+
+def test_load_model_weights_takes_over_checkpoint_tensors(tiny_bundle):
+    """With `assign`, the networks should use the memory-mapped checkpoint tensors
+    instead of copies of them."""
+    params = load_checkpoint(tiny_bundle)["net"]
+    model = build_tiny_model(seed=1)
+    load_model_weights(model, params, assign=True)
+    for key in model:
+        for name, tensor in model[key].state_dict().items():
+            assert tensor.data_ptr() == params[key][name].data_ptr(), f"{key}.{name}"
+
+
+def test_memory_usage_reports_resident_set_size():
+    current, peak = memory_usage()
+    assert current > 0 and peak > 0
+
+
+def test_compute_style_cache_follows_voice_and_checkpoint(tmp_path, monkeypatch):
+    """The `.style.pt` next to a voice should be reused until the voice file or the
+    checkpoint changes."""
+    checkpoint_path = tmp_path / "model.pth"
+    checkpoint_path.write_bytes(b"weights")
+    voice_path = tmp_path / "voice.wav"
+    voice_path.write_bytes(b"voice")
+    engine = StyleTTSEngine(checkpoint_path=checkpoint_path, optimize=False)
+    computed = []
+
+    def compute_style(path):
+        computed.append(path)
+        return torch.full((1, 256), float(len(computed)))
+
+    monkeypatch.setattr(engine, "_compute_style", compute_style)
+
+    assert engine.compute_style(voice_path)[0, 0] == 1
+    assert voice_path.with_suffix(".style.pt").exists()
+    assert engine.compute_style(voice_path)[0, 0] == 1
+    assert len(computed) == 1
+
+    voice_path.write_bytes(b"another voice")
+    assert engine.compute_style(voice_path)[0, 0] == 2
+    assert engine.compute_style(voice_path)[0, 0] == 2
+
+    stat = checkpoint_path.stat()
+    os.utime(checkpoint_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert engine.compute_style(voice_path)[0, 0] == 3
+
+    assert engine.compute_style(voice_path, use_cache=False)[0, 0] == 4
+    assert engine.compute_style(voice_path)[0, 0] == 3
+    assert len(computed) == 4
+
+
+@pytest.mark.parametrize("norm", ["weight_norm", "spectral_norm"])
+def test_fold_weight_norms_keeps_outputs(norm):
+    torch.manual_seed(0)
+    if norm == "weight_norm":
+        module = AdaINResBlock1(16, kernel_size=3, style_dim=8)
+        inputs = (torch.randn(1, 16, 40), torch.randn(1, 8))
+    else:
+        module = StyleEncoder(dim_in=8, style_dim=8, max_conv_dim=16)
+        inputs = (torch.randn(1, 1, 80, 96),)
+    module.eval()
+
+    with torch.no_grad():
+        expected = module(*inputs)
+        assert fold_weight_norms(module) > 0
+        assert fold_weight_norms(module) == 0
+        assert torch.allclose(module(*inputs), expected, atol=1e-5)
+
+
+def test_express_inference_skips_style_diffusion(engine, monkeypatch):
+    """Express synthesis should speak in the reference style itself, as if `alpha`
+    and `beta` were 0, without sampling the style diffusion."""
+    texts = ["Open the pod bay doors.", "Hi."]
+    torch.manual_seed(0)
+    ref_s = torch.randn(1, 256)
+    expected = engine.inference_batch(texts, ref_s, alpha=0, beta=0)
+
+    def no_diffusion(*args, **kwargs):
+        raise AssertionError("the style diffusion should not run")
+
+    monkeypatch.setattr(engine, "_bert_and_styles", no_diffusion)
+    audios = engine.inference_batch(texts, ref_s, express=True)
+    assert [len(a) for a in audios] == [len(a) for a in expected]
+    for audio, reference in zip(audios, expected):
+        assert np.allclose(audio, reference, atol=1e-5)
+
+
+def test_cached_styles_match_sampled_styles(engine, tmp_path):
+    """A batch mixing chunks from the style cache, in memory or on disk, with new
+    chunks should get the same PL-BERT outputs and styles as sampling all of them."""
+    engine.load()
+    token_lists = engine._tokenize_batch(["Open the pod bay doors.", "Hi.", "Dave?"])
+    chunk_seeds = [chunk_seed(0, tokens) for tokens in token_lists]
+    torch.manual_seed(0)
+    ref_s = torch.randn(1, 256)
+
+    def bert_and_styles(indices):
+        tokens, _, text_mask = engine._pad_tokens([token_lists[i] for i in indices])
+        with torch.no_grad():
+            return engine._bert_and_styles(
+                tokens,
+                [token_lists[i] for i in indices],
+                text_mask,
+                ref_s,
+                2,
+                1,
+                "adpm2",
+                [chunk_seeds[i] for i in indices],
+            )
+
+    expected_bert, expected_styles = bert_and_styles([0, 1, 2])
+    engine.style_cache = StyleCache(cache_dir=tmp_path)
+    bert_and_styles([1])
+    for cache in (engine.style_cache, StyleCache(cache_dir=tmp_path)):
+        engine.style_cache = cache
+        bert, styles = bert_and_styles([0, 1, 2])
+        assert cache.stats()["hits"] == 1
+        assert torch.allclose(styles, expected_styles, atol=1e-5)
+        for i, tokens in enumerate(token_lists):
+            assert torch.allclose(
+                bert[i, : len(tokens)], expected_bert[i, : len(tokens)], atol=1e-5
+            )
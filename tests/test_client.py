@@ -1,12 +1,26 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
 import pytest
 from unittest.mock import patch, AsyncMock, MagicMock
+from mcp import types
+from mcp.server.fastmcp import FastMCP
 
 pytestmark = pytest.mark.asyncio
 
-from src.LLM.client import MCPOllamaClient
+from src.LLM.client import ContextWindow, MCPOllamaClient, SUMMARY_PREFIX
+from src.LLM.sessions import ConversationStore
+from src.LLM.tool_cache import ToolResultCache
+from src.LLM.tool_providers import FastMCPToolProvider
+from src.LLM.llm_utils import generate_llm_response, pop_sentences
 
 STDIO_CLIENT_PATH = "src.LLM.client.stdio_client"
 CLIENT_SESSION_PATH = "src.LLM.client.ClientSession"
+STREAM_LLM_PATH = "src.LLM.client.stream_llm_response"
+GENERATE_LLM_PATH = "src.LLM.client.generate_llm_response"
 
 
 @pytest.fixture
@@ -25,8 +39,9 @@ def mocked_mcp_env():
 async def test_initialization():
     """Tests that the client initializes correctly."""
     client = MCPOllamaClient()
-    assert len(client.chat_messages) == 1
-    assert client.chat_messages[0]["role"] == "system"
+    messages = client.conversations.get().messages
+    assert len(messages) == 1
+    assert messages[0]["role"] == "system"
     await client.cleanup()
 
 
@@ -38,3 +53,620 @@ async def test_cleanup(mocked_mcp_env):
     await client.cleanup()
 
     client.exit_stack.aclose.assert_awaited_once()
+
+
+async def test_pop_sentences():
+    """Tests that only complete sentences are split off a streamed buffer."""
+    sentences, remainder = pop_sentences("It is 10.8 degrees. Good night, Dave! I am")
+
+    assert sentences == ["It is 10.8 degrees.", "Good night, Dave!"]
+    assert remainder == "I am"
+
+
+async def test_process_query_stream():
+    """Tests that streamed LLM chunks are yielded as cleaned sentences and stored in history."""
+    client = MCPOllamaClient()
+    chunks = [
+        {"content": "Hello, *Dave*. How"},
+        {"content": " are you? I am"},
+        {"content": " fine"},
+    ]
+
+    async def mock_stream(llm, messages, tools):
+        for chunk in chunks:
+            yield chunk
+
+    with patch(STREAM_LLM_PATH, side_effect=mock_stream):
+        sentences = [s async for s in client.process_query_stream("Hi HAL")]
+
+    assert sentences == ["Hello, Dave.", "How are you?", "I am fine"]
+    assert client.conversations.get().messages[-1] == {
+        "role": "assistant",
+        "content": "Hello, Dave. How are you? I am fine",
+    }
+    await client.cleanup()
+
+
+async def test_generate_llm_response_timeout():
+    """Tests that a generation exceeding its timeout is cancelled instead of blocking forever."""
+    llm = MagicMock()
+
+    async def slow_chat(**kwargs):
+        await asyncio.sleep(10)
+
+    llm.chat = slow_chat
+
+    with pytest.raises(asyncio.TimeoutError):
+        await generate_llm_response(llm, [], timeout=0.01)
+
+
+async def test_sessions_have_separate_histories():
+    """Tests that queries from different sessions don't share conversation history."""
+    client = MCPOllamaClient()
+    replies = iter(
+        [
+            {"role": "assistant", "content": "One"},
+            {"role": "assistant", "content": "Two"},
+        ]
+    )
+
+    async def mock_generate(llm, messages, tools):
+        return next(replies)
+
+    with patch(GENERATE_LLM_PATH, side_effect=mock_generate):
+        await client.process_query("First", session_id="a")
+        await client.process_query("Second", session_id="b")
+
+    assert [m["content"] for m in client.conversations.get("a").messages[1:]] == [
+        "First",
+        "One",
+    ]
+    assert [m["content"] for m in client.conversations.get("b").messages[1:]] == [
+        "Second",
+        "Two",
+    ]
+    await client.cleanup()
+
+
+async def test_conversation_store_lru_eviction():
+    """Tests that the least recently used conversation is evicted above capacity."""
+    store = ConversationStore("system", max_sessions=2)
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+
+    assert "a" in store and "c" in store
+    assert "b" not in store
+
+
+async def test_conversation_store_idle_ttl():
+    """Tests that idle conversations are evicted."""
+    store = ConversationStore("system", idle_ttl=0.01)
+    store.get("a")
+    await asyncio.sleep(0.02)
+    store.get("b")
+
+    assert "a" not in store
+    assert len(store) == 1
+
+
+async def test_conversation_store_spill(tmp_path):
+    """Tests that evicted conversations are spilled to disk and reloaded on their next use."""
+    store = ConversationStore("system", max_sessions=1, spill_dir=str(tmp_path))
+    store.get("a").messages.append({"role": "user", "content": "Remember me"})
+    store.get("b")
+
+    assert "a" not in store
+    assert store.get("a").messages[-1] == {"role": "user", "content": "Remember me"}
+
+
+async def test_conversation_store_keeps_held_conversations(tmp_path):
+    """Tests that a conversation is not evicted while a turn holds or waits for it, and
+    that evicted conversations are spilled in the background."""
+    store = ConversationStore("system", max_sessions=1, spill_dir=str(tmp_path))
+    first_turn = store.hold("a")
+    conversation = await first_turn.__aenter__()
+    conversation.messages.append({"role": "user", "content": "Remember me"})
+
+    async def second_turn():
+        async with store.hold("a") as held:
+            return held
+
+    waiting = asyncio.create_task(second_turn())
+    await asyncio.sleep(0)
+    await first_turn.__aexit__(None, None, None)
+    store.get("b")
+    assert "a" in store
+    assert await waiting is conversation
+
+    store.get("c")
+    await store.drain()
+    assert "a" not in store and len(list(tmp_path.iterdir())) == 2
+    assert store.get("a").messages[-1] == {"role": "user", "content": "Remember me"}
+
+
+def make_conversation(turns: int, tool_result: str = "") -> list:
+    messages = [{"role": "system", "content": "system prompt"}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " * 20})
+        if tool_result:
+            messages.append({"role": "tool", "content": tool_result})
+        messages.append({"role": "assistant", "content": f"answer {i} " * 20})
+    return messages
+
+
+async def test_context_window_under_budget_untouched():
+    """Tests that a conversation within the budget is left unchanged, keeping the prefix cacheable."""
+    summarizer = AsyncMock()
+    window = ContextWindow(summarizer, token_budget=10_000)
+    messages = make_conversation(5)
+    original = [dict(m) for m in messages]
+
+    await window.fit(messages)
+
+    assert messages == original
+    summarizer.assert_not_awaited()
+
+
+async def test_context_window_truncates_old_tool_results():
+    """Tests that old tool results are truncated before any turns are summarized."""
+    summarizer = AsyncMock()
+    window = ContextWindow(
+        summarizer, token_budget=1200, target_ratio=0.9, keep_turns=1
+    )
+    messages = make_conversation(3, tool_result="x" * 2000)
+
+    await window.fit(messages)
+
+    tool_messages = [m for m in messages if m["role"] == "tool"]
+    assert [len(m["content"]) for m in tool_messages] == [303, 303, 2000]
+    summarizer.assert_not_awaited()
+
+
+async def test_context_window_folds_old_turns_into_summary():
+    """Tests that old turns are folded into a summary right after the system prompt."""
+    summarizer = AsyncMock(return_value="Dave asked many questions.")
+    window = ContextWindow(summarizer, token_budget=600, keep_turns=2)
+    messages = make_conversation(8)
+
+    await window.fit(messages)
+
+    assert messages[0] == {"role": "system", "content": "system prompt"}
+    assert messages[1] == {
+        "role": "system",
+        "content": SUMMARY_PREFIX + "Dave asked many questions.",
+    }
+    assert messages[-1]["content"].startswith("answer 7")
+    assert window.estimate_tokens(messages) <= window.target_tokens
+    previous, folded = summarizer.await_args.args
+    assert previous == ""
+    assert folded[0]["content"].startswith("question 0")
+
+
+async def test_compaction_does_not_delay_answer():
+    """Tests that the answer is returned before old turns are summarized, and that the
+    summary is folded into the history in the background."""
+    client = MCPOllamaClient(context_token_budget=600)
+    client.conversations.get("s").messages.extend(make_conversation(8)[1:])
+    summary_started, release_summary = asyncio.Event(), asyncio.Event()
+
+    async def slow_summarizer(previous, turns):
+        summary_started.set()
+        await release_summary.wait()
+        return "Dave asked many questions."
+
+    client.context.summarizer = slow_summarizer
+    reply = {"role": "assistant", "content": "Affirmative, Dave."}
+    with patch(GENERATE_LLM_PATH, return_value=reply):
+        answer = await asyncio.wait_for(client.process_query("Hello", "s"), 1)
+
+    assert answer == "Affirmative, Dave."
+    await asyncio.wait_for(summary_started.wait(), 1)
+    release_summary.set()
+    await client.cleanup()
+    assert client.conversations.get("s").messages[1]["content"] == (
+        SUMMARY_PREFIX + "Dave asked many questions."
+    )
+
+
+def make_tool(name: str) -> MagicMock:
+    tool = MagicMock(description=f"{name} tool", inputSchema={"type": "object"})
+    tool.name = name
+    return tool
+
+
+@pytest.fixture
+def connected_client(mocked_mcp_env):
+    """Provides a client connected to a mocked MCP server that exposes one tool."""
+    mocked_mcp_env.__aenter__.return_value = mocked_mcp_env
+    mocked_mcp_env.list_tools.return_value = MagicMock(tools=[make_tool("get_time")])
+    with patch(STDIO_CLIENT_PATH) as mock_stdio:
+        mock_stdio.return_value.__aenter__.return_value = (MagicMock(), MagicMock())
+        yield MCPOllamaClient(using_tools=True), mocked_mcp_env
+
+
+async def test_tool_registry_cached(connected_client):
+    """Tests that tools are listed once at connect time and then served from the registry."""
+    client, session = connected_client
+    await client.connect_to_mcp_servers(["server.py"])
+
+    first = await client.get_mcp_tools()
+    second = await client.get_mcp_tools()
+
+    assert first == second
+    assert [t["function"]["name"] for t in first] == ["get_time"]
+    session.list_tools.assert_awaited_once()
+    await client.cleanup()
+
+
+async def test_tool_registry_invalidated_on_list_changed(connected_client):
+    """Tests that a tools/list_changed notification refreshes the server's tools."""
+    client, session = connected_client
+    with patch(CLIENT_SESSION_PATH) as mock_session_cls:
+        mock_session_cls.return_value.__aenter__.return_value = session
+        await client.connect_to_mcp_servers(["server.py"])
+        handler = mock_session_cls.call_args.kwargs["message_handler"]
+
+    session.list_tools.return_value = MagicMock(tools=[make_tool("get_weather")])
+    await handler(
+        types.ServerNotification(
+            types.ToolListChangedNotification(method="notifications/tools/list_changed")
+        )
+    )
+    tools = await client.get_mcp_tools()
+
+    assert [t["function"]["name"] for t in tools] == ["get_weather"]
+    assert list(client.tool_to_session) == ["get_weather"]
+    assert session.list_tools.await_count == 2
+    await client.cleanup()
+
+
+async def test_servers_start_concurrently(connected_client):
+    """Tests that servers are launched with the current interpreter and initialized in parallel."""
+    client, session = connected_client
+
+    async def slow_initialize():
+        await asyncio.sleep(0.2)
+
+    session.initialize.side_effect = slow_initialize
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    with patch(STDIO_CLIENT_PATH) as mock_stdio:
+        mock_stdio.return_value.__aenter__.return_value = (MagicMock(), MagicMock())
+        await client.connect_to_mcp_servers(["a.py", "b.py", "c.py"])
+
+    assert loop.time() - started < 0.35
+    assert list(client.sessions) == ["a.py", "b.py", "c.py"]
+    params = [call.args[0] for call in mock_stdio.call_args_list]
+    assert {(p.command, p.args[0]) for p in params} == {
+        (sys.executable, "a.py"),
+        (sys.executable, "b.py"),
+        (sys.executable, "c.py"),
+    }
+    await client.cleanup()
+
+
+async def test_lazy_server_started_on_first_tool_call(connected_client, tmp_path):
+    """Tests that a server with a cached tool manifest is only started when its tool is called."""
+    _, session = connected_client
+    session.call_tool.return_value = MagicMock(
+        content=[MagicMock(text="Noon")], isError=False
+    )
+    script = tmp_path / "server.py"
+    script.write_text("")
+
+    warm_client = MCPOllamaClient(using_tools=True, tool_manifest_dir=tmp_path / "m")
+    await warm_client.connect_to_mcp_servers([str(script)])
+    await warm_client.cleanup()
+
+    client = MCPOllamaClient(
+        using_tools=True, lazy_servers=True, tool_manifest_dir=tmp_path / "m"
+    )
+    with patch(STDIO_CLIENT_PATH) as mock_stdio:
+        mock_stdio.return_value.__aenter__.return_value = (MagicMock(), MagicMock())
+        await client.connect_to_mcp_servers([str(script)])
+        tools = await client.get_mcp_tools()
+        mock_stdio.assert_not_called()
+
+        result = await client._call_tool(make_tool_call("get_time"))
+        await client._call_tool(make_tool_call("get_time"))
+
+    assert [t["function"]["name"] for t in tools] == ["get_time"]
+    assert result == "Noon"
+    mock_stdio.assert_called_once()
+    await client.cleanup()
+
+
+def make_tool_call(name: str, arguments: dict | None = None) -> dict:
+    return {"function": {"name": name, "arguments": arguments or {}}}
+
+
+def make_slow_session(delay: float, text: str) -> MagicMock:
+    async def call_tool(name, arguments=None):
+        await asyncio.sleep(delay)
+        return MagicMock(content=[MagicMock(text=text)])
+
+    return MagicMock(call_tool=call_tool)
+
+
+async def test_tool_calls_run_concurrently():
+    """Tests that the tool calls of one LLM turn run concurrently and keep their order."""
+    client = MCPOllamaClient()
+    client.tool_to_session = {
+        "get_weather": make_slow_session(0.2, "Sunny"),
+        "get_time": make_slow_session(0.2, "Noon"),
+    }
+    messages = []
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await client._call_tools(
+        messages, [make_tool_call("get_weather"), make_tool_call("get_time")]
+    )
+
+    assert loop.time() - started < 0.35
+    assert [m["content"] for m in messages] == ["Sunny", "Noon"]
+    await client.cleanup()
+
+
+async def test_tool_call_timeout_reported_to_llm():
+    """Tests that a slow or unknown tool becomes an error result instead of failing the query."""
+    client = MCPOllamaClient(tool_timeout=0.05)
+    client.tool_to_session = {
+        "get_weather": make_slow_session(1.0, "Sunny"),
+        "get_time": make_slow_session(0, "Noon"),
+    }
+    messages = []
+
+    await client._call_tools(
+        messages,
+        [
+            make_tool_call("get_weather"),
+            make_tool_call("get_time"),
+            make_tool_call("get_stock_price"),
+        ],
+    )
+
+    assert "did not respond in time" in messages[0]["content"]
+    assert messages[1]["content"] == "Noon"
+    assert "unknown tool" in messages[2]["content"]
+    await client.cleanup()
+
+
+async def test_process_query_tool_rounds_are_bounded():
+    """Tests that the LLM can chain tool rounds but must answer without tools after the limit."""
+    client = MCPOllamaClient(max_tool_rounds=2)
+    client.tool_to_session = {"get_time": make_slow_session(0, "Noon")}
+    responses = [
+        {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [make_tool_call("get_time")],
+        },
+        {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [make_tool_call("get_time")],
+        },
+        {"role": "assistant", "content": "It is noon, Dave."},
+    ]
+
+    with patch(GENERATE_LLM_PATH, AsyncMock(side_effect=responses)) as mock_generate:
+        response = await client.process_query("What time is it?")
+
+    assert response == "It is noon, Dave."
+    assert mock_generate.await_count == 3
+    assert mock_generate.await_args_list[-1].args[2] is None
+    messages = client.conversations.get().messages
+    assert [m["role"] for m in messages[1:]] == [
+        "user",
+        "assistant",
+        "tool",
+        "assistant",
+        "tool",
+        "assistant",
+    ]
+    await client.cleanup()
+
+
+async def test_tool_cache_ttl_and_canonical_keys():
+    """Tests that equivalent tool calls share an entry until the tool's TTL expires."""
+    cache = ToolResultCache(ttls={"weather_current": 60, "get_current_time": 0})
+    cache.put("weather_current", {"q": "Tokyo", "aqi": "no"}, "Sunny")
+    cache.put("get_current_time", {}, "Noon")
+
+    assert cache.get("weather_current", {"aqi": "no", "q": " tokyo "}) == "Sunny"
+    assert cache.get("weather_current", {"q": "Paris"}) is None
+    assert cache.get("get_current_time", {}) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    with patch("src.LLM.tool_cache.time.monotonic", return_value=1e12):
+        assert cache.get("weather_current", {"q": "Tokyo", "aqi": "no"}) is None
+    assert len(cache) == 0
+
+
+async def test_tool_cache_size_bound():
+    """Tests that the least recently used result is evicted when the cache is full."""
+    cache = ToolResultCache(ttls={"web_search": 60}, max_entries=2)
+    cache.put("web_search", {"query": "a"}, "A")
+    cache.put("web_search", {"query": "b"}, "B")
+    cache.get("web_search", {"query": "a"})
+    cache.put("web_search", {"query": "c"}, "C")
+
+    assert cache.get("web_search", {"query": "b"}) is None
+    assert cache.get("web_search", {"query": "a"}) == "A"
+    assert cache.stats()["evictions"] == 1
+
+
+async def test_repeated_tool_call_served_from_cache():
+    """Tests that a repeated tool call skips the MCP server, and errors are not cached."""
+    client = MCPOllamaClient()
+    session = MagicMock()
+    session.call_tool = AsyncMock(
+        side_effect=[
+            MagicMock(content=[MagicMock(text="API error")], isError=True),
+            MagicMock(content=[MagicMock(text="Sunny")], isError=False),
+        ]
+    )
+    client.tool_to_session = {"weather_current": session}
+    call = make_tool_call("weather_current", {"q": "Tokyo"})
+
+    assert await client._call_tool(call) == "API error"
+    assert await client._call_tool(call) == "Sunny"
+    assert await client._call_tool(call) == "Sunny"
+    assert session.call_tool.await_count == 2
+    await client.cleanup()
+
+
+TIME_SERVER_PATH = "src/MCP/mcp_time/server.py"
+
+
+async def test_in_process_time_tools():
+    """Tests that in-process tools are registered and called without starting a server."""
+    client = MCPOllamaClient(using_tools=True, in_process_tools=["time"])
+
+    with patch(STDIO_CLIENT_PATH) as mock_stdio:
+        await client.connect_to_mcp_servers([TIME_SERVER_PATH])
+        mock_stdio.assert_not_called()
+
+    tools = await client.get_mcp_tools()
+    assert [t["function"]["name"] for t in tools] == [
+        "get_current_time",
+        "convert_time",
+    ]
+
+    result = await client._call_tool(
+        make_tool_call("get_current_time", {"timezone": "Europe/Paris"})
+    )
+    assert json.loads(result)["timezone"] == "Europe/Paris"
+
+    error = await client._call_tool(
+        make_tool_call("get_current_time", {"timezone": "Mars/Olympus_Mons"})
+    )
+    assert "Invalid timezone" in error
+    await client.cleanup()
+
+
+PID_SERVER = """
+import os
+from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP(name="PidMCP")
+
+
+@mcp.tool()
+def server_pid() -> str:
+    \"\"\"Returns the process ID of the server.\"\"\"
+    return str(os.getpid())
+
+
+if __name__ == "__main__":
+    mcp.run()
+"""
+
+
+async def test_dead_server_is_restarted(tmp_path):
+    """Tests that a server whose process died is restarted by the next call to its tools."""
+    script_path = tmp_path / "mcp_pid" / "server.py"
+    script_path.parent.mkdir()
+    script_path.write_text(PID_SERVER)
+    client = MCPOllamaClient(using_tools=True, tool_timeout=30)
+    await client.connect_to_mcp_servers([str(script_path)])
+
+    first_pid = int(await client._call_tool(make_tool_call("server_pid", {})))
+    os.kill(first_pid, signal.SIGTERM)
+    await asyncio.sleep(0.5)
+    second_pid = int(await client._call_tool(make_tool_call("server_pid", {})))
+
+    assert second_pid != first_pid
+    assert client.sessions[str(script_path)] is not None
+    await client.cleanup()
+
+
+async def test_cancelled_server_start_does_not_hang():
+    """Tests that a server task cancelled before it is ready fails the start."""
+    client = MCPOllamaClient(using_tools=True)
+    script_path = "src/MCP/mcp_slow/server.py"
+    never = asyncio.Event()
+
+    async def hang(*args):
+        await never.wait()
+
+    with patch(STDIO_CLIENT_PATH) as mock_stdio:
+        mock_stdio.return_value.__aenter__.side_effect = hang
+        starting = asyncio.create_task(client._start_server(script_path))
+        await asyncio.sleep(0.01)
+        client._server_tasks[script_path].cancel()
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(starting, 1)
+    await client.cleanup()
+
+
+async def test_fastmcp_tool_provider():
+    """Tests that the tools of a FastMCP server can be listed and called in-process."""
+    server = FastMCP(name="TestMCP")
+
+    @server.tool()
+    async def echo(text: str) -> dict:
+        """Echoes the text back."""
+        return {"text": text}
+
+    provider = FastMCPToolProvider(server)
+    tools = (await provider.list_tools()).tools
+    result = await provider.call_tool("echo", {"text": "Hello, Dave"})
+    missing = await provider.call_tool("unknown", {})
+
+    assert [tool.name for tool in tools] == ["echo"]
+    assert json.loads(result.content[0].text) == {"text": "Hello, Dave"}
+    assert not result.isError
+    assert missing.isError
+
+
+async def test_fastmcp_tool_provider_results_reach_llm():
+    """Tests that in-process FastMCP tools with str and dict return annotations give the
+    LLM the text of their result."""
+    server = FastMCP(name="TestMCP")
+
+    @server.tool()
+    async def greet(name: str) -> str:
+        """Greets someone."""
+        return f"Good afternoon, {name}."
+
+    @server.tool()
+    async def status(name: str) -> dict:
+        """Reports a status."""
+        return {"name": name, "operational": True}
+
+    client = MCPOllamaClient(using_tools=True)
+    provider = FastMCPToolProvider(server)
+    client.sessions["test"] = provider
+    await client._register_tools("test")
+
+    greeting = await client._call_tool(make_tool_call("greet", {"name": "Dave"}))
+    report = await client._call_tool(make_tool_call("status", {"name": "HAL"}))
+
+    assert greeting == "Good afternoon, Dave."
+    assert json.loads(report) == {"name": "HAL", "operational": True}
+
+
+async def test_fastmcp_tool_provider_does_not_block_event_loop():
+    """Tests that an in-process tool doing blocking I/O leaves the event loop free, so
+    the tool timeout can fire."""
+    server = FastMCP(name="TestMCP")
+
+    @server.tool()
+    async def search(query: str) -> str:
+        """Searches slowly."""
+        time.sleep(0.5)
+        return f"Results for {query}"
+
+    provider = FastMCPToolProvider(server)
+    start = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(provider.call_tool("search", {"query": "HAL"}), 0.1)
+    assert time.perf_counter() - start < 0.4
+
+    result = await provider.call_tool("search", {"query": "HAL"})
+    assert result.content[0].text == "Results for HAL"
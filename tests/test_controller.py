@@ -1,3 +1,4 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch
@@ -30,7 +31,26 @@ def test_query_success(test_client):
 
     assert response.status_code == 200
     assert response.json() == {"response": "This is a mock response."}
-    mock_mcp_client.process_query.assert_awaited_once_with("This is a mock query.")
+    mock_mcp_client.process_query.assert_awaited_once_with(
+        "This is a mock query.", session_id="default"
+    )
+
+
+def test_query_with_session_id(test_client):
+    """Tests that the session ID of a query is passed on to the client."""
+    client, mock_mcp_client = test_client
+
+    mock_mcp_client.sessions = True
+    mock_mcp_client.process_query.return_value = "Hello again, Dave."
+
+    response = client.post(
+        "/query", json={"query": "Hello HAL.", "session_id": "terminal-1"}
+    )
+
+    assert response.status_code == 200
+    mock_mcp_client.process_query.assert_awaited_once_with(
+        "Hello HAL.", session_id="terminal-1"
+    )
 
 
 def test_query_server_not_connected(test_client):
@@ -71,3 +91,53 @@ def test_lifespan_startup_and_shutdown(test_client):
     mock_mcp_client.connect_to_mcp_servers.assert_awaited_once()
 
     mock_mcp_client.cleanup.assert_not_called()
+
+
+def test_query_stream_success(test_client):
+    """Tests that /query/stream returns one NDJSON line per sentence."""
+    client, mock_mcp_client = test_client
+
+    async def mock_stream(query, session_id):
+        yield "I am sorry, Dave."
+        yield "I am afraid I can't do that."
+
+    mock_mcp_client.sessions = True
+    mock_mcp_client.process_query_stream = mock_stream
+
+    response = client.post("/query/stream", json={"query": "Open the pod bay doors."})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"sentence": "I am sorry, Dave."},
+        {"sentence": "I am afraid I can't do that."},
+    ]
+
+
+def test_query_stream_processing_error(test_client):
+    """Tests that an error raised mid-stream is reported as a final NDJSON error line."""
+    client, mock_mcp_client = test_client
+
+    async def mock_stream(query, session_id):
+        yield "First sentence."
+        raise Exception("Ollama went away")
+
+    mock_mcp_client.sessions = True
+    mock_mcp_client.process_query_stream = mock_stream
+
+    response = client.post("/query/stream", json={"query": "This will fail."})
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [{"sentence": "First sentence."}, {"error": "Ollama went away"}]
+
+
+def test_stats(test_client):
+    """Tests that the /stats endpoint reports the tool cache counters."""
+    client, mock_mcp_client = test_client
+
+    mock_mcp_client.tool_cache.stats.return_value = {"hits": 3, "misses": 1}
+
+    response = client.get("/stats")
+
+    assert response.status_code == 200
+    assert response.json() == {"tool_cache": {"hits": 3, "misses": 1}}